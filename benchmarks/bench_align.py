@@ -0,0 +1,74 @@
+"""
+Benchmark for aligning the UAV telemetry with the detections (CPU only, no
+network or darknet files needed).
+
+The old merge built a scipy interp1d per column (and, for non-numeric
+columns, a nearest interpolator with a python list of the values).
+TelemetryAligner finds the position of the timestamps once and interpolates
+all the numeric columns as one matrix.
+"""
+
+import time
+import numpy as np
+import pandas as pd
+import scipy.interpolate
+
+from maui63_postprocessing.data.align import TelemetryAligner
+
+# %% Settings
+
+duration = 3 * 3600  # seconds of flight
+telemetry_rate = 10  # samples per second
+num_numeric = 8
+num_detections = [10_000, 100_000, 500_000]
+
+
+def make_telemetry(seed=0):
+    rng = np.random.default_rng(seed)
+    n = duration * telemetry_rate
+    df = pd.DataFrame({'timestamp': np.arange(n) / telemetry_rate})
+    for i in range(num_numeric):
+        df['value_{}'.format(i)] = rng.random(n)
+    df['mode'] = rng.choice(['auto', 'loiter', 'rtl'], n)
+    return df
+
+
+def align_interp1d(df, t):
+    x = df.timestamp
+    out = {}
+    for column in df.columns[1:]:
+        y = df[column]
+        if y.dtype.kind in 'biufc':
+            out[column] = scipy.interpolate.interp1d(x, y)(t)
+        else:
+            f = scipy.interpolate.interp1d(x, range(len(y)), kind='nearest',
+                                           fill_value=(0, len(y)-1),
+                                           bounds_error=False)
+            out[column] = [y[int(i)] for i in f(t)]
+    return pd.DataFrame(out)
+
+
+def align_arrays(df, t):
+    return TelemetryAligner(df).align(t)
+
+
+def timed(f, *args):
+    t0 = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+
+    df = make_telemetry()
+    rng = np.random.default_rng(1)
+
+    print('{:>10} | {:>14} | {:>14}'.format('detections', 'interp1d (s)', 'arrays (s)'))
+    for n in num_detections:
+        t = np.sort(rng.uniform(0, duration - 1, n))
+
+        assert np.allclose(align_interp1d(df, t).iloc[:, :num_numeric],
+                           align_arrays(df, t).iloc[:, :num_numeric])
+
+        print('{:>10} | {:>14.3f} | {:>14.3f}'.format(
+            n, timed(align_interp1d, df, t), timed(align_arrays, df, t)))
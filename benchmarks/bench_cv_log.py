@@ -0,0 +1,84 @@
+"""
+Benchmark for importing the onboard cv log (CPU only, no network needed).
+
+The old importer went through the log a line at a time (strptime and
+key=value splitting in python for every line). read_cv_log tokenizes the
+whole file with the pandas csv parser and parses the dates in one go.
+"""
+
+import os
+import time
+import datetime
+import tempfile
+import numpy as np
+
+from maui63_postprocessing.data.uav_import import read_cv_log, cv_log_line_view
+
+# %% Settings
+
+num_lines = 1_000_000
+old_sizes = [10_000, 50_000]  # the old way takes minutes for the full log
+
+
+def write_log(filename, n, seed=0):
+    # one line a second, up to 3 objects per line
+    rng = np.random.default_rng(seed)
+    start = datetime.datetime(2021, 1, 27, 8)
+
+    with open(filename, 'w') as f:
+        for i in range(n):
+            date = (start + datetime.timedelta(seconds=i)).strftime("%Y.%m.%d %H.%M.%S")
+            num = int(rng.integers(0, 4))
+            objects = ''.join('prob={:.2f},lat={:.6f},lon={:.6f},'.format(
+                rng.random(), -36.8 + rng.random() / 100, 174.7 + rng.random() / 100)
+                for _ in range(num))
+            f.write('{} ,num={},{}\n'.format(date, num, objects))
+
+
+def import_loop(filename):
+    columns = ['datetime_utc', 'num', 'prob', 'lat', 'lon']
+    rows = []
+
+    with open(filename, 'r') as f:
+        for line in f:
+            values = [x for x in line.strip().split(',') if x != '']
+
+            date = datetime.datetime.strptime(values[0].strip(), "%Y.%m.%d %H.%M.%S")
+            out = [date.replace(tzinfo=datetime.timezone.utc).timestamp(),
+                   int(values[1].split('=')[1]), [], [], []]
+
+            for i in range(out[1]):
+                for j in range(3):
+                    para = [x.strip() for x in values[2 + i * 3 + j].split('=')]
+                    assert para[0] == columns[2 + j]
+                    out[2 + j].append(float(para[1]))
+
+            rows.append(out)
+
+    return rows
+
+
+def import_arrays(filename):
+    lines, detections = read_cv_log(filename)
+    return cv_log_line_view(lines, detections)
+
+
+def timed(f, *args):
+    t0 = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        print('{:>10} | {:>14} | {:>14}'.format('lines', 'loop (s)', 'arrays (s)'))
+        for n in old_sizes + [num_lines]:
+            filename = os.path.join(temp_dir, 'log_{}.txt'.format(n))
+            write_log(filename, n)
+
+            old = '{:>14.3f}'.format(timed(import_loop, filename)) \
+                if n in old_sizes else '{:>14}'.format('-')
+
+            print('{:>10} | {} | {:>14.3f}'.format(
+                n, old, timed(import_arrays, filename)))
@@ -0,0 +1,93 @@
+"""
+Micro-benchmark for the YOLO output decoding (CPU only, no network needed).
+
+Compares the previous per-detection python loop with the vectorized
+maui63_postprocessing.cv.decode_outputs on synthetic output tensors the size
+of the yolov4-tiny output layers at the default net_size.
+"""
+
+import timeit
+import numpy as np
+
+from maui63_postprocessing.cv import decode_outputs
+
+# %% Settings
+
+net_size = (1920, 1056)
+strides = [32, 16]          # yolov4-tiny output layers
+anchors_per_cell = 3
+num_classes = 2
+W, H = 1920, 1080
+confidence_thresh = 0.5
+repeats = 10
+
+
+# %% Previous implementation (for reference)
+
+def decode_outputs_loop(layerOutputs, W, H, confidence_thresh):
+    boxes = []
+    confidences = []
+    classIDs = []
+    for output in layerOutputs:
+        for detection in output:
+            scores = detection[5:]
+            classID = np.argmax(scores)
+            confidence = scores[classID]
+            if confidence > confidence_thresh:
+                box = detection[0:4] * np.array([W, H, W, H])
+                (centerX, centerY, width, height) = box.astype("int")
+                x = int(centerX - (width / 2))
+                y = int(centerY - (height / 2))
+                boxes.append([x, y, int(width), int(height)])
+                confidences.append(float(confidence))
+                classIDs.append(classID)
+    
+    return boxes, confidences, classIDs
+
+
+# %% Synthetic outputs
+
+def make_outputs(seed=0):
+    rng = np.random.default_rng(seed)
+    
+    layerOutputs = []
+    for stride in strides:
+        rows = (net_size[0] // stride) * (net_size[1] // stride) * anchors_per_cell
+        output = rng.random((rows, 5 + num_classes), dtype=np.float32)
+        
+        # mostly empty water, a few confident detections
+        output[:, 5:] *= 0.3
+        hits = rng.choice(rows, size=rows // 1000, replace=False)
+        output[hits, 5] = 0.9
+        
+        layerOutputs.append(output)
+        
+    return layerOutputs
+
+
+if __name__ == '__main__':
+    
+    layerOutputs = make_outputs()
+    print('Candidate rows per frame: {}'.format(
+        sum(len(output) for output in layerOutputs)))
+    
+    # make sure both give the same result
+    boxes_ref, confidences_ref, classIDs_ref = decode_outputs_loop(
+        layerOutputs, W, H, confidence_thresh)
+    boxes, confidences, classIDs = decode_outputs(
+        layerOutputs, W, H, confidence_thresh)
+    
+    assert boxes.tolist() == boxes_ref
+    assert classIDs.tolist() == [int(c) for c in classIDs_ref]
+    assert np.allclose(confidences, confidences_ref)
+    
+    t_loop = timeit.timeit(
+        lambda: decode_outputs_loop(layerOutputs, W, H, confidence_thresh),
+        number=repeats) / repeats
+    t_vec = timeit.timeit(
+        lambda: decode_outputs(layerOutputs, W, H, confidence_thresh),
+        number=repeats) / repeats
+    
+    print('Loop decoder:       {:8.3f} ms/frame'.format(t_loop * 1e3))
+    print('Vectorized decoder: {:8.3f} ms/frame'.format(t_vec * 1e3))
+    print('Speedup:            {:8.1f}x'.format(t_loop / t_vec))
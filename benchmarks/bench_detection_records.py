@@ -0,0 +1,73 @@
+"""
+Benchmark for collecting detection rows (CPU only, no network needed).
+
+Row by row DataFrame appends copy the whole table on each append, so the
+cost grows quadratically with the number of detections. The RecordBuilder
+collects into growable column arrays and builds the DataFrame once.
+"""
+
+import time
+import numpy as np
+import pandas as pd
+
+from maui63_postprocessing.utils.records import RecordBuilder
+
+# %% Settings
+
+num_detections = 100_000
+append_sizes = [1_000, 2_000, 4_000, 8_000]  # the old way gets slow quickly
+
+columns = ['timestamp', 'num_objects', 'confidence', 'object_class', 'box']
+
+
+def make_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    
+    rows = []
+    for i in range(n):
+        num = int(rng.integers(1, 4))
+        rows.append({
+            'timestamp': i / 30,
+            'num_objects': num,
+            'confidence': rng.random(num).tolist(),
+            'object_class': [0] * num,
+            'box': rng.integers(0, 1920, size=(num, 4)).tolist(),
+            })
+        
+    return rows
+
+
+def collect_append(rows):
+    # DataFrame.append was removed from pandas 2, concat is the same thing
+    df = pd.DataFrame(columns = columns)
+    for row in rows:
+        df = pd.concat([df, pd.DataFrame([row], columns = columns)],
+                       ignore_index=True)
+    return df
+
+
+def collect_builder(rows):
+    records = RecordBuilder(columns, dtypes = {'timestamp': float,
+                                               'num_objects': int})
+    for row in rows:
+        records.append(row)
+    return records.to_frame()
+
+
+def timed(f, *args):
+    t0 = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    
+    rows = make_rows(num_detections)
+    
+    print('{:>10} | {:>14} | {:>14}'.format('rows', 'append (s)', 'builder (s)'))
+    for n in append_sizes:
+        print('{:>10} | {:>14.3f} | {:>14.4f}'.format(
+            n, timed(collect_append, rows[:n]), timed(collect_builder, rows[:n])))
+        
+    print('{:>10} | {:>14} | {:>14.4f}'.format(
+        num_detections, '-', timed(collect_builder, rows)))
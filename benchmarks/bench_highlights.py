@@ -0,0 +1,61 @@
+"""
+Benchmark for grouping points of interest into highlights (CPU only, no
+network or video needed).
+
+The old grouping went through the times one by one building lists of lists.
+group_points_of_interest finds the gaps with array operations and only loops
+once per clip_length split, over all the long runs at once.
+"""
+
+import time
+import numpy as np
+
+from maui63_postprocessing.videoedit.highlights import group_points_of_interest
+
+# %% Settings
+
+num_points = [10_000, 100_000, 500_000]
+duration = 3 * 3600  # seconds of footage
+fps = 30
+max_spacing = 3
+clip_length = 10
+
+
+def make_times(n, seed=0):
+    # detection timestamps fall on frames (several detections per frame)
+    rng = np.random.default_rng(seed)
+    return np.sort(np.round(rng.uniform(0, duration, n) * fps) / fps)
+
+
+def group_loop(times):
+    time_groups = []
+    for i, t in enumerate(times):
+        if i == 0 or t >= times[i-1] + max_spacing \
+            or (len(time_groups) > 0 and
+                t - time_groups[-1][0] >= clip_length):
+            time_groups.append([t])
+        else:
+            time_groups[-1].append(t)
+    return time_groups
+
+
+def group_arrays(times):
+    return group_points_of_interest(times, max_spacing, clip_length)
+
+
+def timed(f, *args):
+    t0 = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+
+    print('{:>10} | {:>14} | {:>14}'.format('points', 'loop (s)', 'arrays (s)'))
+    for n in num_points:
+        times = make_times(n)
+
+        assert len(group_loop(times)) == group_arrays(times)[-1] + 1
+
+        print('{:>10} | {:>14.3f} | {:>14.4f}'.format(
+            n, timed(group_loop, times), timed(group_arrays, times)))
@@ -0,0 +1,79 @@
+"""
+Benchmark for geographic queries over the merged data (CPU only, no network
+or darknet files needed).
+
+Without an index every query scans the whole DataFrame (a haversine
+distance per row). SpatialIndex is built once, then answers radius queries
+from its KD-tree and bounding boxes from the rows sorted by latitude.
+"""
+
+import time
+import numpy as np
+import pandas as pd
+
+from maui63_postprocessing.data.spatial import SpatialIndex, haversine
+
+# %% Settings
+
+num_rows = 1_000_000  # e.g. many flights concatenated
+num_queries = 200
+radius = 1000  # metres
+box = 0.02     # degrees
+
+
+def make_data(seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'uav_UAV lat': -37.5 + rng.random(num_rows),
+                         'uav_UAV long': 174.2 + rng.random(num_rows),
+                         'uav_unix_time': 1611743465 + np.arange(num_rows) / 10})
+
+
+def radius_scan(df, points):
+    for lat, lon in points:
+        df[haversine(lat, lon, df['uav_UAV lat'], df['uav_UAV long']) <= radius]
+
+
+def bbox_scan(df, points):
+    for lat, lon in points:
+        df[df['uav_UAV lat'].between(lat, lat + box) &
+           df['uav_UAV long'].between(lon, lon + box)]
+
+
+def radius_index(index, points):
+    for lat, lon in points:
+        index.radius(lat, lon, radius)
+
+
+def bbox_index(index, points):
+    for lat, lon in points:
+        index.bbox(lat, lon, lat + box, lon + box)
+
+
+def timed(f, *args):
+    t0 = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+
+    df = make_data()
+    rng = np.random.default_rng(1)
+    points = np.column_stack([-37.5 + rng.random(num_queries),
+                              174.2 + rng.random(num_queries)])
+
+    t0 = time.perf_counter()
+    index = SpatialIndex(df)
+    print('index built in {:.2f} s ({} rows)'.format(time.perf_counter() - t0, num_rows))
+
+    print('{:>10} | {:>14} | {:>14}'.format('query', 'scan (ms)', 'index (ms)'))
+    for name, scan, indexed in [('radius', radius_scan, radius_index),
+                                ('bbox', bbox_scan, bbox_index)]:
+        print('{:>10} | {:>14.2f} | {:>14.3f}'.format(
+            name,
+            1000 * timed(scan, df, points) / num_queries,
+            1000 * timed(indexed, index, points) / num_queries))
+
+    t0 = time.perf_counter()
+    sightings = index.sightings(distance = 200)
+    print('{} sighting clusters in {:.2f} s'.format(len(sightings), time.perf_counter() - t0))
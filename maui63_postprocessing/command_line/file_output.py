@@ -1,4 +1,5 @@
 from maui63_postprocessing.data.post_process import Maui63DataProcessor
+from maui63_postprocessing.data.cache import ResultCache
 import argparse
 
 def main(*args):
@@ -67,6 +68,37 @@ def main(*args):
                         type=float, default=3,
                         help="Highlight padding")
     
+    parser.add_argument('--exactcuts', action='store_true',
+                        help="Re-encode highlights so they start on the exact "
+                             "frame (slower than cutting on keyframes)")
+    
+    parser.add_argument('--singlepass', action='store_true',
+                        help="Write the highlights during inference instead "
+                             "of from a tagged copy of the video")
+    
+    parser.add_argument('--cvlog', type=str, default=None,
+                        help="Onboard cv log, to synchronize the video and "
+                             "telemetry clocks")
+    
+    parser.add_argument('--clockoffset', type=float, default=0,
+                        help="Seconds added to the estimated video start time")
+    
+    parser.add_argument('--cachedir', type=str, default=None,
+                        help="Inference cache directory "
+                             "(defaults to ~/.cache/maui63_postprocessing)")
+    
+    parser.add_argument('--cachesize', type=float, default=10e9,
+                        help="Inference cache size limit (bytes)")
+    
+    parser.add_argument('--nocache', action='store_true',
+                        help="Always rerun inference")
+    
+    args = parser.parse_args(args if args else None)
+    
+    cache = None
+    if not args.nocache:
+        cache = ResultCache(args.cachedir, max_size = args.cachesize)
+    
     pro = Maui63DataProcessor(
         args.logfile,
         args.media, 
@@ -79,7 +111,12 @@ def main(*args):
         highlighter_kwargs = {
                 'clip_length': args.cliplength,
                 'padding': args.padding
-            }
+            },
+        exact_highlights = args.exactcuts,
+        single_pass_highlights = args.singlepass,
+        cv_logs = args.cvlog,
+        clock_offset = args.clockoffset,
+        cache = cache,
         )
     
     pro.process()
@@ -1 +1,4 @@
-from .cv import process_video, process_image
\ No newline at end of file
+from .cv import process_video, iter_video, process_image, decode_outputs, \
+    Detector, get_detector
+from .chunked import process_video_chunked
+from .stream import stream_video, process_stream
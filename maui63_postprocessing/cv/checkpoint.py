@@ -0,0 +1,112 @@
+"""
+Checkpoints for process_video so a long video that gets interrupted can be
+resumed from the last checkpoint instead of from the start.
+
+A checkpoint is a folder with the detections found so far, the last frame
+they cover and the tagged video written so far. The tagged video is split
+in segments (a new one is started at every checkpoint) since a video file
+that was being written when the process died can't be appended to. The
+segments are joined into the output file at the end.
+"""
+
+import os
+import json
+import shutil
+import warnings
+from pathlib import Path
+
+from maui63_postprocessing.data.store import save_table, load_table
+
+
+class VideoCheckpoint:
+
+    def __init__(self, path, params: dict):
+        """
+        params are the arguments the results depend on, a checkpoint saved
+        with different params is discarded.
+        """
+
+        self.path = Path(path)
+
+        # compare as json so tuples and lists match
+        self.params = json.loads(json.dumps(params, default=str))
+
+        self.last_frame = None  # last frame covered by the checkpoint
+        self.num_segments = 0
+
+        try:
+            with open(self.path / 'state.json') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = None
+
+        if state is not None:
+            if state['params'] == self.params:
+                self.last_frame = state['last_frame']
+                self.num_segments = state['num_segments']
+            else:
+                warnings.warn('Checkpoint in {} was saved with different '
+                              'arguments, starting over'.format(self.path))
+                self.clear()
+
+    @property
+    def resume_frame(self):
+        """
+        Frame to start from (None if there's nothing to resume)
+        """
+
+        return None if self.last_frame is None else self.last_frame + 1
+
+    def detections(self):
+        """
+        Detections saved up to the last checkpoint (None if there are none)
+        """
+
+        if self.last_frame is None:
+            return None
+
+        detections = load_table(self.path / 'detections.parquet', 'detections')
+
+        # the detections are saved before the state so they can be ahead
+        return detections[detections.frame <= self.last_frame].reset_index(drop=True)
+
+    def segment_file(self, extension):
+        """
+        File for the next tagged video segment
+        """
+
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        return str(self.path / 'segment_{:05d}{}'.format(self.num_segments, extension))
+
+    def segments(self, extension):
+        return [str(self.path / 'segment_{:05d}{}'.format(i, extension))
+                for i in range(self.num_segments)]
+
+    def save(self, detections, last_frame, new_segment = False):
+        """
+        Save the detections up to (and including) last_frame, new_segment if
+        a tagged video segment was closed.
+        """
+
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        # write then rename, so a crash never leaves a half written file
+        tmp = self.path / 'detections.parquet.tmp'
+        save_table(detections, tmp, 'detections')
+        os.replace(tmp, self.path / 'detections.parquet')
+
+        self.last_frame = int(last_frame)
+        self.num_segments += bool(new_segment)
+
+        tmp = self.path / 'state.json.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'params': self.params,
+                       'last_frame': self.last_frame,
+                       'num_segments': self.num_segments}, f)
+        os.replace(tmp, self.path / 'state.json')
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.last_frame = None
+        self.num_segments = 0
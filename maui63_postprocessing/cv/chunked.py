@@ -0,0 +1,137 @@
+"""
+Split a video into time chunks and process them in parallel, one process
+per chunk, then stitch the detections (and tagged video) back together.
+"""
+
+import os
+import shutil
+import tempfile
+import warnings
+import cv2
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from maui63_postprocessing.cv.cv import process_video
+from maui63_postprocessing.videoedit.ffmpeg import concat_videos
+from maui63_postprocessing.data.detections import empty_detections, frame_view
+
+
+def _process_chunk(video, model_files, output_file, start_frame, end_frame,
+                   kwargs):
+    """
+    Chunk worker, the network is loaded once per worker process (see
+    cv.get_detector)
+    """
+
+    return process_video(video,
+                         *model_files,
+                         output_file = output_file,
+                         start_frame = start_frame,
+                         end_frame = end_frame,
+                         **kwargs)
+
+
+def chunk_frames(framecount, chunks, stride = 1):
+    """
+    Split frames 1 to framecount (the first frame is skipped, same as
+    process_video) into (start_frame, end_frame) ranges.
+
+    Chunk lengths are multiples of the stride so the inferred frames are the
+    same as for a single pass.
+    """
+
+    frames = framecount - 1
+    if frames <= 0:
+        return []
+
+    chunk_length = -(-frames // chunks)            # ceil
+    chunk_length = max(-(-chunk_length // stride) * stride, stride)
+
+    return [(start, min(start + chunk_length, framecount))
+            for start in range(1, framecount, chunk_length)]
+
+
+def process_video_chunked(video: str,
+                          data_file: str,
+                          config_file: str,
+                          weights: str,
+                          names_file: str,
+                          output_file = None,
+                          workers = None,  # defaults to the number of cores
+                          chunks = None,   # defaults to the number of workers
+                          **kwargs,        # process_video arguments
+                          ):
+    """
+    Same as process_video, but the video is split into chunks that are
+    decoded and inferred in their own process, starting at their own offset.
+
+    The timestamps in the returned DataFrame are relative to the start of the
+    video and the tagged chunks are joined in order into output_file.
+    """
+
+    if workers is None:
+        workers = os.cpu_count()
+    if chunks is None:
+        chunks = workers
+
+    vidcap = cv2.VideoCapture(video)
+    framecount = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
+    vidcap.release()
+
+    ranges = chunk_frames(framecount, chunks, kwargs.get('stride', 1))
+
+    if len(ranges) == 0:
+        # empty video (or no frame count), nothing to process
+        warnings.warn('No frames to process in {}'.format(video))
+        df = empty_detections()
+        return frame_view(df) if kwargs.get('table', 'frames') == 'frames' else df
+
+    print('Running YOLO on video in {} chunks ({} workers)'.format(
+        len(ranges), workers))
+
+    model_files = (data_file, config_file, weights, names_file)
+
+    checkpoint = kwargs.get('checkpoint')
+    
+    # with a checkpoint each chunk resumes from its own folder, where its 
+    # tagged video is kept too, so the finished chunks aren't run again
+    if checkpoint is not None:
+        chunk_dirs = [os.path.join(str(checkpoint), 'chunk_{:05d}'.format(i))
+                      for i in range(len(ranges))]
+        chunk_kwargs = [dict(kwargs, checkpoint = chunk_dir, clear_checkpoint = False)
+                        for chunk_dir in chunk_dirs]
+    else:
+        temp_dir = tempfile.mkdtemp()
+        chunk_dirs = [temp_dir] * len(ranges)
+        chunk_kwargs = [kwargs] * len(ranges)
+
+    try:
+        chunk_files = [None] * len(ranges)
+        if output_file is not None:
+            extension = os.path.splitext(output_file)[1]
+            chunk_files = [os.path.join(chunk_dir, 'chunk_{:05d}{}'.format(i, extension))
+                           for i, chunk_dir in enumerate(chunk_dirs)]
+
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            futures = [executor.submit(_process_chunk, video, model_files,
+                                       chunk_file, start, end, chunk_kwarg)
+                       for chunk_file, (start, end), chunk_kwarg
+                       in zip(chunk_files, ranges, chunk_kwargs)]
+
+            # in chunk order, so the timestamps stay sorted
+            dfs = [future.result() for future in futures]
+
+        if output_file is not None:
+            concat_videos(chunk_files, output_file)
+
+    finally:
+        if checkpoint is None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if checkpoint is not None:
+        # every chunk finished and they're joined
+        shutil.rmtree(str(checkpoint), ignore_errors=True)
+
+    df = pd.concat(dfs, ignore_index=True)
+
+    return df
@@ -4,17 +4,39 @@ import time
 import numpy as np
 import pandas as pd
 import re
+import os
 import warnings
+import shutil
+import threading
+from functools import lru_cache
 
-#TODO: Make this module into a class?
-def set_backend(net):
+from maui63_postprocessing.cv.pipeline import (FrameReader, FrameWriter,
+                                               SegmentedWriter, StageTimer,
+                                               timing_report)
+from maui63_postprocessing.cv.propagation import DetectionPropagator
+from maui63_postprocessing.cv.checkpoint import VideoCheckpoint
+from maui63_postprocessing.videoedit.ffmpeg import concat_videos
+from maui63_postprocessing.data.detections import (detection_records,
+                                                   add_frame_detections,
+                                                   frame_detections,
+                                                   frame_view)
+
+@lru_cache(maxsize=None)
+def _cuda_available():
+    """
+    Check the opencv build information for CUDA/cuDNN (only parsed once)
+    """
     
     cv_info = [re.sub('\s+', ' ', ci.strip()) for ci in cv2.getBuildInformation().strip().split('\n') 
                if len(ci) > 0 and re.search(r'(nvidia*:?)|(cuda*:)|(cudnn*:)', ci.lower()) is not None]
     cv_info = {x.split(':')[0]:x.split(':')[1].strip() for x in cv_info}
     
-    if 'NVIDIA CUDA' in cv_info.keys() and 'cuDNN' in cv_info.keys() and \
-            "YES" in cv_info['NVIDIA CUDA'] and "YES" in cv_info['cuDNN']:
+    return 'NVIDIA CUDA' in cv_info.keys() and 'cuDNN' in cv_info.keys() and \
+        "YES" in cv_info['NVIDIA CUDA'] and "YES" in cv_info['cuDNN']
+
+def set_backend(net):
+    
+    if _cuda_available():
         net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
         net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
     else:
@@ -26,8 +48,8 @@ def add_bbox(frame, idxs, boxes, confidences, classIDs, COLORS, LABELS):
         # loop over the indexes we are keeping
         for i in idxs.flatten():
             # extract the bounding box coordinates
-            (x, y) = (boxes[i][0], boxes[i][1])
-            (w, h) = (boxes[i][2], boxes[i][3])
+            (x, y) = (int(boxes[i][0]), int(boxes[i][1]))
+            (w, h) = (int(boxes[i][2]), int(boxes[i][3]))
             # draw a bounding box rectangle and label on the frame
             color = [int(c) for c in COLORS[classIDs[i]]]
             cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
@@ -38,6 +60,93 @@ def add_bbox(frame, idxs, boxes, confidences, classIDs, COLORS, LABELS):
             
     return frame
 
+class Detector:
+    """
+    Owns the loaded darknet network along with its labels, colors and output
+    layer names so they can be reused across files and jobs.
+    
+    Use get_detector to share a single instance per set of model files.
+    """
+    
+    def __init__(self, config_file: str, weights: str, names_file: str):
+        
+        self.config_file = str(config_file)
+        self.weights = str(weights)
+        self.names_file = str(names_file)
+        
+        self.net = cv2.dnn.readNetFromDarknet(self.config_file, self.weights)
+        
+        set_backend(self.net)
+        
+        with open(self.names_file) as f:
+            self.LABELS = f.read().strip().split("\n")
+        # seeded so the colors match between processes
+        self.COLORS = np.random.RandomState(42).randint(0, 255, size=(len(self.LABELS), 3))
+        
+        self.output_layers = list(self.net.getUnconnectedOutLayersNames())
+        
+        # The net can't run two forward passes at once
+        self.lock = threading.Lock()
+        
+        
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+def model_identity(files):
+    """
+    (absolute path, mtime, size) of each model file, to tell when the model
+    changed (None for the mtime/size of missing files)
+    """
+    
+    identity = []
+    for file in files:
+        path = os.path.abspath(str(file))
+        try:
+            stat = os.stat(path)
+            identity.append((path, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            identity.append((path, None, None))
+    
+    return tuple(identity)
+
+def get_detector(config_file: str, weights: str, names_file: str):
+    """
+    Get the Detector for these model files, the network is only loaded the
+    first time (or if one of the files changed since).
+    """
+    
+    files = [os.path.abspath(str(f)) for f in (config_file, weights, names_file)]
+    key = model_identity(files)
+    
+    with _detectors_lock:
+        if key not in _detectors:
+            _detectors[key] = Detector(*files)
+        
+        return _detectors[key]
+        
+        
+def _open_video(video, start_frame = None, end_frame = None):
+    """
+    Open a video at start_frame, returns (vidcap, fps, start_frame, end_frame)
+    """
+    
+    vidcap = cv2.VideoCapture(video)
+    
+    fps = vidcap.get(cv2.CAP_PROP_FPS)
+    
+    if start_frame == None:
+        # the first frame is skipped (timestamps start at 1/fps)
+        success,image = vidcap.read()
+        start_frame = 1
+    else:
+        vidcap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    
+    if end_frame == None:
+        end_frame = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
+    
+    return vidcap, fps, start_frame, end_frame
+        
+        
 def process_video(video: str, 
                   data_file: str, 
                   config_file: str, 
@@ -47,93 +156,433 @@ def process_video(video: str,
                   thresh = 0.3,
                   output_file = None,
                   net_size = (1920, 1056),  # for maui63 network
+                  batch_size = 1,           # frames per forward pass
+                  read_queue_size = 8,      # decoded frames waiting for inference
+                  write_queue_size = 8,     # tagged frames waiting to be encoded
+                  encoder = 'opencv',       # 'opencv' or 'ffmpeg' (pipe frames to an ffmpeg process)
+                  quality = None,           # output quality 0-100 (codec picked from the extension)
+                  stride = 1,               # only run the net on every Nth frame
+                  propagation = 'carry',    # 'carry' or 'track' detections to skipped frames
+                  cascade_size = None,      # low-res triage net size (e.g. (640, 352))
+                  cascade_thresh = 0.25,    # triage confidence to trigger a full-res pass
+                  cascade_window = 0,       # keep confirming this many frames after a trigger
+                  detector = None,          # loaded Detector (defaults to get_detector)
+                  start_frame = None,       # first frame to process (seeks to it)
+                  end_frame = None,         # stop before this frame
+                  table = 'frames',         # 'frames' (one row per frame) or 'detections'
+                  checkpoint = None,        # checkpoint folder (resumes from it if it exists)
+                  checkpoint_every = 1000,  # frames between checkpoints
+                  clear_checkpoint = True,  # remove the checkpoint once the video is done
                   ):
     
-    vidcap = cv2.VideoCapture(video)
+    assert checkpoint_every >= 1, "checkpoint_every must be at least 1"
+    assert table in ['frames', 'detections'], \
+        "Invalid table, valid options are: ['frames', 'detections']"
     
-    fps = vidcap.get(cv2.CAP_PROP_FPS)
-    success,image = vidcap.read()
+    # Pick up where an interrupted run left off
+    ckpt = None
+    if checkpoint is not None:
+        ckpt = VideoCheckpoint(checkpoint, {
+            'video': os.path.abspath(str(video)),
+            'video_size': os.path.getsize(video),
+            'model': model_identity([data_file, config_file, weights, names_file]),
+            'start_frame': start_frame,
+            'end_frame': end_frame,
+            'confidence_thresh': confidence_thresh,
+            'thresh': thresh,
+            'net_size': net_size,
+            'stride': stride,
+            'propagation': propagation,
+            'cascade_size': cascade_size,
+            'cascade_thresh': cascade_thresh,
+            'cascade_window': cascade_window,
+            'tagged': output_file is not None,
+            'encoder': encoder,
+            })
+        
+        if ckpt.resume_frame is not None:
+            print('Resuming from checkpoint at frame {}'.format(ckpt.resume_frame))
+            start_frame = ckpt.resume_frame
+    
+    vidcap, fps, start_frame, end_frame = _open_video(video, start_frame, end_frame)
     
-    framecount = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))-1
+    framecount = end_frame - start_frame
     
     print('Running YOLO on video:')
     time.sleep(0.5)
     
-    net = cv2.dnn.readNetFromDarknet(config_file, weights)
+    if detector is None:
+        detector = get_detector(config_file, weights, names_file)
+    
+    records = detection_records()
     
-    set_backend(net)
+    if ckpt is not None and ckpt.resume_frame is not None:
+        previous = ckpt.detections()
+        records.extend({column: previous[column].to_numpy()
+                        for column in previous.columns})
     
-    LABELS = open(names_file).read().strip().split("\n")
-    COLORS = np.random.randint(0, 255, size=(len(LABELS), 3))
+    reader = FrameReader(vidcap, framecount, fps, start_count = start_frame - 1,
+                         queue_size = read_queue_size)
     
+    # with checkpoints the tagged video is written in segments
     writer = None
-    (W, H) = (None, None)
-        
-    layer_names = net.getLayerNames()
-    output_layers = [layer_names[i[0]-1] for i in net.getUnconnectedOutLayers()]
+    if output_file is not None:
+        extension = os.path.splitext(str(output_file))[1]
+        files = None if ckpt is None else (lambda: ckpt.segment_file(extension))
+        writer = _open_writer(output_file, fps, detector,
+                              files = files,
+                              queue_size = write_queue_size,
+                              encoder = encoder, quality = quality)
     
-    df = pd.DataFrame(columns = ['timestamp', 'num_objects',
-                                 'confidence', 'object_class', 'box'])
+    results = _iter_results(reader, start_frame, framecount, detector,
+                            net_size, confidence_thresh, thresh,
+                            writer = writer,
+                            batch_size = batch_size,
+                            stride = stride,
+                            propagation = propagation,
+                            cascade_size = cascade_size,
+                            cascade_thresh = cascade_thresh,
+                            cascade_window = cascade_window)
     
-    count = 0
-    for framenum in tqdm(range(framecount)):
+    try:
+        last_checkpoint = start_frame
+        for framenum, frametime, frame, result, inferred in results:
+            
+            # If an object is detected append the data
+            add_frame_detections(records, framenum, frametime, *result, inferred)
+            
+            # Only checkpoint when the next frame is inferred, so the resumed
+            # run doesn't need the skipped frames' detections
+            if ckpt is not None and framenum % stride == 0 \
+                    and framenum + 1 - last_checkpoint >= checkpoint_every:
+                # close the current segment so it's complete on disk
+                if writer is not None:
+                    writer.split()
+                
+                ckpt.save(records.to_frame(), framenum,
+                          new_segment = writer is not None)
+                last_checkpoint = framenum + 1
+    
+    finally:
+        # stops the reader and writer threads if something went wrong
+        results.close()
+    
+    if ckpt is not None:
+        ckpt.save(records.to_frame(), end_frame - 1,
+                  new_segment = writer is not None)
         
-        # Redundant here
-        #vidcap.set(cv2.CAP_PROP_POS_FRAMES, framenum)
+        if output_file is not None:
+            # segments without frames (nothing left to process) aren't created
+            segments = [f for f in ckpt.segments(extension) if os.path.exists(f)]
+            if len(segments) == 1:
+                shutil.copyfile(segments[0], output_file)
+            elif len(segments) > 1:
+                concat_videos(segments, output_file)
         
-        success, frame = vidcap.read()
+        # finished, nothing to resume anymore (kept, it resumes at the end, 
+        # if the caller removes it, e.g. when the chunks are joined)
+        if clear_checkpoint:
+            ckpt.clear()
+    
+    df = records.to_frame()
+    
+    if table == 'frames':
+        df = frame_view(df)
         
-        if not success:
-            raise ValueError('Frame number is not valid')
+    return df
+
+
+def detect_frames(frames,
+                  detector,
+                  net_size,
+                  confidence_thresh,
+                  thresh,
+                  batch_size = 1,           # frames per forward pass
+                  stride = 1,               # only run the net on every Nth frame
+                  propagation = 'carry',    # 'carry' or 'track' detections to skipped frames
+                  cascade = None,           # CascadeScanner (low-res triage pass)
+                  timer = None,             # StageTimer for the inference time
+                  ):
+    """
+    Run the network over (framenum, frametime, frame) tuples as they come.
+    
+    Yields (framenum, frametime, frame, (idxs, boxes, confidences, classIDs),
+    inferred) for every frame, in order. Frames are only held back until
+    their batch is full.
+    
+    Frames are inferred if (framenum - 1) % stride == 0, so chunks starting
+    at different frames line up.
+    """
+    
+    # Frames in between inferred frames get their detections from here
+    propagator = None
+    if stride > 1:
+        propagator = DetectionPropagator(stride, mode = propagation)
+    
+    if timer is None:
+        timer = StageTimer('inference')
+    
+    (W, H) = (None, None)
+    
+    def flush(batch):
+        """
+        Run the net on the buffered frames and pass them on in order
+        """
+        
+        inputs = [frame for _, _, frame, inferred in batch if inferred]
         
-        count+=1
-        frametime = count/fps
+        with timer.busy(), detector.lock:
+            if len(inputs) == 0:
+                results = iter([])
+            elif cascade is not None:
+                results = iter(cascade.run(inputs, W, H))
+            else:
+                results = iter(run_net_on_batch(
+                    inputs,
+                    detector.net,
+                    net_size,
+                    detector.output_layers,
+                    confidence_thresh,
+                    thresh,
+                    W, H))
         
-        # %% Net
+        for framenum, frametime, frame, inferred in batch:
+            
+            if inferred:
+                result = next(results)
+                if propagator is not None:
+                    propagator.update(*result)
+            else:
+                result = propagator.propagate()
+            
+            yield framenum, frametime, frame, result, inferred
     
+    batch = []  # (framenum, frametime, frame, inferred) waiting for inference
+    num_inferred = 0
+    for framenum, frametime, frame in frames:
+        
         if W == None and H == None:
             (H, W) = frame.shape[:2]
         
-        frame, idxs, boxes, confidences, classIDs = run_net_on_frame(
-            frame,
-            net,
-            net_size,
-            output_layers,
-            confidence_thresh,
-            thresh,
-            W, H,
-            COLORS,
-            LABELS)
-        
-        frame = add_bbox(frame, idxs, boxes, confidences,
-                         classIDs, COLORS, LABELS)        
-        
-        # check if the video writer is None
-        if writer is None and output_file != None:
-            # initialize our video writer
-            # TODO: choose filetype based on output_file extension
-            fourcc = cv2.VideoWriter_fourcc(*"MJPG")
+        inferred = (framenum - 1) % stride == 0
+        
+        # Flushed just before the next inferred frame, so the batches never
+        # split a stride
+        if inferred and num_inferred == batch_size:
+            yield from flush(batch)
+            batch = []
+            num_inferred = 0
+        
+        num_inferred += inferred
+        batch.append((framenum, frametime, frame, inferred))
+    
+    if len(batch) > 0:
+        yield from flush(batch)
+
+
+def iter_video(video: str, 
+               data_file: str, 
+               config_file: str, 
+               weights: str, 
+               names_file: str,
+               confidence_thresh = 0.5, 
+               thresh = 0.3,
+               output_file = None,
+               net_size = (1920, 1056),  # for maui63 network
+               batch_size = 1,           # frames per forward pass
+               read_queue_size = 8,      # decoded frames waiting for inference
+               write_queue_size = 8,     # tagged frames waiting to be encoded
+               encoder = 'opencv',       # 'opencv' or 'ffmpeg' (pipe frames to an ffmpeg process)
+               quality = None,           # output quality 0-100 (codec picked from the extension)
+               stride = 1,               # only run the net on every Nth frame
+               propagation = 'carry',    # 'carry' or 'track' detections to skipped frames
+               cascade_size = None,      # low-res triage net size (e.g. (640, 352))
+               cascade_thresh = 0.25,    # triage confidence to trigger a full-res pass
+               cascade_window = 0,       # keep confirming this many frames after a trigger
+               detector = None,          # loaded Detector (defaults to get_detector)
+               start_frame = None,       # first frame to process (seeks to it)
+               end_frame = None,         # stop before this frame
+               annotate = False,         # also yield the frames with the boxes drawn
+               ):
+    """
+    Generator version of process_video, nothing is kept in memory.
+    
+    Yields (framenum, timestamp, detections) for every frame as soon as it's
+    processed, detections being the frame's rows of the detections table
+    (with annotate, (framenum, timestamp, detections, frame)).
+    """
+    
+    vidcap, fps, start_frame, end_frame = _open_video(video, start_frame, end_frame)
+    
+    if detector is None:
+        detector = get_detector(config_file, weights, names_file)
+    
+    reader = FrameReader(vidcap, end_frame - start_frame, fps,
+                         start_count = start_frame - 1,
+                         queue_size = read_queue_size)
+    
+    print('Running YOLO on video:')
+    
+    yield from _iter_detections(reader, start_frame, end_frame - start_frame,
+                                detector, net_size, confidence_thresh, thresh,
+                                output_file = output_file,
+                                annotate = annotate,
+                                write_queue_size = write_queue_size,
+                                encoder = encoder,
+                                quality = quality,
+                                batch_size = batch_size,
+                                stride = stride,
+                                propagation = propagation,
+                                cascade_size = cascade_size,
+                                cascade_thresh = cascade_thresh,
+                                cascade_window = cascade_window)
+
+
+def _draw_function(detector):
+    def draw(frame, idxs, boxes, confidences, classIDs):
+        return add_bbox(frame, idxs, boxes, confidences, classIDs,
+                        detector.COLORS, detector.LABELS)
+    return draw
+
+
+def _open_writer(output_file, fps, detector, files = None, annotate = False,
+                 queue_size = 8, encoder = 'opencv', quality = None):
+    """
+    Writer for the tagged video, a SegmentedWriter if files() gives the
+    segment files (annotated frames already have their boxes)
+    """
+    
+    kwargs = dict(draw = None if annotate else _draw_function(detector),
+                  queue_size = queue_size, encoder = encoder, quality = quality)
+    
+    if files is not None:
+        return SegmentedWriter(files, fps, **kwargs)
+    
+    return FrameWriter(output_file, fps, **kwargs)
+
+
+def _iter_results(reader,
+                  start_frame,
+                  framecount,   # None if unknown (streams)
+                  detector,
+                  net_size,
+                  confidence_thresh,
+                  thresh,
+                  writer = None,     # FrameWriter/SegmentedWriter for the tagged video
+                  annotate = False,  # draw the boxes on the yielded frames
+                  batch_size = 1,
+                  stride = 1,
+                  propagation = 'carry',
+                  cascade_size = None,
+                  cascade_thresh = 0.25,
+                  cascade_window = 0,
+                  ):
+    """
+    The detection loop shared by process_video, iter_video and stream_video:
+    runs a FrameReader/StreamReader through the network and the writer.
+    
+    Yields (framenum, frametime, frame, (idxs, boxes, confidences, classIDs),
+    inferred) for every frame. The reader and writer threads are stopped
+    when the generator is closed.
+    """
+    
+    assert batch_size >= 1, "batch_size must be at least 1"
+    assert stride >= 1, "stride must be at least 1"
+    
+    draw = _draw_function(detector)
+    
+    # Cheap low resolution pass first, full resolution only where needed
+    cascade = None
+    if cascade_size is not None:
+        cascade = CascadeScanner(detector.net, detector.output_layers,
+                                 net_size, cascade_size,
+                                 confidence_thresh, thresh,
+                                 cascade_thresh = cascade_thresh,
+                                 window = cascade_window)
+    
+    infer_timer = StageTimer('inference')
+    timers = [reader.timer, infer_timer] + ([writer.timer] if writer else [])
+    
+    # Decoding and encoding run in their own threads, inference runs here
+    reader.start()
+    if writer is not None:
+        writer.start()
+    infer_timer.start()
+    
+    try:
+        frames = tqdm(((framenum, frametime, frame) for framenum, (frametime, frame)
+                       in enumerate(reader, start_frame)),
+                      total=framecount)
+        
+        for framenum, frametime, frame, results, inferred in detect_frames(
+                frames, detector, net_size, confidence_thresh, thresh,
+                batch_size = batch_size,
+                stride = stride,
+                propagation = propagation,
+                cascade = cascade,
+                timer = infer_timer):
             
-            writer = cv2.VideoWriter(output_file, fourcc, fps,
-                (frame.shape[1], frame.shape[0]), True)
+            if annotate:
+                frame = draw(frame, *results)
+            
+            # write the output frame to disk
+            if writer is not None:
+                writer.write(frame, *results)
+            
+            yield framenum, frametime, frame, results, inferred
+        
+        infer_timer.stop()
+        
+        if writer is not None:
+            writer.close()
+    
+    finally:
+        # also runs if the consumer stops early
+        reader.stop()
+        if writer is not None:
+            writer.stop()
     
-        # write the output frame to disk
-        if output_file != None:
-            writer.write(frame)
+    print(timing_report(timers))
+    if cascade is not None:
+        print(cascade.report())
+
+
+def _iter_detections(reader,
+                     start_frame,
+                     framecount,   # None if unknown (streams)
+                     detector,
+                     net_size,
+                     confidence_thresh,
+                     thresh,
+                     output_file = None,
+                     annotate = False,
+                     write_queue_size = 8,
+                     encoder = 'opencv',
+                     quality = None,
+                     **kwargs,     # _iter_results arguments
+                     ):
+    """
+    Yields the per-frame detections tables for iter_video and stream_video
+    """
+    
+    writer = None
+    if output_file is not None:
+        writer = _open_writer(output_file, reader.fps, detector,
+                              annotate = annotate,
+                              queue_size = write_queue_size,
+                              encoder = encoder, quality = quality)
+    
+    for framenum, frametime, frame, results, inferred in _iter_results(
+            reader, start_frame, framecount, detector, net_size,
+            confidence_thresh, thresh,
+            writer = writer, annotate = annotate, **kwargs):
         
-        # If an object is detected append the data
-        if len(idxs) > 0:
-            frame_info = {
-                'timestamp': frametime,
-                'num_objects': len(idxs),
-                'confidence': confidences,
-                'object_class': classIDs,
-                'box': boxes,
-                }
-            series = pd.Series(frame_info)
-            df = df.append(series, ignore_index=True)
+        detections = frame_detections(framenum, frametime, *results, inferred)
         
-    return df
+        if annotate:
+            yield framenum, frametime, detections, frame
+        else:
+            yield framenum, frametime, detections
 
 
 def process_image(image: str, 
@@ -145,48 +594,233 @@ def process_image(image: str,
                   thresh = 0.3,
                   output_file = None,
                   net_size = (1920, 1056),  # for maui63 network
+                  cascade_size = None,      # low-res triage net size (e.g. (640, 352))
+                  cascade_thresh = 0.25,    # triage confidence to trigger a full-res pass
+                  detector = None,          # loaded Detector (defaults to get_detector)
+                  table = 'boxes',          # 'boxes' (one row per box) or 'detections'
                   ):
     
-    frame = cv2.imread(image) 
+    assert table in ['boxes', 'detections'], \
+        "Invalid table, valid options are: ['boxes', 'detections']"
     
-    net = cv2.dnn.readNetFromDarknet(config_file, weights)
+    frame = cv2.imread(image) 
     
-    set_backend(net)
+    if detector is None:
+        detector = get_detector(config_file, weights, names_file)
     
-    LABELS = open(names_file).read().strip().split("\n")
-    COLORS = np.random.randint(0, 255, size=(len(LABELS), 3))
-        
-    layer_names = net.getLayerNames()
-    output_layers = [layer_names[i[0]-1] for i in net.getUnconnectedOutLayers()]
+    net = detector.net
+    LABELS = detector.LABELS
+    COLORS = detector.COLORS
+    output_layers = detector.output_layers
     
     (H, W) = frame.shape[:2]
+    
+    with detector.lock:
+        if cascade_size is not None:
+            cascade = CascadeScanner(net, output_layers, net_size, cascade_size,
+                                     confidence_thresh, thresh,
+                                     cascade_thresh = cascade_thresh)
+            
+            (idxs, boxes, confidences, classIDs), = cascade.run([frame], W, H)
+            
+            print(cascade.report())
         
-    frame, idxs, boxes, confidences, classIDs = run_net_on_frame(
-        frame,
-        net,
-        net_size,
-        output_layers,
-        confidence_thresh,
-        thresh,
-        W, H,
-        COLORS,
-        LABELS)
+        else:
+            frame, idxs, boxes, confidences, classIDs = run_net_on_frame(
+                frame,
+                net,
+                net_size,
+                output_layers,
+                confidence_thresh,
+                thresh,
+                W, H,
+                COLORS,
+                LABELS)
     
     frame = add_bbox(frame, idxs, boxes, confidences, classIDs, COLORS, LABELS)
     
     if output_file != None:
         cv2.imwrite(output_file, frame)
         
+    if table == 'detections':
+        records = detection_records()
+        add_frame_detections(records, 0, 0., idxs, boxes, confidences, classIDs)
+        
+        return records.to_frame()
+        
     df = pd.DataFrame({
                 'num_objects': len(idxs),
-                'prob': confidences,
-                'name': classIDs,
-                'box': boxes,
+                'prob': confidences.tolist(),
+                'name': classIDs.tolist(),
+                'box': boxes.tolist(),
                 })
     
     return df
     
     
+def decode_outputs(layerOutputs, W, H, confidence_thresh):
+    """
+    Decode the YOLO output layers into boxes, confidences and class IDs.
+    
+    All the layer outputs are stacked and processed as whole arrays instead
+    of looping over each detection. The outputs can be passed directly to
+    cv2.dnn.NMSBoxes.
+    
+    Returns:
+        boxes:        (N, 4) int32 array of [x, y, width, height]
+        confidences:  (N,) float32 array
+        classIDs:     (N,) int64 array
+    """
+    
+    # each row is [centerX, centerY, width, height, objectness, scores...]
+    detections = np.vstack([np.reshape(output, (-1, output.shape[-1]))
+                            for output in layerOutputs])
+    
+    # extract the class ID and confidence (i.e., probability)
+    scores = detections[:, 5:]
+    classIDs = np.argmax(scores, axis=1)
+    confidences = scores[np.arange(len(scores)), classIDs]
+    
+    # filter out weak predictions
+    mask = confidences > confidence_thresh
+    detections = detections[mask]
+    classIDs = classIDs[mask]
+    confidences = confidences[mask].astype(np.float32)
+    
+    # scale the bounding box coordinates back relative to the size of the
+    # image (YOLO returns the center (x, y)-coordinates of the bounding box
+    # followed by the boxes' width and height)
+    box = (detections[:, 0:4] * np.array([W, H, W, H])).astype(int)
+    
+    # use the center (x, y)-coordinates to derive the top left corner
+    corners = (box[:, 0:2] - box[:, 2:4] / 2).astype(int)
+    
+    boxes = np.hstack([corners, box[:, 2:4]]).astype(np.int32)
+    
+    return boxes, confidences, classIDs
+    
+    
+def run_net_on_batch(frames,
+                     net,
+                     net_size,
+                     output_layers,
+                     confidence_thresh,
+                     thresh,
+                     W, H):
+    """
+    Run the network on a list of frames (of the same size) in a single
+    forward pass.
+    
+    Returns a list with one (idxs, boxes, confidences, classIDs) tuple per
+    frame, in the same order as the frames.
+    """
+    
+    blob = cv2.dnn.blobFromImages(frames, 1/255, net_size, swapRB=True, crop=False)
+    net.setInput(blob)
+    layerOutputs = net.forward(output_layers)
+    
+    # Depending on the opencv version the batch is either its own axis or
+    # the rows of each frame are stacked, this handles both
+    layerOutputs = [np.reshape(output, (len(frames), -1, output.shape[-1]))
+                    for output in layerOutputs]
+    
+    results = []
+    for i in range(len(frames)):
+        boxes, confidences, classIDs = decode_outputs(
+            [output[i] for output in layerOutputs], W, H, confidence_thresh)
+                    
+        idxs = cv2.dnn.NMSBoxes(boxes, confidences, confidence_thresh, thresh)
+        
+        results.append((idxs, boxes, confidences, classIDs))
+    
+    return results
+    
+    
+class CascadeScanner:
+    """
+    Two stage scan: a cheap low resolution pass runs on every frame and the
+    full resolution net only runs on the frames where the cheap pass finds
+    something above the (looser) cascade threshold.
+    
+    Frames that are rejected by the cheap pass get no detections. With a
+    window > 0 the full resolution pass keeps running on the frames that
+    follow a trigger, so objects that fade in and out aren't missed.
+    """
+    
+    def __init__(self,
+                 net,
+                 output_layers,
+                 net_size,
+                 cascade_size,
+                 confidence_thresh,
+                 thresh,
+                 cascade_thresh = 0.25,
+                 window = 0,
+                 ):
+        
+        assert cascade_thresh <= confidence_thresh, \
+            "cascade_thresh should be looser than confidence_thresh"
+        
+        self.net = net
+        self.output_layers = output_layers
+        self.net_size = net_size
+        self.cascade_size = cascade_size
+        self.confidence_thresh = confidence_thresh
+        self.thresh = thresh
+        self.cascade_thresh = cascade_thresh
+        self.window = window
+        
+        self._hold = 0  # frames left in the current window
+        
+        self.num_scanned = 0
+        self.num_confirmed = 0
+        
+    def run(self, frames, W, H):
+        """
+        Same inputs and outputs as run_net_on_batch
+        """
+        
+        triage = run_net_on_batch(frames,
+                                  self.net,
+                                  self.cascade_size,
+                                  self.output_layers,
+                                  self.cascade_thresh,
+                                  self.thresh,
+                                  W, H)
+        
+        triggered = []
+        for (idxs, _, _, _) in triage:
+            if len(idxs) > 0:
+                self._hold = self.window + 1
+            triggered.append(self._hold > 0)
+            self._hold = max(self._hold - 1, 0)
+            
+        to_confirm = [frame for frame, trig in zip(frames, triggered) if trig]
+        
+        self.num_scanned += len(frames)
+        self.num_confirmed += len(to_confirm)
+        
+        confirmed = iter(run_net_on_batch(to_confirm,
+                                          self.net,
+                                          self.net_size,
+                                          self.output_layers,
+                                          self.confidence_thresh,
+                                          self.thresh,
+                                          W, H) if len(to_confirm) > 0 else [])
+        
+        empty = ((),
+                 np.zeros((0, 4), dtype=np.int32),
+                 np.zeros(0, dtype=np.float32),
+                 np.zeros(0, dtype=int))
+        
+        return [next(confirmed) if trig else empty for trig in triggered]
+    
+    def report(self):
+        return 'Cascade: {} frames scanned at {}, {} confirmed at {}'.format(
+            self.num_scanned, self.cascade_size,
+            self.num_confirmed, self.net_size)
+    
+    
 def run_net_on_frame(frame,
                      net,
                      net_size,
@@ -197,53 +831,16 @@ def run_net_on_frame(frame,
                      COLORS,
                      LABELS):
     
-    blob = cv2.dnn.blobFromImage(frame, 1/255, net_size, swapRB=True, crop=False)
-    net.setInput(blob)
-    layerOutputs = net.forward(output_layers)
-    
-    # initialize our lists of detected bounding boxes, confidences,
-    # and class IDs, respectively
-    boxes = []
-    confidences = []
-    classIDs = []
-    # loop over each of the layer outputs
-    for output in layerOutputs:
-        # loop over each of the detections
-        for detection in output:
-            # extract the class ID and confidence (i.e., probability)
-            # of the current object detection
-            scores = detection[5:]
-            classID = np.argmax(scores)
-            confidence = scores[classID]
-            # filter out weak predictions by ensuring the detected
-            # probability is greater than the minimum probability
-            if confidence > confidence_thresh:
-                # scale the bounding box coordinates back relative to
-                # the size of the image, keeping in mind that YOLO
-                # actually returns the center (x, y)-coordinates of
-                # the bounding box followed by the boxes' width and
-                # height
-                box = detection[0:4] * np.array([W, H, W, H])
-                (centerX, centerY, width, height) = box.astype("int")
-                # use the center (x, y)-coordinates to derive the top
-                # and and left corner of the bounding box
-                x = int(centerX - (width / 2))
-                y = int(centerY - (height / 2))
-                # update our list of bounding box coordinates,
-                # confidences, and class IDs
-                boxes.append([x, y, int(width), int(height)])
-                confidences.append(float(confidence))
-                classIDs.append(classID)
-                
-    idxs = cv2.dnn.NMSBoxes(boxes, confidences, confidence_thresh, thresh)
+    (idxs, boxes, confidences, classIDs), = run_net_on_batch(
+        [frame], net, net_size, output_layers, confidence_thresh, thresh, W, H)
     
     # ensure at least one detection exists
     if len(idxs) > 0:
         # loop over the indexes we are keeping
         for i in idxs.flatten():
             # extract the bounding box coordinates
-            (x, y) = (boxes[i][0], boxes[i][1])
-            (w, h) = (boxes[i][2], boxes[i][3])
+            (x, y) = (int(boxes[i][0]), int(boxes[i][1]))
+            (w, h) = (int(boxes[i][2]), int(boxes[i][3]))
             # draw a bounding box rectangle and label on the frame
             color = [int(c) for c in COLORS[classIDs[i]]]
             cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
@@ -0,0 +1,408 @@
+"""
+Threaded stages for the video processing pipeline.
+
+The reader and writer run in their own threads and are joined to the
+inference stage (the calling thread) by bounded queues so decoding, inference
+and encoding overlap. Opencv releases the GIL for all three so this scales
+with the slowest stage instead of the sum of them.
+"""
+
+import os
+import threading
+import queue
+import time
+import warnings
+import cv2
+from contextlib import contextmanager
+
+from maui63_postprocessing.videoedit.ffmpeg import FFmpegWriter
+
+_STOP = None  # end of stream marker
+
+# opencv fourcc for each output file extension (MJPG otherwise)
+OPENCV_CODECS = {
+    '.avi': 'MJPG',
+    '.mp4': 'mp4v',
+    '.m4v': 'mp4v',
+    '.mov': 'mp4v',
+    '.mkv': 'mp4v',
+    }
+
+
+class StageTimer:
+    """
+    Keeps track of the time a pipeline stage spends working (busy) vs
+    waiting on the other stages (blocked).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.busy_time = 0.
+        self._start = None
+        self._end = None
+
+    def start(self):
+        # only the first start counts (the timer can be shared by several
+        # threads one after the other)
+        if self._start is None:
+            self._start = time.perf_counter()
+
+    def stop(self):
+        self._end = time.perf_counter()
+
+    @contextmanager
+    def busy(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.busy_time += time.perf_counter() - t0
+
+    @property
+    def total_time(self):
+        if self._start is None:
+            return 0.
+        end = self._end if self._end is not None else time.perf_counter()
+        return end - self._start
+
+    @property
+    def blocked_time(self):
+        return max(self.total_time - self.busy_time, 0.)
+
+
+def timing_report(timers):
+    """
+    Format the busy/blocked times of the pipeline stages.
+    """
+
+    lines = ['Stage timings:']
+    for timer in timers:
+        lines.append('  {:<10} busy {:8.2f}s | blocked {:8.2f}s'.format(
+            timer.name, timer.busy_time, timer.blocked_time))
+
+    return '\n'.join(lines)
+
+
+class _StageThread(threading.Thread):
+
+    def __init__(self, name, queue_size):
+        super().__init__(daemon=True)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.timer = StageTimer(name)
+        self.error = None
+        self._stopped = threading.Event()
+
+    def _put(self, item):
+        # don't hang forever if the other end has given up
+        while not self._stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def stop(self):
+        self._stopped.set()
+
+
+class FrameReader(_StageThread):
+    """
+    Reads frames from an opened cv2.VideoCapture in a background thread.
+
+    Iterating over the reader yields (frametime, frame) tuples in order.
+    """
+
+    def __init__(self, vidcap, framecount, fps, start_count = 0,
+                 queue_size = 8):
+        super().__init__('read', queue_size)
+        self.vidcap = vidcap
+        self.framecount = framecount
+        self.fps = fps
+        self.count = start_count
+
+    def run(self):
+        self.timer.start()
+        try:
+            for framenum in range(self.framecount):
+                if self._stopped.is_set():
+                    break
+
+                with self.timer.busy():
+                    success, frame = self.vidcap.read()
+
+                if not success:
+                    raise ValueError('Frame number is not valid')
+
+                self.count += 1
+                self._put((self.count/self.fps, frame))
+
+        except Exception as e:
+            self.error = e
+        finally:
+            self._put(_STOP)
+            self.timer.stop()
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            yield item
+
+        if self.error is not None:
+            raise self.error
+
+
+class FrameWriter(_StageThread):
+    """
+    Writes frames to a video file in a background thread, optionally drawing
+    on them first with draw(frame, *args).
+
+    The codec is picked from the file extension. With encoder='ffmpeg' the
+    frames are piped to an ffmpeg process instead of encoded by opencv (much
+    smaller files, e.g. H.264 for .mp4, and the encoding runs on other
+    cores).
+
+    Frames are written in the order they are put in.
+    """
+
+    encoders = ['opencv', 'ffmpeg']
+
+    def __init__(self, output_file, fps, draw = None, queue_size = 8,
+                 encoder = 'opencv', quality = None):
+        super().__init__('write', queue_size)
+
+        assert encoder in self.encoders, \
+            "Invalid encoder, valid options are: {}".format(self.encoders)
+
+        self.output_file = output_file
+        self.fps = fps
+        self.draw = draw
+        self.encoder = encoder
+        self.quality = quality  # 0-100, None for the encoder's default
+        self.writer = None
+
+    def write(self, frame, *args):
+        if self.error is not None:
+            raise self.error
+        self._put((frame, args))
+
+    def run(self):
+        self.timer.start()
+        while True:
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                # given up on (see stop), the file is still released below
+                if self._stopped.is_set():
+                    break
+                continue
+
+            if item is _STOP:
+                break
+
+            # keep draining the queue on errors so the producer doesn't hang
+            if self.error is not None:
+                continue
+
+            try:
+                with self.timer.busy():
+                    self._write_frame(*item)
+            except Exception as e:
+                self.error = e
+
+        # the ffmpeg writer only reports encoding errors once it's finished
+        try:
+            if self.writer is not None:
+                self.writer.release()
+        except Exception as e:
+            self.error = self.error or e
+        self.timer.stop()
+
+    def _write_frame(self, frame, args):
+        if self.draw is not None:
+            frame = self.draw(frame, *args)
+
+        # initialize our video writer on the first frame
+        if self.writer is None:
+            self.writer = self._open((frame.shape[1], frame.shape[0]))
+
+        self.writer.write(frame)
+
+    def _open(self, size):
+        if self.encoder == 'ffmpeg':
+            return FFmpegWriter(self.output_file, self.fps, size,
+                                quality = self.quality)
+
+        extension = os.path.splitext(str(self.output_file))[1].lower()
+        codec = OPENCV_CODECS.get(extension, 'MJPG')
+        fourcc = cv2.VideoWriter_fourcc(*codec)
+
+        if codec == 'MJPG' and self.quality is not None:
+            # only opencv's own MJPG writer can set the quality
+            writer = cv2.VideoWriter(str(self.output_file),
+                                     cv2.CAP_OPENCV_MJPEG, fourcc, self.fps,
+                                     size, True)
+        else:
+            writer = cv2.VideoWriter(str(self.output_file), fourcc, self.fps,
+                                     size, True)
+
+        if self.quality is not None and \
+                not writer.set(cv2.VIDEOWRITER_PROP_QUALITY, self.quality):
+            warnings.warn("opencv can't set the quality for {}, use "
+                          "encoder='ffmpeg'".format(self.output_file))
+
+        return writer
+
+    def close(self):
+        """
+        Wait for the queued frames to be written and release the file.
+        """
+        self._put(_STOP)
+        self.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def stop(self):
+        """
+        Stop early (e.g. on errors or if the consumer stops), the frames
+        already queued are written and the file is released before this
+        returns, so no encoder is left running.
+        """
+        super().stop()
+        if self.is_alive():
+            self.join()
+
+
+class SegmentedWriter:
+    """
+    FrameWriter split into several files: split() closes the current file
+    (complete on disk) and the next frames go to a new one, named by
+    files() when its first frame comes in. Used for the checkpoint segments.
+    """
+
+    def __init__(self, files, fps, **kwargs):  # FrameWriter arguments
+        self.files = files
+        self.fps = fps
+        self.kwargs = kwargs
+        self.timer = StageTimer('write')  # one timer across segments
+        self.writer = None
+
+    def start(self):
+        # the first segment is opened with its first frame
+        pass
+
+    def write(self, frame, *args):
+        if self.writer is None:
+            self.writer = FrameWriter(self.files(), self.fps, **self.kwargs)
+            self.writer.timer = self.timer
+            self.writer.start()
+
+        self.writer.write(frame, *args)
+
+    def split(self):
+        self.close()
+
+    def close(self):
+        writer, self.writer = self.writer, None
+        if writer is not None:
+            writer.close()
+
+    def stop(self):
+        if self.writer is not None:
+            self.writer.stop()
+
+
+class StreamReader(_StageThread):
+    """
+    Reads frames from a video that is still being written, or from a stream
+    (e.g. rtsp://...), in a background thread until it ends.
+
+    There's no frame count up front, the stream is over once no new frame
+    has arrived for idle_timeout seconds. Files are read with ffmpeg's
+    follow option (it keeps reading as the file grows), other sources are
+    reconnected if they drop.
+
+    The first frame is skipped, same as process_video, so the frame numbers
+    and timestamps match processing the finished file.
+
+    Iterating over the reader yields (frametime, frame) tuples in order.
+    """
+
+    def __init__(self, source, fps = None, poll_interval = 0.5,
+                 idle_timeout = 10., queue_size = 8):
+        super().__init__('read', queue_size)
+        self.source = str(source)
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.is_file = os.path.isfile(self.source)
+        self.count = -1  # index of the last frame read
+
+        # a file that was just created can't be opened until its header is
+        # written
+        self.vidcap = self._open()
+        waited = 0.
+        while not self.vidcap.isOpened() and waited < idle_timeout:
+            time.sleep(poll_interval)
+            waited += poll_interval
+            self.vidcap = self._open()
+
+        # some streams don't report their frame rate
+        source_fps = self.vidcap.get(cv2.CAP_PROP_FPS)
+        self.fps = source_fps if source_fps and source_fps > 0 else fps
+        assert self.fps, "Couldn't get the frame rate of {}, please " \
+            "specify fps".format(source)
+
+    def _open(self):
+        if not self.is_file:
+            return cv2.VideoCapture(self.source)
+
+        # opencv passes these options on to ffmpeg when opening the file
+        options = 'follow;1|rw_timeout;{}|probesize;32768|analyzeduration;0'.format(int(self.idle_timeout * 1e6))
+        previous = os.environ.get('OPENCV_FFMPEG_CAPTURE_OPTIONS')
+        os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = options
+        try:
+            return cv2.VideoCapture('file:' + os.path.abspath(self.source),
+                                    cv2.CAP_FFMPEG)
+        finally:
+            if previous is None:
+                del os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS']
+            else:
+                os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = previous
+
+    def run(self):
+        self.timer.start()
+        try:
+            last_read = time.perf_counter()
+            while not self._stopped.is_set():
+                with self.timer.busy():
+                    success, frame = self.vidcap.read()
+
+                if not success:
+                    # files wait for new frames while reading
+                    if self.is_file or \
+                            time.perf_counter() - last_read >= self.idle_timeout:
+                        break  # end of stream
+
+                    # the stream dropped, reconnect
+                    time.sleep(self.poll_interval)
+                    self.vidcap.release()
+                    self.vidcap = self._open()
+                    continue
+
+                last_read = time.perf_counter()
+                self.count += 1
+
+                if self.count > 0:
+                    self._put((self.count/self.fps, frame))
+
+        except Exception as e:
+            self.error = e
+        finally:
+            self.vidcap.release()
+            self._put(_STOP)
+            self.timer.stop()
+
+    # consumed the same way as a FrameReader
+    __iter__ = FrameReader.__iter__
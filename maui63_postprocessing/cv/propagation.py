@@ -0,0 +1,92 @@
+"""
+Carry detections forward to the frames that are skipped when running the
+network on every Nth frame only (see process_video's stride option).
+"""
+
+import numpy as np
+
+from maui63_postprocessing.cv.centroidtracker import CentroidTracker
+
+
+class DetectionPropagator:
+    """
+    Keeps the detections of the last inferred frame and hands them out for
+    the frames in between.
+
+    Modes:
+        'carry': the skipped frames inherit the last detections as is
+        'track': the objects are matched between inferred frames with a
+                 CentroidTracker and the boxes are moved along with the
+                 tracked centroids' velocity
+    """
+
+    modes = ['carry', 'track']
+
+    def __init__(self, stride: int, mode: str = 'carry'):
+
+        assert mode in self.modes, \
+            "Invalid propagation mode, valid options are: {}".format(self.modes)
+
+        self.stride = stride
+        self.mode = mode
+
+        if mode == 'track':
+            # drop objects that are missed for a few inferred frames
+            self.tracker = CentroidTracker(maxDisappeared=2)
+
+        self.boxes = np.zeros((0, 4), dtype=np.int32)
+        self.confidences = np.zeros(0, dtype=np.float32)
+        self.classIDs = np.zeros(0, dtype=int)
+        self.velocities = np.zeros((0, 2))  # pixels per inferred frame
+        self.steps = 0  # frames since the last inferred frame
+
+    def update(self, idxs, boxes, confidences, classIDs):
+        """
+        Store the (NMS filtered) detections of an inferred frame
+        """
+
+        idxs = np.array(idxs, dtype=int).flatten()
+
+        self.boxes = np.asarray(boxes)[idxs].reshape(-1, 4)
+        self.confidences = np.asarray(confidences)[idxs]
+        self.classIDs = np.asarray(classIDs)[idxs]
+        self.velocities = np.zeros((len(idxs), 2))
+        self.steps = 0
+
+        if self.mode == 'track':
+            self._track()
+
+    def _track(self):
+        previous = dict(self.tracker.objects)
+
+        # the tracker expects (startX, startY, endX, endY)
+        rects = np.hstack([self.boxes[:, 0:2],
+                           self.boxes[:, 0:2] + self.boxes[:, 2:4]])
+        objects = self.tracker.update(rects)
+
+        centroids = (self.boxes[:, 0:2] + self.boxes[:, 2:4] / 2).astype(int)
+        for i, centroid in enumerate(centroids):
+            for objectID, object_centroid in objects.items():
+                if objectID in previous and np.array_equal(object_centroid, centroid):
+                    self.velocities[i] = centroid - previous[objectID]
+                    break
+
+    def propagate(self):
+        """
+        Get the detections for the next skipped frame.
+
+        Returns (idxs, boxes, confidences, classIDs) in the same format as
+        run_net_on_batch, with every box kept.
+        """
+
+        self.steps += 1
+
+        boxes = self.boxes
+        if self.mode == 'track' and len(boxes) > 0:
+            shift = self.velocities * self.steps / self.stride
+            boxes = boxes.copy()
+            boxes[:, 0:2] += shift.astype(boxes.dtype)
+
+        idxs = np.arange(len(boxes))
+
+        return idxs, boxes, self.confidences, self.classIDs
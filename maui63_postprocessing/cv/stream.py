@@ -0,0 +1,113 @@
+"""
+Streaming mode: process a video that is still being written (or a live
+stream) as the frames arrive, and hand out the detections and highlights
+as soon as they're known instead of once the video is finished.
+"""
+
+from maui63_postprocessing.cv.cv import get_detector, _iter_detections
+from maui63_postprocessing.cv.pipeline import StreamReader
+from maui63_postprocessing.data.detections import detection_records
+from maui63_postprocessing.videoedit.highlights import HighlightGrouper
+
+
+def stream_video(source,
+                 data_file: str,
+                 config_file: str,
+                 weights: str,
+                 names_file: str,
+                 confidence_thresh = 0.5,
+                 thresh = 0.3,
+                 output_file = None,
+                 net_size = (1920, 1056),  # for maui63 network
+                 batch_size = 1,           # frames per forward pass
+                 read_queue_size = 8,      # decoded frames waiting for inference
+                 write_queue_size = 8,     # tagged frames waiting to be encoded
+                 encoder = 'opencv',       # 'opencv' or 'ffmpeg' (pipe frames to an ffmpeg process)
+                 quality = None,           # output quality 0-100 (codec picked from the extension)
+                 stride = 1,               # only run the net on every Nth frame
+                 propagation = 'carry',    # 'carry' or 'track' detections to skipped frames
+                 cascade_size = None,      # low-res triage net size (e.g. (640, 352))
+                 cascade_thresh = 0.25,    # triage confidence to trigger a full-res pass
+                 cascade_window = 0,       # keep confirming this many frames after a trigger
+                 detector = None,          # loaded Detector (defaults to get_detector)
+                 fps = None,               # for streams that don't report it
+                 poll_interval = 0.5,      # seconds between checks for new frames
+                 idle_timeout = 10.,       # end of stream after this long without frames
+                 annotate = False,         # also yield the frames with the boxes drawn
+                 ):
+    """
+    Generator version of process_video for growing files and streams (a
+    file path or anything cv2.VideoCapture opens, e.g. rtsp://...).
+
+    Yields (framenum, timestamp, detections) for every frame as soon as it's
+    processed, detections being the frame's rows of the detections table
+    (with annotate, (framenum, timestamp, detections, frame)).
+    """
+
+    if detector is None:
+        detector = get_detector(config_file, weights, names_file)
+
+    reader = StreamReader(source, fps = fps, poll_interval = poll_interval,
+                          idle_timeout = idle_timeout,
+                          queue_size = read_queue_size)
+
+    print('Running YOLO on stream: {}'.format(source))
+
+    # same detection loop as process_video/iter_video, fed by the stream
+    yield from _iter_detections(reader, 1, None, detector, net_size,
+                                confidence_thresh, thresh,
+                                output_file = output_file,
+                                annotate = annotate,
+                                write_queue_size = write_queue_size,
+                                encoder = encoder,
+                                quality = quality,
+                                batch_size = batch_size,
+                                stride = stride,
+                                propagation = propagation,
+                                cascade_size = cascade_size,
+                                cascade_thresh = cascade_thresh,
+                                cascade_window = cascade_window)
+
+
+def process_stream(source,
+                   data_file: str,
+                   config_file: str,
+                   weights: str,
+                   names_file: str,
+                   callback = None,            # callback(detections) for frames with detections
+                   on_highlight = None,        # on_highlight(start, end, group) once a highlight is complete
+                   highlighter_kwargs = None,  # HighlightGrouper arguments
+                   **kwargs,                   # stream_video arguments
+                   ):
+    """
+    Run stream_video to the end of the stream, calling callback with the
+    detections as they're found and on_highlight as soon as a highlight's
+    points of interest are known.
+
+    Returns the whole detections table.
+    """
+
+    grouper = HighlightGrouper(**(highlighter_kwargs or {}))
+
+    records = detection_records()
+
+    for framenum, timestamp, detections in stream_video(
+            source, data_file, config_file, weights, names_file, **kwargs):
+
+        detected = len(detections) > 0
+
+        if detected:
+            records.extend({column: detections[column].to_numpy()
+                            for column in detections.columns})
+            if callback is not None:
+                callback(detections)
+
+        for highlight in grouper.update(timestamp, detected):
+            if on_highlight is not None:
+                on_highlight(*highlight)
+
+    for highlight in grouper.finish():
+        if on_highlight is not None:
+            on_highlight(*highlight)
+
+    return records.to_frame()
@@ -0,0 +1,90 @@
+"""
+Align the UAV telemetry with the detection timestamps.
+
+The telemetry is sorted once and the position of every timestamp in it
+(the sample before and the weight of the one after) is found once with
+searchsorted, then reused for all the columns: numeric columns are linearly
+interpolated as one matrix, the others take the nearest sample.
+"""
+
+import warnings
+import numpy as np
+import pandas as pd
+
+
+class TelemetryAligner:
+
+    def __init__(self,
+                 df: pd.DataFrame,       # telemetry
+                 time_column: str = 'timestamp',
+                 ):
+
+        times = df[time_column].to_numpy(np.float64)
+        order = np.argsort(times, kind = 'stable')
+
+        self.times = times[order]
+        self.columns = [column for column in df.columns if column != time_column]
+
+        df = df.iloc[order]
+        self.numeric = [column for column in self.columns
+                        if df[column].dtype.kind in 'biuf']
+        self.other = [column for column in self.columns
+                      if column not in self.numeric]
+
+        # numeric columns side by side, interpolated together
+        self.values = df[self.numeric].to_numpy(np.float64) \
+            if len(self.numeric) > 0 else np.zeros((len(df), 0))
+        self.other_values = {column: df[column].to_numpy() for column in self.other}
+
+    def positions(self, timestamps):
+        """
+        Index of the telemetry sample before each timestamp, the weight of
+        the one after it (0-1) and whether the timestamp is within the
+        telemetry.
+        """
+
+        t = np.asarray(timestamps, dtype = np.float64)
+        x = self.times
+        n = len(x)
+
+        assert n > 0, "No telemetry to align with"
+
+        valid = (t >= x[0]) & (t <= x[-1])
+
+        if n == 1:
+            return np.zeros(len(t), dtype = np.int64), np.zeros(len(t)), valid
+
+        lo = np.clip(x.searchsorted(t, 'right') - 1, 0, n - 2)
+        dx = x[lo + 1] - x[lo]
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            weight = np.where(dx > 0, (t - x[lo]) / dx, 0)
+
+        return lo, np.clip(weight, 0, 1), valid
+
+    def align(self, timestamps):
+        """
+        Telemetry at each timestamp, numeric columns are NaN outside of it
+        (the other columns take the first/last sample).
+        """
+
+        lo, weight, valid = self.positions(timestamps)
+        hi = np.minimum(lo + 1, len(self.times) - 1)
+
+        if not valid.all():
+            warnings.warn('{} timestamps are outside of the telemetry'.format(
+                np.count_nonzero(~valid)))
+
+        # y_lo + w * (y_hi - y_lo), all the numeric columns at once
+        low = self.values[lo]
+        numeric = low + weight[:, None] * (self.values[hi] - low)
+        numeric[~valid] = np.nan
+
+        # nearest sample (the one before on ties)
+        nearest = np.where(weight > 0.5, hi, lo)
+
+        aligned = {column: numeric[:, i] for i, column in enumerate(self.numeric)}
+        aligned.update({column: self.other_values[column][nearest]
+                        for column in self.other})
+
+        return pd.DataFrame({column: aligned[column] for column in self.columns})
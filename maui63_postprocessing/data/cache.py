@@ -0,0 +1,220 @@
+"""
+On-disk cache of inference results, keyed on the content of the media and
+model files and on the cv settings, so the same file is never run through
+the network twice.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+
+from maui63_postprocessing import __version__
+from maui63_postprocessing.data.store import save_table, load_table, SCHEMA_VERSION
+
+_file_hashes = {}  # (path, size, mtime) -> hash, so files are only read once
+
+
+def hash_file(path, block_size = 2**20):
+    """
+    sha256 of a file's content
+    """
+
+    path = os.path.abspath(str(path))
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+
+    if key not in _file_hashes:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                h.update(block)
+        _file_hashes[key] = h.hexdigest()
+
+    return _file_hashes[key]
+
+
+class ResultCache:
+    """
+    Stores the detections table (and optionally the tagged media) for each
+    key in its own folder. Once the cache is bigger than max_size (bytes) the
+    least recently used entries are removed.
+    """
+
+    def __init__(self,
+                 path = None,            # defaults to ~/.cache/maui63_postprocessing
+                 max_size: float = 10e9,  # bytes
+                 store_media: bool = True,  # also keep the tagged media files
+                 ):
+
+        if path is None:
+            path = os.environ.get('MAUI63_CACHE_DIR',
+                                  Path.home() / '.cache' / 'maui63_postprocessing')
+
+        self.path = Path(path)
+        self.max_size = max_size
+        self.store_media = store_media
+
+    @staticmethod
+    def key(media_files: list, model_files: list, params: dict):
+        """
+        Cache key for a set of media files, model files and cv settings
+        """
+
+        # a new version of the package can give different results
+        h = hashlib.sha256()
+        h.update('schema={} version={}'.format(SCHEMA_VERSION, __version__).encode())
+
+        for file in list(media_files) + list(model_files):
+            h.update(hash_file(file).encode())
+
+        h.update(json.dumps(params, sort_keys=True, default=str).encode())
+
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return self.path / key
+
+    def _read_meta(self, entry):
+        with open(entry / 'meta.json') as f:
+            return json.load(f)
+
+    def _write_meta(self, entry, meta):
+        with open(entry / 'meta.json', 'w') as f:
+            json.dump(meta, f)
+
+    def get(self, key, with_media = False):
+        """
+        Get (detections, media_file) for a key, or None if it isn't cached
+        (or if with_media and the tagged media wasn't kept).
+        """
+
+        entry = self._entry(key)
+
+        try:
+            meta = self._read_meta(entry)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        media_file = None
+        if meta.get('media') is not None:
+            media_file = entry / meta['media']
+
+        if with_media and (media_file is None or not media_file.exists()):
+            return None
+
+        detections = load_table(entry / 'detections.parquet', 'detections')
+
+        # mark as recently used
+        meta['last_used'] = time.time()
+        self._write_meta(entry, meta)
+
+        return detections, media_file
+
+    def put(self, key, detections, media_file = None):
+        """
+        Add the results for a key, then evict old entries if needed
+        """
+
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        # write everything in a temporary folder and move it in at the end so
+        # other processes never see half written entries
+        tmp = Path(tempfile.mkdtemp(dir=self.path, prefix='.tmp-'))
+        try:
+            save_table(detections, tmp / 'detections.parquet', 'detections')
+
+            media = None
+            if self.store_media and media_file is not None and os.path.exists(media_file):
+                media = 'media' + os.path.splitext(str(media_file))[1]
+                shutil.copyfile(media_file, tmp / media)
+
+            self._write_meta(tmp, {'created': time.time(),
+                                   'last_used': time.time(),
+                                   'media': media})
+
+            entry = self._entry(key)
+            if entry.exists():
+                shutil.rmtree(entry, ignore_errors=True)
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # another process put the same results in the meantime
+                if not entry.exists():
+                    raise
+
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.evict()
+
+    def _sync_file(self, key):
+        # small json files, kept out of the entries (and eviction)
+        return self.path / '.sync' / (key + '.json')
+
+    def get_sync(self, key):
+        """
+        Clock synchronization saved for a flight (see data.sync), or None
+        """
+
+        try:
+            with open(self._sync_file(key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put_sync(self, key, sync: dict):
+        file = self._sync_file(key)
+        file.parent.mkdir(parents=True, exist_ok=True)
+
+        # written next to it then moved, like the entries
+        tmp = file.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(sync, f)
+        os.replace(tmp, file)
+
+    def entries(self):
+        """
+        (key, last_used, size in bytes) for every entry
+        """
+
+        if not self.path.exists():
+            return []
+
+        entries = []
+        for entry in self.path.iterdir():
+            if entry.name.startswith('.') or not entry.is_dir():
+                continue
+
+            try:
+                last_used = self._read_meta(entry)['last_used']
+            except (FileNotFoundError, ValueError, KeyError):
+                last_used = 0
+
+            size = sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+            entries.append((entry.name, last_used, size))
+
+        return entries
+
+    def size(self):
+        return sum(size for _, _, size in self.entries())
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits max_size
+        """
+
+        entries = sorted(self.entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+
+        for key, _, size in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
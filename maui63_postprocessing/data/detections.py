@@ -0,0 +1,213 @@
+"""
+Flat detections table: one row per detection with typed columns.
+
+The per-frame shape used so far (one row per frame with lists in the
+confidence, object_class and box cells) is still available through
+frame_view, but filtering, grouping and exporting should use the flat table.
+"""
+
+import numpy as np
+from itertools import chain
+import pandas as pd
+
+from maui63_postprocessing.utils.records import RecordBuilder
+
+DETECTION_DTYPES = {
+    'frame': np.int64,         # frame index in the media
+    'timestamp': np.float64,   # seconds from the start of the media
+    'class_id': np.int32,
+    'confidence': np.float32,
+    'x': np.int32,             # bounding box top left corner
+    'y': np.int32,
+    'w': np.int32,             # bounding box width and height
+    'h': np.int32,
+    'inferred': np.bool_,      # False if carried over from another frame
+    }
+
+DETECTION_COLUMNS = list(DETECTION_DTYPES.keys())
+
+FRAME_COLUMNS = ['timestamp', 'num_objects', 'confidence', 'object_class',
+                 'box', 'inferred']
+
+
+def detection_records(capacity: int = 1024):
+    """
+    RecordBuilder for the detections table
+    """
+
+    return RecordBuilder(DETECTION_COLUMNS, dtypes = DETECTION_DTYPES,
+                         capacity = capacity)
+
+
+def empty_detections():
+    return detection_records(1).to_frame()
+
+
+def add_frame_detections(records, frame, timestamp, idxs, boxes,
+                         confidences, classIDs, inferred = True):
+    """
+    Add the detections kept by NMS (idxs) for one frame to the records
+    """
+
+    idxs = np.array(idxs, dtype=int).flatten()
+    if len(idxs) == 0:
+        return
+
+    boxes = np.asarray(boxes).reshape(-1, 4)[idxs]
+
+    records.extend({
+        'frame': frame,
+        'timestamp': timestamp,
+        'class_id': np.asarray(classIDs)[idxs],
+        'confidence': np.asarray(confidences)[idxs],
+        'x': boxes[:, 0],
+        'y': boxes[:, 1],
+        'w': boxes[:, 2],
+        'h': boxes[:, 3],
+        'inferred': inferred,
+        })
+
+
+def frame_detections(frame, timestamp, idxs, boxes, confidences, classIDs,
+                     inferred = True):
+    """
+    Detections table for a single frame (built directly from the arrays,
+    for per-frame results)
+    """
+
+    idxs = np.array(idxs, dtype=int).flatten()
+    n = len(idxs)
+
+    boxes = np.asarray(boxes).reshape(-1, 4)[idxs]
+
+    return pd.DataFrame({
+        'frame': np.full(n, frame, dtype=DETECTION_DTYPES['frame']),
+        'timestamp': np.full(n, timestamp, dtype=DETECTION_DTYPES['timestamp']),
+        'class_id': np.asarray(classIDs)[idxs].astype(DETECTION_DTYPES['class_id']),
+        'confidence': np.asarray(confidences)[idxs].astype(DETECTION_DTYPES['confidence']),
+        'x': boxes[:, 0].astype(DETECTION_DTYPES['x']),
+        'y': boxes[:, 1].astype(DETECTION_DTYPES['y']),
+        'w': boxes[:, 2].astype(DETECTION_DTYPES['w']),
+        'h': boxes[:, 3].astype(DETECTION_DTYPES['h']),
+        'inferred': np.full(n, inferred, dtype=DETECTION_DTYPES['inferred']),
+        }, columns = DETECTION_COLUMNS)
+
+
+def frame_view(detections):
+    """
+    Per-frame view of the detections table (one row per frame that has
+    detections, list cells for the confidences, classes and boxes).
+
+    Any extra columns (e.g. filename) are taken from the frame's first row.
+    """
+
+    detections = detections.sort_values(['frame', 'timestamp'], kind='stable')
+
+    frames, starts, counts = np.unique(detections['frame'].to_numpy(),
+                                       return_index=True, return_counts=True)
+
+    # slices of one list are much faster than a list per numpy array
+    bounds = list(zip(starts.tolist(), (starts + counts).tolist()))
+    def cells(values):
+        values = values.tolist()
+        return [values[start:end] for start, end in bounds]
+
+    df = pd.DataFrame({
+        'timestamp': detections['timestamp'].to_numpy()[starts],
+        'num_objects': counts,
+        'confidence': cells(detections['confidence'].to_numpy(np.float64)),
+        'object_class': cells(detections['class_id'].to_numpy()),
+        'box': cells(detections[['x', 'y', 'w', 'h']].to_numpy()),
+        'inferred': detections['inferred'].to_numpy()[starts],
+        }, columns = FRAME_COLUMNS)
+
+    for column in detections.columns:
+        if column not in DETECTION_COLUMNS:
+            df[column] = detections[column].to_numpy()[starts]
+
+    return df
+
+
+def detections_from_frames(df):
+    """
+    Flatten a per-frame DataFrame (the old shape) into a detections table.
+
+    Rows are numbered as frames if there is no frame column.
+    """
+
+    records = detection_records(max(int(df['num_objects'].sum()), 1))
+
+    frames = df['frame'] if 'frame' in df.columns else range(len(df))
+    inferred = df['inferred'] if 'inferred' in df.columns else [True] * len(df)
+
+    for frame, timestamp, num, confidence, object_class, box, inf in zip(
+            frames, df['timestamp'], df['num_objects'], df['confidence'],
+            df['object_class'], df['box'], inferred):
+        add_frame_detections(records, frame, timestamp, np.arange(num),
+                             box, confidence, object_class, inf)
+
+    return records.to_frame()
+
+
+
+# columns of the flat table for each list column of the per-frame view
+LIST_COLUMNS = {
+    'confidence': ['confidence'],
+    'object_class': ['object_class'],
+    'box': ['x', 'y', 'w', 'h'],
+    }
+
+
+def split_list_columns(df):
+    """
+    Split a per-frame DataFrame (e.g. processor.data) into its scalar columns
+    and a flat table of its list cells (one row per detection, row being the
+    position of its frame), so it can be stored and reloaded without
+    creating a Python list per cell.
+
+    The list columns are kept in place, holding the number of items in each
+    cell (join_list_columns puts the lists back).
+    """
+
+    columns = [column for column in LIST_COLUMNS if column in df.columns and
+               all(isinstance(cell, list) for cell in df[column])]
+
+    scalars = df.copy(deep=False)
+    cells = {'row': np.zeros(0, dtype=np.int64)}
+
+    for column in columns:
+        counts = np.fromiter(map(len, df[column]), dtype=np.int64, count=len(df))
+        if column == columns[0]:
+            cells['row'] = np.repeat(np.arange(len(df)), counts)
+        scalars[column] = counts
+        assert np.array_equal(counts, scalars[columns[0]]), \
+            "The {} and {} cells don't have the same lengths".format(
+                column, columns[0])
+
+        values = np.array(list(chain.from_iterable(df[column])))
+        values = values.reshape(len(values), len(LIST_COLUMNS[column]))
+        for i, name in enumerate(LIST_COLUMNS[column]):
+            cells[name] = values[:, i]
+
+    return scalars, pd.DataFrame(cells)
+
+
+def join_list_columns(scalars, cells):
+    """
+    Per-frame DataFrame from split_list_columns' tables
+    """
+
+    df = scalars.copy(deep=False)
+
+    for column, names in LIST_COLUMNS.items():
+        if column not in df.columns or names[0] not in cells.columns:
+            continue
+
+        values = cells[names].to_numpy()
+        values = values[:, 0].tolist() if len(names) == 1 else values.tolist()
+
+        # slices of one list are much faster than a list per numpy array
+        ends = np.cumsum(df[column].to_numpy()).tolist()
+        df[column] = [values[start:end] for start, end in zip([0] + ends, ends)]
+
+    return df
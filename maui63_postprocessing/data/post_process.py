@@ -2,26 +2,55 @@ from __future__ import annotations
 from typing import Union
 
 from maui63_postprocessing.data.uav_import import Maui63UAVImporter
-from maui63_postprocessing.videoedit.highlights import Highlighter
-from maui63_postprocessing.cv import process_video, process_image
+from maui63_postprocessing.videoedit.highlights import Highlighter, HighlightRecorder
+from maui63_postprocessing.videoedit.ffmpeg import cut_clips
+from maui63_postprocessing.cv import process_video, process_image, get_detector
+from maui63_postprocessing.cv import iter_video
+from maui63_postprocessing.cv.cv import add_bbox
+from maui63_postprocessing.cv import process_video_chunked
+from maui63_postprocessing.utils.records import RecordBuilder
+from maui63_postprocessing.data.detections import frame_view, empty_detections, \
+    detection_records, split_list_columns, join_list_columns
+from maui63_postprocessing.data.store import save_table, load_table
+from maui63_postprocessing.data.cache import ResultCache
+from maui63_postprocessing.data.align import TelemetryAligner
+from maui63_postprocessing.data.sync import estimate_media_start
+from maui63_postprocessing.data.spatial import SpatialIndex
 
 import os
 import shutil
+import inspect
 import requests
 import json
+import ast
+import numpy as np
 import pandas as pd
 import tempfile
 import filetype  # This might be unnecessary
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from tqdm import tqdm
 import warnings
 import time
 import copy
-import scipy
-import scipy.interpolate
 from moviepy.editor import  VideoFileClip
 import cv2
 
+def _process_dir_image(job, cv_files, cv_kwargs):
+    """
+    Image directory pool worker, process_image loads the network once per
+    worker process (see cv.get_detector)
+    """
+    
+    media_file, output_file = job
+    
+    return process_image(media_file,
+                         *cv_files,
+                         output_file = output_file,
+                         **cv_kwargs)
+
+
 class Maui63DataProcessor:
     
     def __init__(self,
@@ -35,10 +64,20 @@ class Maui63DataProcessor:
                  csv_output_path = None,             # csv export path
                  tag_media = True,                   # tag media with bboxes (y/n)
                  highlighter_kwargs = {},            # highlighter arguments
+                 exact_highlights = False,           # re-encode highlights for frame exact cuts (slower)
+                 highlight_workers: int = None,      # highlights exported at the same time (4 by default)
+                 single_pass_highlights = False,     # write the highlights during inference (no tagged temp video, one process)
                  cv_kwargs = {},                     # cv arguments
-                 media_start_time = None,            # media start time (defaults to logs start)
+                 uav_log_kwargs = {},                # UAV log arguments (see data.uav_import.read_uav_log)
+                 media_start_time = None,            # media start time (unix time, estimated if None)
+                 cv_logs = None,                     # onboard cv log (to synchronize the clocks)
+                 clock_sync = 'auto',                # media start estimate (see data.sync.SYNC_METHODS)
+                 clock_offset: float = 0,            # seconds added to the estimated media start
                  image_dir_fps = None,               # image directory FPS (for continuous)
                  image_dir_timestamps: list = None,  # image directory timestamps (list)
+                 detector = None,                    # loaded cv.Detector (shared between jobs)
+                 workers: int = 1,                   # processes for video chunks / image directories
+                 cache: ResultCache = None,          # inference result cache (skips cv on a hit)
                  ):
         
         if csv_output_path is not None:
@@ -53,9 +92,19 @@ class Maui63DataProcessor:
         self.output_path = str(output_path)
         self.tag_media = tag_media
         self.highlighter_kwargs = highlighter_kwargs  # TODO: document
+        self.exact_highlights = exact_highlights
+        self.highlight_workers = highlight_workers
+        self.single_pass_highlights = single_pass_highlights
         self.cv_kwargs = cv_kwargs                    # TODO: document
+        self.uav_log_kwargs = uav_log_kwargs
         self.csv_output_path = csv_output_path
         self.media_start_time = media_start_time
+        self.cv_logs = str(cv_logs) if cv_logs is not None else None
+        self.clock_sync = clock_sync
+        self.clock_offset = clock_offset
+        self.detector = detector
+        self.workers = workers
+        self.cache = cache
         
         # Make sure we don't have both
         assert image_dir_fps == None or image_dir_timestamps == None
@@ -74,6 +123,16 @@ class Maui63DataProcessor:
             + '\n\nOutput_type = {} | Media_type = {}'.format(
                 self._output_type, self._media_type)
         
+        # the single pass runs the video through one process and writes the
+        # clips as it goes, there's nothing for the workers to share
+        if self._recording_highlights():
+            ignored = ['{} = {}'.format(name, value) for name, value in
+                       [('workers', workers), ('highlight_workers', highlight_workers)]
+                       if value is not None and value > 1]
+            if ignored:
+                warnings.warn('{} ignored with single_pass_highlights'.format(
+                    ', '.join(ignored)))
+        
     def _get_filetype(self, file=None):
         """
         This isn't perfect, but close enough
@@ -86,7 +145,7 @@ class Maui63DataProcessor:
         
         try:
             kind = filetype.guess(file)
-            mime = kind.mime.split('/')
+            mime = kind.mime.split('/') if kind is not None else ['unknown', '']
         except IsADirectoryError:
             mime = ['dir', '']
         except FileNotFoundError:
@@ -114,92 +173,186 @@ class Maui63DataProcessor:
         
         
     def _import_data(self):
-        self.importer = Maui63UAVImporter(self.logs)
+        self.importer = Maui63UAVImporter(self.logs, cv_logfile = self.cv_logs,
+                                          **self.uav_log_kwargs)
         
-        # make a copy of the data
-        df = copy.deepcopy(self.importer.df)
+        # add a prefix to the columns (a new frame, the importer's isn't changed)
+        self.uav_df = self.importer.df.add_prefix('uav_')
         
-        # add a prefix to the columns
-        df.rename(columns = {x:('uav_'+x) for x in df.columns}, inplace = True) 
+    def _sync_key(self):
+        # the flight's files, and the detections if they're lined up with 
+        # the cv log (not the offset, it's added to the cached estimate)
+        params = {'clock_sync': self.clock_sync}
+        if self.cv_logs is not None and self.clock_sync in ['auto', 'cv_log']:
+            params['cv'] = self._cache_key()
         
-        self.uav_df = df
+        files = [self.logs, self.media] + \
+            ([self.cv_logs] if self.cv_logs is not None else [])
+        
+        return self.cache.key(files, [], params)
+    
+    def _sync_clocks(self):
+        """
+        Estimate the unix time of the start of the media (see data.sync), 
+        cached per flight if there's a cache.
+        """
         
+        key = None
+        sync = None
+        if self.cache is not None and self._media_type == 'video':
+            key = self._sync_key()
+            sync = self.cache.get_sync(key)
+        
+        if sync is None:
+            start, method = estimate_media_start(
+                self.uav_df['uav_unix_time'],
+                media = self.media if self._media_type == 'video' else None,
+                cv_lines = getattr(self.importer, 'cv_lines', None),
+                detections = getattr(self, 'detections', None),
+                method = self.clock_sync)
+            sync = {'media_start_time': float(start), 'method': method}
+            
+            if key is not None:
+                self.cache.put_sync(key, sync)
+        
+        self.clock_sync_result = sync
+        
+        print('Media start time: {} ({}{})'.format(
+            sync['media_start_time'], sync['method'],
+            ', offset {} s'.format(self.clock_offset) if self.clock_offset else ''))
+        
+        return sync['media_start_time'] + self.clock_offset
+    
     def _merge_uav_cv_datasets(self):
     
-        # TODO: do not assume equal start times
-        df = copy.deepcopy(self.uav_df)
+        df = self.uav_df.copy(deep = False)
         
-        # TODO: assuming video and logs are synced at the beginning for now
         if self.media_start_time == None:
-            self.media_start_time = df['uav_unix_time'].min()
+            self.media_start_time = self._sync_clocks()
             
         df['timestamp'] = df['uav_unix_time'] - self.media_start_time
         
-        # create linear interpolators based on log data
-        data_cols = list(df.columns)
-        data_cols.remove('timestamp')
-        interpolators = {}
-        x = df.timestamp
-        for column in data_cols:
-            y = df[column]
+        # linear interpolation of the numeric columns, nearest sample for 
+        # the others, positions found once for all the columns
+        self._aligner = TelemetryAligner(df, 'timestamp')
+        
+        aligned = self._aligner.align(self.data['timestamp'].to_numpy())
+        for column in aligned.columns:
+            self.data[column] = aligned[column].to_numpy()
+        
+    def _highlight_filename(self, time):
+        # filename format = filename + mingroup timestamp
+        return (
+            self.output_path.rstrip('/') + '/' +
+            self.media.split(os.sep)[-1].rstrip('.' + self._media_extension) +  
+            '-' + str(time) + '.' + self._media_extension
+            )
+    
+    def _recording_highlights(self):
+        # single pass highlights only make sense for tagged clips, untagged
+        # ones are cut straight from the original
+        return self._media_type == 'video' and self._output_extension == '' \
+            and self.tag_media and self.single_pass_highlights
+    
+    def _record_video_highlights(self):
+        """
+        Single pass: write the highlight clips from the tagged frames as they
+        come out of the network (the video is decoded once and there's no
+        full length tagged video, but the cache isn't used).
+        """
+        
+        #create a folder if needed
+        Path(self.output_path).mkdir(parents=True, exist_ok=True)
+        
+        vidcap = cv2.VideoCapture(self.media)
+        fps = vidcap.get(cv2.CAP_PROP_FPS)
+        vidcap.release()
+        
+        recorder = HighlightRecorder(self._highlight_filename, fps,
+                                     encoder = self.cv_kwargs.get('encoder', 'opencv'),
+                                     quality = self.cv_kwargs.get('quality'),
+                                     **self.highlighter_kwargs)
+        
+        records = detection_records()
+        for framenum, timestamp, detections, frame in \
+                self.iter_detections(annotate = True):
             
-            if y.dtype.kind in 'biufc':
-                interpolators[column] = scipy.interpolate.interp1d(x, y)
+            detected = len(detections) > 0
+            if detected:
+                records.extend({column: detections[column].to_numpy()
+                                for column in detections.columns})
             
-            else:
-                # if column is non-numeric interp1d(kind='nearest')
-                # https://stackoverflow.com/questions/62015823/interpolating-categorical-data-in-python-nearest-previous-value
-                
-                def interp_f_factory():
-                    def interp_f(x):
-                        f = scipy.interpolate.interp1d(
-                            x, range(len(y)), kind='nearest',
-                            fill_value=(0, len(y)-1), bounds_error=False
-                            )            
-                        y_idx = f(x)
-                        y_new = [y[int(i)] for i in y_idx]
-                        return y_new
-                    return interp_f
-                
-                interpolators[column] = interp_f_factory()
-                
-        self._interpolators = interpolators
+            recorder.write(timestamp, frame, detected)
         
-        # Now put it in with interpolation
-        x = self.data.timestamp
-        for column in data_cols:
-            self.data[column] = interpolators[column](x)
+        self._recorded_highlights = recorder.finish()
         
+        return records.to_frame()
+    
     def _generate_video_highlights(self, df_in = None):
-        self.highlighter = Highlighter(self._video_temp_file,
-                                       self.dnn_df.timestamp,
-                                       **self.highlighter_kwargs)
         
-        clips, groups = self.highlighter.create_clips()
-        
-        df = pd.DataFrame()
-        for i, clip in enumerate(clips):
+        if self._recording_highlights():
+            # already written by _record_video_highlights
+            highlights = [(start, end) for start, end, _, _
+                          in self._recorded_highlights]
+            groups = [group for _, _, group, _ in self._recorded_highlights]
+            filenames = [filename for _, _, _, filename
+                         in self._recorded_highlights]
+            
+            timestamps = np.concatenate(groups) if groups else np.zeros(0)
+            files = np.repeat(np.array(filenames, dtype=object),
+                              [len(group) for group in groups])
+        else:
+            self.highlighter = Highlighter(self._video_temp_file,
+                                           self.dnn_df.timestamp,
+                                           **self.highlighter_kwargs)
             
-            print('Saving highlight {} of {}: \n'.format(i, len(clips)-1))
-            time.sleep(0.2)
+            table, group_ids = self.highlighter.find_highlights()
+            times = self.highlighter.times
+            
+            # first (earliest) time of each group
+            group_times = times[np.flatnonzero(np.diff(group_ids, prepend=-1))]
+            
+            highlights = list(zip(table.start.tolist(), table.end.tolist()))
+            time_groups = np.split(times, np.flatnonzero(np.diff(group_ids)) + 1)
+            groups = [time_groups[group_id].tolist() for group_id in table.group_id]
+            filenames = [self._highlight_filename(group_times[group_id])
+                         for group_id in table.group_id]
             
             #create a folder if needed
             Path(self.output_path).mkdir(parents=True, exist_ok=True)
             
-            # filename format = filename + mingroup timestamp
-            filename = (
-                self.output_path.rstrip('/') + '/' +
-                self.media.split(os.sep)[-1].rstrip('.' + self._media_extension) +  
-                '-' + str(min(groups[i])) + '.' + self._media_extension
-                )
+            print('Saving {} highlights'.format(len(highlights)))
+            t0 = time.perf_counter()
+            
+            # The boxes are already drawn on the video, so the clips can be
+            # stream copied (re-encoded only for frame exact cuts)
+            self._highlight_times = cut_clips(self._video_temp_file, highlights,
+                                              filenames,
+                                              exact = self.exact_highlights,
+                                              workers = self.highlight_workers or 4)
             
-            clip.write_videofile(filename, verbose=False)
+            if len(highlights) > 0:
+                print('Saved {} highlights in {:.2f}s (per clip: mean {:.2f}s, '
+                      'max {:.2f}s)'.format(len(highlights),
+                                            time.perf_counter() - t0,
+                                            np.mean(self._highlight_times),
+                                            np.max(self._highlight_times)))
             
-            df_tmp = pd.DataFrame({'timestamp': groups[i]})
-            df_tmp['filename'] = filename
-            df = df.append(df_tmp, ignore_index = True)
+            # the points of interest of each highlight (invalid groups have none)
+            group_files = np.full(len(group_times), None, dtype=object)
+            group_files[table.group_id] = filenames
+            
+            exported = np.isin(group_ids, table.group_id)
+            timestamps = times[exported]
+            files = group_files[group_ids[exported]]
+        
+        records = RecordBuilder(['timestamp', 'filename'],
+                                dtypes = {'timestamp': float})
+        records.extend({'timestamp': timestamps, 'filename': files})
             
-        self._clips = clips
+        df = records.to_frame()
+        
+        self._highlights = highlights
         self._groups = groups
         
         if type(df_in) != type(None):
@@ -230,6 +383,101 @@ class Maui63DataProcessor:
         
         return frame
         
+    def _get_detector(self):
+        """
+        Loads the network the first time it's needed (cached per process)
+        """
+        
+        if self.detector is None:
+            self.detector = get_detector(self.config_file,
+                                         self.weights,
+                                         self.names_file)
+        
+        return self.detector
+    
+    # cv arguments that don't change the results
+    _uncached_cv_kwargs = ['batch_size', 'read_queue_size', 'write_queue_size',
+                           'checkpoint', 'checkpoint_every', 'clear_checkpoint']
+    
+    # arguments of the cv functions that aren't settings
+    _unkeyed_cv_args = ['output_file', 'detector', 'table']
+    
+    def _cache_key(self, file = None):
+        # the cv function's defaults too, so the key changes with them
+        function = process_video if self._media_type == 'video' else process_image
+        params = {name: parameter.default for name, parameter
+                  in inspect.signature(function).parameters.items()
+                  if parameter.default is not inspect.Parameter.empty
+                  and name not in self._unkeyed_cv_args}
+        params.update(self.cv_kwargs)
+        params = {k: v for k, v in params.items()
+                  if k not in self._uncached_cv_kwargs}
+        params['media_type'] = self._media_type
+        if file is not None:
+            # the tagged media is stored, its container/codec comes from the 
+            # extension (the encoder and quality are in the cv arguments)
+            params['output_extension'] = os.path.splitext(str(file))[1].lower()
+        
+        return self.cache.key([self.media],
+                              [self.data_file, self.config_file,
+                               self.weights, self.names_file],
+                              params)
+    
+    def _run_cached(self, run, file = None):
+        """
+        Get the detections from the cache if they're there (copying the
+        cached tagged media to file if needed), otherwise run() and cache them.
+        """
+        
+        if self.cache is None:
+            return run()
+        
+        key = self._cache_key(file)
+        
+        cached = self.cache.get(key, with_media = file is not None)
+        if cached is not None:
+            print('Found cached cv results ({}), skipping inference'.format(key[:12]))
+            detections, media_file = cached
+            if file is not None:
+                shutil.copyfile(media_file, file)
+            return detections
+        
+        detections = run()
+        self.cache.put(key, detections, media_file = file)
+        
+        return detections
+        
+    def _list_images(self):
+        """
+        Image files in the media directory
+        """
+        
+        media_dir = self.media.rstrip('/') + '/'
+        
+        # Sorted so the image order (and so the timestamps) is deterministic
+        images = []
+        for filename in sorted(os.listdir(self.media)):
+            f_type, _ = self._get_filetype(media_dir + filename)
+            if f_type == 'image':
+                images.append(filename)
+            else:
+                warnings.warn('Non-media file in media directory ({}), skipping...'.format(filename))
+        
+        if self.image_dir_timestamps != None:
+            assert len(self.image_dir_timestamps) == len(images), \
+                "image_dir_timestamps should have one timestamp per image " \
+                + "({} timestamps, {} images)".format(
+                    len(self.image_dir_timestamps), len(images))
+        
+        return images
+    
+    def _image_timestamp(self, i):
+        if self.image_dir_fps != None:
+            return i / self.image_dir_fps
+        elif self.image_dir_timestamps != None:
+            return self.image_dir_timestamps[i]
+        return 0.
+        
     def _run_cv(self):
         
         if self._media_type == 'video':
@@ -242,24 +490,43 @@ class Maui63DataProcessor:
                     shutil.copyfile(self.media, self.output_path)  # copy the original to the output
             else:
                 # We're creating subclips
-                self._video_temp_file = tempfile.NamedTemporaryFile(
-                    suffix='.' + self._media_extension).name
-                
-                if self.tag_media:
-                    file = self._video_temp_file
-                else:
+                if not self.tag_media:
                     file = None  # No output from processing
-                    shutil.copyfile(self.media, self._video_temp_file)  # copy the original to the output
-            
-            df = process_video(self.media,
-                               self.data_file,
-                               self.config_file,
-                               self.weights,
-                               self.names_file,
-                               output_file = file,
-                               **self.cv_kwargs)
+                    self._video_temp_file = self.media  # cut from the original
+                elif self.single_pass_highlights:
+                    file = None  # the clips are written during inference
+                else:
+                    self._video_temp_file = tempfile.NamedTemporaryFile(
+                        suffix='.' + self._media_extension).name
+                    file = self._video_temp_file
             
-            df.filename = file
+            def run():
+                if self.workers > 1:
+                    # split the video in chunks processed in parallel
+                    return process_video_chunked(self.media,
+                                                 self.data_file,
+                                                 self.config_file,
+                                                 self.weights,
+                                                 self.names_file,
+                                                 output_file = file,
+                                                 workers = self.workers,
+                                                 table = 'detections',
+                                                 **self.cv_kwargs)
+                else:
+                    return process_video(self.media,
+                                         self.data_file,
+                                         self.config_file,
+                                         self.weights,
+                                         self.names_file,
+                                         output_file = file,
+                                         detector = self._get_detector(),
+                                         table = 'detections',
+                                         **self.cv_kwargs)
+            
+            if self._recording_highlights():
+                detections = self._record_video_highlights()
+            else:
+                detections = self._run_cached(run, file)
             
         if self._media_type == 'image':
             if self.tag_media:
@@ -268,63 +535,139 @@ class Maui63DataProcessor:
                 file = None  # No output from processing
                 shutil.copyfile(self.media, self.output_path)  # copy the original to the output
                 
-            df = process_image(self.media,
-                               self.data_file,
-                               self.config_file,
-                               self.weights,
-                               self.names_file,
-                               output_file = file,
-                               **self.cv_kwargs)
+            def run():
+                return process_image(self.media,
+                                     self.data_file,
+                                     self.config_file,
+                                     self.weights,
+                                     self.names_file,
+                                     output_file = file,
+                                     detector = self._get_detector(),
+                                     table = 'detections',
+                                     **self.cv_kwargs)
             
-            df['filename'] = file
-            df['timestamp'] = 0
+            detections = self._run_cached(run, file)
             
-        if self._media_type == 'dir':
-            if self.image_dir_fps != None:
-                fps = self.image_dir_fps
+            detections['filename'] = file
             
-            df = pd.DataFrame()
+        if self._media_type == 'dir':
+            media_dir = self.media.rstrip('/') + '/'
             output_dir = self.output_path.rstrip('/') + '/' # just to make sure it has a slash
-            for i, filename in tqdm(enumerate(os.listdir(self.media))):
-                f_type, _ = self._get_filetype(filename, check = False)
-                if f_type == 'image':
-                    if self.tag_media:
-                        file = output_dir + filename # TODO: figure out if we're happy with this
-                    else:
-                        file = None  # No output from processing
-                        shutil.copyfile(self.media.rstrip('/') + '/' + filename, output_dir + filename)  # copy the original to the output
-                    df = process_image(self.media,
-                                       self.data_file,
-                                       self.config_file,
-                                       self.weights,
-                                       self.names_file,
-                                       output_file = file,
-                                       **self.cv_kwargs)
-                    
-                    df['filename'] = file
-                    
-                    if self.image_dir_fps != None:
-                        df['timestamp'] = fps*i
-                        
-                    series = df.squeeze()
-                    df.append(series, ignore_index=True)
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+            
+            images = self._list_images()
+            
+            jobs = []
+            for filename in images:
+                if self.tag_media:
+                    file = output_dir + filename # TODO: figure out if we're happy with this
                 else:
-                    warnings.warn('Non-media file in media directory ({}), skipping...'.format(filename))
-                    continue
-    
-        if self.image_dir_timestamps != None:
-            df['timestamp'] = self.image_dir_timestamps
+                    file = None  # No output from processing
+                    shutil.copyfile(media_dir + filename, output_dir + filename)  # copy the original to the output
+                jobs.append((media_dir + filename, file))
+            
+            cv_files = (self.data_file, self.config_file, self.weights, self.names_file)
+            cv_kwargs = dict(self.cv_kwargs, table = 'detections')
+            
+            if self.workers > 1:
+                # Each worker loads the network once (get_detector caches it)
+                with ProcessPoolExecutor(max_workers = self.workers) as executor:
+                    results = list(tqdm(executor.map(_process_dir_image,
+                                                     jobs,
+                                                     repeat(cv_files),
+                                                     repeat(cv_kwargs)),
+                                        total = len(jobs)))
+            else:
+                detector = self._get_detector()
+                results = [process_image(media_file,
+                                         *cv_files,
+                                         output_file = file,
+                                         detector = detector,
+                                         **cv_kwargs)
+                           for media_file, file in tqdm(jobs)]
+            
+            # results come back in the same order as the jobs
+            for i, (filename, df) in enumerate(zip(images, results)):
+                df['frame'] = i
+                df['timestamp'] = self._image_timestamp(i)
+                df['filename'] = output_dir + filename
+                    
+            detections = pd.concat(results, ignore_index=True) \
+                if results else empty_detections()
+        
+        # one row per detection
+        self.detections = detections
+        
+        # one row per frame (lists of detections)
+        df = frame_view(detections)
+        
+        if self._media_type == 'video':
+            df.filename = file
             
         self.dnn_df = df
         return df
     
         
+    def iter_detections(self, annotate = False):
+        """
+        Yields (frame, timestamp, detections) for each frame/image as soon as
+        it's processed, detections being its rows of the detections table
+        (with annotate, (frame, timestamp, detections, image)).
+        
+        Nothing is kept in memory or written to output_path, so downstream
+        steps (exports, uploads, ...) can consume the results as they come.
+        """
+        
+        cv_files = (self.data_file, self.config_file, self.weights, self.names_file)
+        detector = self._get_detector()
+        
+        if self._media_type == 'video':
+            cv_kwargs = {k: v for k, v in self.cv_kwargs.items()
+                         if k not in ['checkpoint', 'checkpoint_every', 'clear_checkpoint']}
+            
+            yield from iter_video(self.media,
+                                  *cv_files,
+                                  detector = detector,
+                                  annotate = annotate,
+                                  **cv_kwargs)
+            return
+        
+        if self._media_type == 'image':
+            media_files = [self.media]
+        else:
+            media_dir = self.media.rstrip('/') + '/'
+            media_files = [media_dir + filename for filename in self._list_images()]
+        
+        for i, media_file in enumerate(media_files):
+            detections = process_image(media_file,
+                                       *cv_files,
+                                       detector = detector,
+                                       table = 'detections',
+                                       **self.cv_kwargs)
+            
+            timestamp = self._image_timestamp(i)
+            detections['frame'] = i
+            detections['timestamp'] = timestamp
+            detections['filename'] = media_file
+            
+            if annotate:
+                image = add_bbox(cv2.imread(media_file),
+                                 np.arange(len(detections)),
+                                 detections[['x', 'y', 'w', 'h']].to_numpy(),
+                                 detections['confidence'].to_numpy(),
+                                 detections['class_id'].to_numpy(),
+                                 detector.COLORS, detector.LABELS)
+                
+                yield i, timestamp, detections, image
+            else:
+                yield i, timestamp, detections
+        
     def process(self):
         
         # Import log data
         self._import_data()
         
-        # Todo: ask to rerun if self.dnn_df exists
+        # Skips inference if the results are in self.cache
         df = self._run_cv()
         
         if self._media_type == 'video' and self._output_extension == '':
@@ -338,6 +681,16 @@ class Maui63DataProcessor:
         return df
 
     
+    def spatial_index(self, **kwargs):
+        """
+        Spatial index over the merged data (see data.spatial.SpatialIndex), 
+        for radius/bounding box queries and clustering sightings
+        """
+        
+        assert hasattr(self, 'data'), 'Please process or load the results first.'
+        
+        return SpatialIndex(self.data, **kwargs)
+    
     # in case you don't want to rerun the opencv code
     def _save_temp_output(self,
                           data_df_csv = '__temp__.csv',
@@ -371,20 +724,18 @@ class Maui63DataProcessor:
                              ):
         """
         A debug function for reloading data outputs saved prior
+        (use save_results/load_results instead for a faster binary format)
         """
         
-        print("WARNING: This method uses eval to convert strings")
-        print("         Do no use with non-trusted datasets")
-        input("press ENTER to continue, ctrl+C to cancel")
-        
+        # literal_eval only parses python literals, so this is safe to use
         colums_to_eval = ['box', 'confidence', 'object_class']
         
         if dnn_df_csv != None:
-            self.df_dnn = pd.read_csv(dnn_df_csv)
+            self.dnn_df = pd.read_csv(dnn_df_csv)
             
             for col in colums_to_eval:
-                if col in self.df_dnn.columns:
-                    self.df_dnn[col] = self.df_dnn[col].apply(lambda x: eval(x))
+                if col in self.dnn_df.columns:
+                    self.dnn_df[col] = self.dnn_df[col].apply(ast.literal_eval)
         
         if video_name != None:
             self._video_temp_file = video_name
@@ -394,8 +745,71 @@ class Maui63DataProcessor:
             
             for col in colums_to_eval:
                 if col in self.data.columns:
-                    self.data[col] = self.data[col].apply(lambda x: eval(x))
+                    self.data[col] = self.data[col].apply(ast.literal_eval)
+        
+    def __getattr__(self, name):
+        # the per-frame views of loaded results (data and dnn_df, a Python 
+        # list per cell) are only built when they're first used
+        views = self.__dict__.get('_lazy_views', {})
+        if name in views:
+            value = views.pop(name)()
+            setattr(self, name, value)
+            return value
+        
+        raise AttributeError("'{}' object has no attribute '{}'".format(
+            type(self).__name__, name))
+    
+    def save_results(self, path = '__temp__.results'):
+        """
+        Save the detections and the merged data (if processed) to a folder of
+        Parquet files, reload them with load_results.
+        
+        The merged data is saved flat: its per-frame columns, and its list 
+        cells with one row per detection.
+        """
+        
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        
+        print('Saving results to {}'.format(path))
+        
+        save_table(self.detections, path / 'detections.parquet', 'detections')
+        
+        if 'data' in self.__dict__:
+            data, cells = split_list_columns(self.data)
+        elif 'data' in self.__dict__.get('_lazy_views', {}):
+            data, cells = self._loaded_data  # loaded and not used yet
+        else:
+            return
+        
+        save_table(data, path / 'data.parquet', 'data')
+        save_table(cells, path / 'data_cells.parquet', 'data_cells')
+            
+    def load_results(self, path = '__temp__.results'):
+        """
+        Load results saved with save_results (no need to rerun the cv code).
+        
+        Only the flat tables are read, data and dnn_df are built from them 
+        the first time they're used.
+        """
+        
+        path = Path(path)
+        
+        for name in ['data', 'dnn_df']:
+            self.__dict__.pop(name, None)
+        
+        detections = load_table(path / 'detections.parquet', 'detections')
+        self.detections = detections
+        self._lazy_views = {'dnn_df': lambda: frame_view(detections)}
         
+        if (path / 'data_cells.parquet').exists():
+            self._loaded_data = (load_table(path / 'data.parquet', 'data'),
+                                 load_table(path / 'data_cells.parquet', 'data_cells'))
+            self._lazy_views['data'] = lambda: join_list_columns(
+                *self.__dict__.pop('_loaded_data'))
+        elif (path / 'data.parquet').exists():
+            # saved with the list cells in the table
+            self.data = load_table(path / 'data.parquet', 'data')
         
     
     def export_csv(self, csv_output_path = None):
@@ -485,8 +899,8 @@ class Maui63DataProcessor:
             data_dict = {
                 "model": -2, # Dolphins
                 "detections": detections,
-                "lat": float(row['uav_ UAV lat']),  # TODO: Fix this column
-                "lng": float(row['uav_ UAV long'])
+                "lat": float(row['uav_UAV lat']),
+                "lng": float(row['uav_UAV long'])
                 }
             
             image = self._get_detection_frame(row.timestamp)
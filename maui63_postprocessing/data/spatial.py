@@ -0,0 +1,192 @@
+"""
+Spatial index over the merged data (the interpolated UAV positions), for
+radius and bounding box queries and for grouping repeated sightings.
+
+The positions are put in a KD-tree (scipy) as 3-D points on the sphere, in
+metres, so the distances hold anywhere (e.g. flights far apart concatenated)
+and a radius is a chord length. Bounding boxes use the rows sorted by
+latitude. Rows without a position (outside of the telemetry) aren't indexed.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+EARTH_RADIUS = 6371008.8  # metres (mean)
+
+LAT_COLUMN = 'uav_UAV lat'
+LON_COLUMN = 'uav_UAV long'
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Distance in metres between points in degrees
+    """
+
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def chord(distance):
+    """
+    Straight line length (through the earth) of a distance in metres along
+    the surface
+    """
+
+    return 2 * EARTH_RADIUS * np.sin(np.minimum(distance / (2 * EARTH_RADIUS), np.pi / 2))
+
+
+def cartesian(lat, lon):
+    """
+    Points in degrees to (x, y, z) on the sphere, in metres
+    """
+
+    lat = np.radians(np.atleast_1d(np.asarray(lat, dtype = np.float64)))
+    lon = np.radians(np.atleast_1d(np.asarray(lon, dtype = np.float64)))
+
+    return EARTH_RADIUS * np.column_stack([np.cos(lat) * np.cos(lon),
+                                           np.cos(lat) * np.sin(lon),
+                                           np.sin(lat)])
+
+
+class SpatialIndex:
+
+    def __init__(self,
+                 df: pd.DataFrame,          # e.g. processor.data (several flights can be concatenated)
+                 lat_column: str = LAT_COLUMN,
+                 lon_column: str = LON_COLUMN,
+                 time_column: str = 'uav_unix_time',  # for the passes (same clock across flights)
+                 ):
+
+        self.df = df
+        self.time_column = time_column
+
+        lat = df[lat_column].to_numpy(np.float64)
+        lon = df[lon_column].to_numpy(np.float64)
+
+        # positions of the indexed rows in df
+        self.rows = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        self.lat, self.lon = lat[self.rows], lon[self.rows]
+
+        self.tree = cKDTree(cartesian(self.lat, self.lon))
+
+        self.by_lat = np.argsort(self.lat, kind = 'stable')
+        self.sorted_lat = self.lat[self.by_lat]
+
+    def radius_rows(self, lat: float, lon: float, radius: float):
+        """
+        Positions (in df) of the rows within radius metres of a point
+        """
+
+        # a hair more for the rounding, the exact distances are checked
+        candidates = np.asarray(
+            self.tree.query_ball_point(cartesian(lat, lon)[0], chord(radius) * (1 + 1e-9) + 1e-6),
+            dtype = np.int64)
+        inside = haversine(lat, lon, self.lat[candidates], self.lon[candidates]) <= radius
+
+        return self.rows[np.sort(candidates[inside])]
+
+    def radius(self, lat: float, lon: float, radius: float):
+        """
+        Rows of df within radius metres of a point
+        """
+
+        return self.df.iloc[self.radius_rows(lat, lon, radius)]
+
+    def bbox_rows(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+        """
+        Positions (in df) of the rows in a bounding box (degrees)
+        """
+
+        start = self.sorted_lat.searchsorted(min_lat, 'left')
+        end = self.sorted_lat.searchsorted(max_lat, 'right')
+
+        candidates = self.by_lat[start:end]
+        lon = self.lon[candidates]
+        inside = (lon >= min_lon) & (lon <= max_lon)
+
+        return self.rows[np.sort(candidates[inside])]
+
+    def bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+        """
+        Rows of df in a bounding box (degrees)
+        """
+
+        return self.df.iloc[self.bbox_rows(min_lat, min_lon, max_lat, max_lon)]
+
+    def cluster(self,
+                distance: float = 200,    # metres between sightings of the same group
+                resolution: float = None, # positions are snapped to this grid (metres) first
+                ):
+        """
+        Cluster id of each row of df (0, 1, ... in order of their first row,
+        -1 for the rows without a position).
+        Sightings chained by less than (about) distance metres are in the
+        same cluster (e.g. the same pod seen on several passes).
+
+        Positions are snapped to a resolution grid (distance / 10 by
+        default) so the many sightings at the same place are only compared
+        once.
+        """
+
+        ids = np.full(len(self.df), -1, dtype = np.int64)
+        if len(self.rows) == 0:
+            return ids
+
+        if resolution is None:
+            resolution = distance / 10
+
+        cells, cell_of = np.unique(np.floor(self.tree.data / resolution).astype(np.int64),
+                                   axis = 0, return_inverse = True)
+        centres = (cells + 0.5) * resolution
+
+        pairs = cKDTree(centres).query_pairs(chord(distance), output_type = 'ndarray')
+        graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])),
+                           shape = (len(cells), len(cells)))
+        _, labels = connected_components(graph, directed = False)
+
+        # numbered in order of their first row
+        labels = labels[cell_of.ravel()]
+        _, first, inverse = np.unique(labels, return_index = True, return_inverse = True)
+        rank = np.empty(len(first), dtype = np.int64)
+        rank[np.argsort(first)] = np.arange(len(first))
+
+        ids[self.rows] = rank[inverse.ravel()]
+
+        return ids
+
+    def sightings(self,
+                  distance: float = 200,  # see cluster
+                  pass_gap: float = 300,  # seconds between sightings before it's another pass
+                  ):
+        """
+        One row per cluster: number of rows, mean position, first and last
+        time and number of passes (sightings more than pass_gap apart).
+        """
+
+        # the indexed rows only (self.rows are in order)
+        ids = self.cluster(distance)[self.rows]
+        times = self.df[self.time_column].to_numpy(np.float64)[self.rows]
+
+        df = pd.DataFrame({'cluster': ids, 'lat': self.lat, 'lon': self.lon,
+                           'time': times})
+
+        # passes: time gaps within each cluster
+        df = df.sort_values(['cluster', 'time'], kind = 'stable')
+        df['new_pass'] = ((df['cluster'].diff() != 0) |
+                          (df['time'].diff() > pass_gap)).to_numpy()
+
+        grouped = df.groupby('cluster')
+        return pd.DataFrame({
+            'count': grouped.size(),
+            'lat': grouped['lat'].mean(),
+            'lon': grouped['lon'].mean(),
+            'first_time': grouped['time'].min(),
+            'last_time': grouped['time'].max(),
+            'passes': grouped['new_pass'].sum().astype(np.int64),
+            })
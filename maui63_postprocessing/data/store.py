@@ -0,0 +1,86 @@
+"""
+Binary columnar storage for the detection tables (Parquet).
+
+Columns keep their types (list cells are stored as native list columns, so
+no string parsing is needed to reload them, and come back as lists) and the
+files are tagged with a schema version. They're zstd compressed: much
+smaller than the CSVs, but reading decompresses them into memory (the raw
+file is memory-mapped, not the columns). A Python list per cell is slow to
+build, so large per-frame tables are better stored flat (see
+detections.split_list_columns).
+"""
+
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SCHEMA_VERSION = 1
+
+_METADATA_KEY = b'maui63_postprocessing'
+
+
+def save_table(df, path, kind: str, compression: str = 'zstd'):
+    """
+    Save a DataFrame to a Parquet file.
+
+    kind is a label for what the table holds (e.g. 'detections' or 'data'),
+    it is checked when loading.
+    """
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    metadata = dict(table.schema.metadata or {})
+    metadata[_METADATA_KEY] = json.dumps({
+        'schema_version': SCHEMA_VERSION,
+        'kind': kind,
+        }).encode()
+
+    table = table.replace_schema_metadata(metadata)
+
+    pq.write_table(table, str(path), compression=compression)
+
+
+def read_info(path):
+    """
+    Get the schema version and kind of a saved table (only reads the footer)
+    """
+
+    metadata = pq.read_schema(str(path), memory_map=True).metadata or {}
+
+    if _METADATA_KEY not in metadata:
+        raise ValueError("{} wasn't saved by maui63_postprocessing".format(path))
+
+    return json.loads(metadata[_METADATA_KEY])
+
+
+def load_table(path, kind: str = None, columns: list = None):
+    """
+    Load a DataFrame saved with save_table (optionally only some columns).
+    """
+
+    info = read_info(path)
+
+    if info['schema_version'] > SCHEMA_VERSION:
+        raise ValueError(
+            "{} uses schema version {}, this version of the package only "
+            "reads up to version {}".format(path, info['schema_version'],
+                                            SCHEMA_VERSION))
+
+    if kind is not None and info['kind'] != kind:
+        raise ValueError("{} holds a '{}' table, expected '{}'".format(
+            path, info['kind'], kind))
+
+    table = pq.read_table(str(path), columns=columns, memory_map=True)
+    df = table.to_pandas()
+
+    # pyarrow gives numpy arrays for the list cells, back to lists as saved
+    for name in table.column_names:
+        if _is_list(table.schema.field(name).type):
+            df[name] = table.column(name).to_pylist()
+
+    return df
+
+
+def _is_list(type):
+    return pa.types.is_list(type) or pa.types.is_large_list(type) or \
+        pa.types.is_fixed_size_list(type)
@@ -0,0 +1,115 @@
+"""
+Clock synchronization between the media and the UAV telemetry.
+
+The merge needs the unix time (telemetry clock) of the media's first frame.
+It can come from the onboard cv log (written by the UAV's computer while
+filming), from the video container's creation time or, as before, from the
+start of the telemetry. A user offset corrects for a known clock error.
+"""
+
+import warnings
+import numpy as np
+
+from maui63_postprocessing.videoedit.ffmpeg import creation_time
+
+SYNC_METHODS = ['auto', 'cv_log', 'creation_time', 'telemetry']
+
+
+def _presence(times, start, resolution, length = None):
+    # 1 for each bin with a detection, 0 otherwise, then zero mean so
+    # detections on one side only count against a lag
+    bins = np.floor((np.asarray(times) - start) / resolution).astype(np.int64)
+    if length is None:
+        length = bins.max() + 1 if len(bins) > 0 else 0
+
+    series = np.zeros(length)
+    series[bins[(bins >= 0) & (bins < length)]] = 1
+
+    return series - series.mean() if length > 0 else series
+
+
+def cv_log_start(cv_lines,            # read_cv_log lines (datetime_utc, num)
+                 detections = None,   # our detections (timestamp from the start of the media)
+                 resolution: float = 1,  # seconds (the cv log has whole seconds)
+                 ):
+    """
+    Unix time of the start of the media according to the onboard cv log.
+
+    With detections, the seconds with detections in the log and in the media
+    are cross-correlated and the best lag is used. Otherwise (or if nothing
+    lines up) the media is assumed to start with the log.
+    """
+
+    log_times = cv_lines['datetime_utc'].to_numpy(np.float64)
+    assert len(log_times) > 0, "The cv log is empty"
+
+    log_start = log_times.min()
+
+    if detections is None or len(detections) == 0 or not (cv_lines['num'] > 0).any():
+        return log_start
+
+    log = _presence(log_times[cv_lines['num'].to_numpy() > 0], log_start, resolution,
+                    length = int((log_times.max() - log_start) // resolution) + 1)
+    media = _presence(detections['timestamp'].to_numpy(np.float64), 0, resolution)
+
+    # correlation at every lag (media bin m <-> log bin m + lag), with ffts
+    size = len(log) + len(media) - 1
+    correlation = np.fft.irfft(np.fft.rfft(log, size) *
+                               np.fft.rfft(media[::-1], size), size)
+
+    best = np.argmax(correlation)
+    if correlation[best] <= 1e-9:
+        warnings.warn('The cv log and the detections do not line up, '
+                      'using the start of the cv log')
+        return log_start
+
+    lag = best - (len(media) - 1)
+
+    return log_start + lag * resolution
+
+
+def estimate_media_start(uav_times,              # telemetry unix times
+                         media: str = None,      # video file (for its creation time)
+                         cv_lines = None,        # onboard cv log lines (see read_cv_log)
+                         detections = None,      # detections (to line up with the cv log)
+                         method: str = 'auto',   # one of SYNC_METHODS
+                         ):
+    """
+    Unix time of the start of the media in the telemetry clock.
+
+    'auto' tries the cv log, then the video creation time, then the start of
+    the telemetry, skipping estimates outside of the telemetry.
+
+    Returns (media_start_time, method used).
+    """
+
+    assert method in SYNC_METHODS, \
+        "Invalid method, valid options are: {}".format(SYNC_METHODS)
+
+    uav_times = np.asarray(uav_times, dtype = np.float64)
+    first, last = uav_times.min(), uav_times.max()
+
+    estimates = {
+        'cv_log': lambda: cv_log_start(cv_lines, detections)
+            if cv_lines is not None and len(cv_lines) > 0 else None,
+        'creation_time': lambda: creation_time(media) if media is not None else None,
+        'telemetry': lambda: first,
+        }
+
+    if method != 'auto':
+        start = estimates[method]()
+        assert start is not None, "No {} to synchronize with".format(method)
+        return start, method
+
+    for method in ['cv_log', 'creation_time', 'telemetry']:
+        start = estimates[method]()
+
+        if start is None:
+            continue
+
+        if method != 'telemetry' and not first <= start <= last:
+            warnings.warn('The {} start ({}) is outside of the telemetry '
+                          '({} - {}), ignoring it'.format(method, start, first, last))
+            continue
+
+        return start, method
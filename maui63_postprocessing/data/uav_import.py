@@ -1,87 +1,283 @@
 from __future__ import annotations
 from typing import Union
 
-import time
+import io
+import re
+import numpy as np
 import pandas as pd
 from moviepy.video.VideoClip import VideoClip
 from moviepy.editor import VideoFileClip
-import datetime
-from tqdm import tqdm
 
+CV_LOG_DATEFORMAT = "%Y.%m.%d %H.%M.%S"
+CV_LOG_OBJECT_KEYS = ['prob', 'lat', 'lon']  # values logged for each object
 
-class Maui63UAVImporter:
+UAV_LOG_COLUMNS = ['unix_time', 'UAV lat', 'UAV long']  # used by the merge and exports
+UAV_LOG_DTYPES = {'unix_time': np.float64}  # float32 can't hold unix times
+
+
+def _is_key(column, key):
+    # compare the categories instead of every value
+    categories = np.asarray(column.cat.categories.astype(str).str.strip())
+    return np.isin(column.cat.codes.to_numpy(), np.flatnonzero(categories == key))
+
+
+def _parse_cv_dates(dates):
+    """
+    Seconds since the epoch (UTC) of CV_LOG_DATEFORMAT dates
+    """
+    
+    # the dates are fixed width (yyyy.mm.dd HH.MM.SS), so the fields are 
+    # at the same place in every line
+    chars = np.asarray(dates.to_numpy(dtype=str), dtype='S19')
+    chars = chars.view(np.uint8).reshape(len(chars), 19)
+    digits = chars.astype(np.int64) - ord('0')
+    
+    def number(*positions):
+        value = 0
+        for i in positions:
+            value = value * 10 + digits[:, i]
+        return value
+    
+    year, month, day = number(0, 1, 2, 3), number(5, 6), number(8, 9)
+    hour, minute, second = number(11, 12), number(14, 15), number(17, 18)
+    
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    month_days = ((months + 1).astype('datetime64[D]') -
+                  months.astype('datetime64[D]')).astype(np.int64)
+    
+    fields = digits[:, [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]]
+    
+    valid = ((fields >= 0) & (fields <= 9)).all() and \
+        (chars[:, [4, 7, 13, 16]] == ord('.')).all() and \
+        (chars[:, 10] == ord(' ')).all() and \
+        (dates.str.strip().str.len() == 19).all() and \
+        ((month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days) &
+         (hour < 24) & (minute < 60) & (second < 60)).all()
+    
+    if not valid:
+        # let pandas parse (or complain about) anything else
+        datetimes = pd.to_datetime(dates.str.strip(), format=CV_LOG_DATEFORMAT,
+                                   utc=True)
+        return (datetimes - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy()
+    
+    days = months.astype('datetime64[D]').astype(np.int64) + day - 1
+    
+    return (days * 86400 + hour * 3600 + minute * 60 + second).astype(np.float64)
+
+
+def read_cv_log(logfile: str):
+    """
+    Parse an onboard cv log, lines like:
+    
+        2021.01.27 10.31.05 ,num=2,prob=0.9,lat=-36.8,lon=174.7,prob=...
+    
+    The whole file is tokenized at once by the pandas csv parser.
+    
+    Returns (lines, detections), the lines table has one row per log line 
+    (datetime_utc, num) and the detections table one row per object 
+    (line, datetime_utc, prob, lat, lon). Values that aren't numbers are NaN.
+    """
+    
+    with open(logfile, 'r') as f:
+        text = f.read()
+    
+    if text.strip() == '':
+        lines = pd.DataFrame({'datetime_utc': np.zeros(0), 
+                              'num': np.zeros(0, dtype=np.int64)})
+        detections = pd.DataFrame({'line': np.zeros(0, dtype=np.int64),
+                                   'datetime_utc': np.zeros(0),
+                                   **{key: np.zeros(0) for key in CV_LOG_OBJECT_KEYS}})
+        return lines, detections
+    
+    # key=value pairs become two fields, empty fields are dropped so the 
+    # objects line up
+    text = text.replace('=', ',')
+    if ',,' in text:
+        text = re.sub(',,+', ',', text)
+    
+    # the parser needs the number of fields of the longest line
+    buffer = np.frombuffer(text.encode(), dtype=np.uint8)
+    commas = np.flatnonzero(buffer == ord(','))
+    line_ends = np.append(np.flatnonzero(buffer == ord('\n')), len(buffer))
+    num_fields = np.diff(np.searchsorted(commas, line_ends), prepend=0).max() + 1
+    
+    # fields: datetime, 'num', num, then 'prob', prob, 'lat', lat, 'lon', lon
+    # for each object
+    keys = {i: 'category' for i in range(1, num_fields, 2)}
+    df = pd.read_csv(io.StringIO(text), header=None,
+                     names=range(max(num_fields, 3)),
+                     dtype={**keys, 0: str}, skipinitialspace=True)
+    
+    assert _is_key(df[1], 'num').all(), \
+        "Expected num= after the date in every line"
+    
+    lines = pd.DataFrame({
+        'datetime_utc': _parse_cv_dates(df[0]),
+        'num': df[2].to_numpy(np.int64),
+        })
+    
+    # gather the i-th object of every line with at least i+1 objects
+    num = lines['num'].to_numpy()
+    line_idxs, slots, values = [], [], {key: [] for key in CV_LOG_OBJECT_KEYS}
+    for i in range(num.max() if len(num) > 0 else 0):
+        rows = np.flatnonzero(num > i)
+        line_idxs.append(rows)
+        slots.append(np.full(len(rows), i))
+        
+        for j, key in enumerate(CV_LOG_OBJECT_KEYS):
+            column = 3 + 2 * (len(CV_LOG_OBJECT_KEYS) * i + j)  # key, then value
+            
+            assert _is_key(df[column].iloc[rows], key).all(), \
+                "Expected {}= for object {} (line {})".format(key, i, rows[0])
+            
+            values[key].append(pd.to_numeric(df[column + 1].iloc[rows],
+                                             errors='coerce').to_numpy(np.float64))
+    
+    line_idxs = np.concatenate(line_idxs) if line_idxs else np.zeros(0, dtype=int)
+    slots = np.concatenate(slots) if slots else np.zeros(0, dtype=int)
+    
+    # in log order
+    order = np.lexsort((slots, line_idxs))
+    
+    detections = pd.DataFrame({
+        'line': line_idxs[order].astype(np.int64),
+        'datetime_utc': lines['datetime_utc'].to_numpy()[line_idxs[order]],
+        **{key: np.concatenate(values[key])[order] if values[key] else
+           np.zeros(0) for key in CV_LOG_OBJECT_KEYS},
+        })
+    
+    return lines, detections
+
+
+def cv_log_line_view(lines, detections):
+    """
+    One row per log line with lists of the objects' prob, lat and lon 
+    """
+    
+    ends = np.cumsum(lines['num'].to_numpy())
+    starts = ends - lines['num'].to_numpy()
     
+    df = lines.copy()
+    for key in CV_LOG_OBJECT_KEYS:
+        values = detections[key].tolist()
+        df[key] = [values[start:end] for start, end in zip(starts, ends)]
+    
+    return df
+
+
+def _downcast(column):
+    # smaller types only where no value changes
+    if column.dtype.kind in 'iu':
+        return pd.to_numeric(column, downcast = 'integer')
+
+    if column.dtype.kind == 'f' and column.dtype.itemsize > 4:
+        values = column.to_numpy()
+        small = values.astype(np.float32)
+        if np.array_equal(small, values, equal_nan = True):
+            return pd.Series(small, index = column.index, name = column.name)
+
+    return column
+
+
+def _downcast_frame(df, keep):
+    # the columns with an explicit dtype are kept as they are
+    return pd.DataFrame({name: df[name] if name in keep else _downcast(df[name])
+                         for name in df.columns})
+
+
+def read_uav_log(logfile,
+                 columns: list = None,  # columns to read (headers without spaces), None for all
+                 dtype: dict = None,    # {column: dtype} on top of UAV_LOG_DTYPES
+                 chunksize: int = None, # rows parsed at a time, None for all at once
+                 downcast: bool = True, # smallest types that hold the values exactly (not the dtype columns)
+                 ):
+    """
+    Read the UAV telemetry log. The spaces around the headers are removed
+    (' UAV lat' -> 'UAV lat').
+
+    With a chunksize, only one chunk is held at its full size next to the
+    (downcast) columns already read.
+    """
+
+    # map the normalized headers to the ones in the file
+    header = pd.read_csv(logfile, nrows = 0, skipinitialspace = True).columns
+    names = {str(name).strip(): name for name in header}
+
+    if columns is None:
+        columns = list(names)
+    missing = [column for column in columns if column not in names]
+    assert len(missing) == 0, \
+        "Columns not in the UAV log: {} (found {})".format(missing, list(names))
+
+    dtype = {**UAV_LOG_DTYPES, **(dtype if dtype is not None else {})}
+
+    reader = pd.read_csv(logfile,
+                         usecols = [names[column] for column in columns],
+                         dtype = {names[column]: value for column, value
+                                  in dtype.items() if column in columns},
+                         skipinitialspace = True,
+                         chunksize = chunksize)
+
+    chunks = [reader] if chunksize is None else reader
+
+    parts = []
+    for chunk in chunks:
+        chunk.columns = [str(name).strip() for name in chunk.columns]
+        if downcast:
+            chunk = _downcast_frame(chunk, keep = dtype)
+        parts.append(chunk[columns])
+
+    if len(parts) == 1:
+        return parts[0]
+
+    df = pd.concat(parts, ignore_index = True)
+
+    if downcast:
+        # a chunk can fit a smaller type than the others
+        df = _downcast_frame(df, keep = dtype)
+
+    return df
+
+
+class Maui63UAVImporter:
+
     def __init__(self,
-                 logfile: str = None, 
+                 logfile: str = None,
                  # delimiter: str = ',',
                  # cv_dateformat: str = "%Y.%m.%d %H.%M.%S ",
                  cv_logfile: str = None,
+                 **log_kwargs,  # read_uav_log arguments (columns, dtype, chunksize, downcast)
                  ):
-        
+
         if logfile != None:
             print('Importing logs...')
-            self.df = pd.read_csv(logfile)
+            self.df = read_uav_log(logfile, **log_kwargs)
         
         # if we'd like the cv logs imported (not sure why but I've coded it already)
         if cv_logfile != None:
-            self.cv_df = self._import_cv_logs(cv_logfile)
+            self._import_cv_logs(cv_logfile)
         
         
     def _import_cv_logs(self, logfile):
         
-        print('Importing cv logs:')
-        time.sleep(0.5)
+        print('Importing cv logs...')
         
-        lines = []
-        f = open(logfile, "r")
-        while(True):
-        	#read next line
-        	line = f.readline()
-        	#check if line is not null
-        	if not line:
-        		break
-        	#you can access the line
-        	lines.append(line.strip())
-            
-        columns = ['datetime_utc', 'num', 'prob', 'lat', 'lon']
-        df = pd.DataFrame(columns = columns)
+        # one row per log line / per detection
+        self.cv_lines, self.cv_detections = read_cv_log(logfile)
+        self._cv_df = None
         
-        startidx = 2  # start at prob
-        numpara = 3  # number of parameters per object
+    @property
+    def cv_df(self):
+        """
+        One row per cv log line with lists of the objects' values (built the
+        first time it's used, use cv_detections where possible)
+        """
         
-        for line in tqdm(lines):
-            values = [x for x in line.split(',') if x != '']
-            
-            out = [None] * len(columns)
-            
-            out[0] = datetime.datetime.strptime(values[0].strip(), "%Y.%m.%d %H.%M.%S")
-            out[0] = out[0].replace(tzinfo=datetime.timezone.utc).timestamp()
-            
-            num = [x.strip() for x in values[1].split('=')]
-            assert num[0].lower() == 'num'
-            out[1] = int(num[1])
-            
-            for j in range(numpara):
-                out[startidx+j] = []
-            
-            for i in range(out[1]):
-                
-                for j in range(numpara):
-                    para = values[startidx + i * numpara + j]
-                    para = [x.strip() for x in para.split('=')]
-                    
-                    assert para[0] == columns[startidx+j]
-                    
-                    try:
-                        out[startidx+j].append(float(para[1]))
-                    except ValueError:
-                        out[startidx+j].append(para[1])
-                    
-            # append to dataframe
-            series = pd.Series(dict(zip(df.columns, out)))
-            df = df.append(series, ignore_index=True)
-            
-        return df
+        if self._cv_df is None:
+            self._cv_df = cv_log_line_view(self.cv_lines, self.cv_detections)
+        
+        return self._cv_df
+
 
 class Maui63UAVVideoImporter(Maui63UAVImporter):
     
@@ -1 +1,2 @@
-from .type_utils import *
\ No newline at end of file
+from .type_utils import *
+from .records import RecordBuilder
\ No newline at end of file
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+
+class RecordBuilder:
+    """
+    Collects rows into growable column arrays and builds the DataFrame once
+    at the end.
+
+    Appending to a DataFrame row by row copies the whole table every time
+    (O(n^2)), this is amortized O(1) per row.
+
+    Columns without a dtype are object columns (e.g. for lists). Columns
+    left out of a row (or None) are empty: NaN for float columns, None for
+    object columns, other types (e.g. int, bool) need a value.
+    """
+
+    def __init__(self,
+                 columns: list,
+                 dtypes: dict = None,   # column -> numpy dtype
+                 capacity: int = 1024,  # initial number of rows
+                 ):
+
+        if dtypes is None:
+            dtypes = {}
+
+        self.columns = list(columns)
+        self.dtypes = {column: np.dtype(dtypes.get(column, object))
+                       for column in self.columns}
+
+        self._data = {column: np.empty(max(capacity, 1), dtype=self.dtypes[column])
+                      for column in self.columns}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return len(self._data[self.columns[0]]) if self.columns else 0
+
+    def _reserve(self, size):
+        if size <= self.capacity:
+            return
+
+        # double the capacity so the copies are amortized
+        capacity = max(size, 2 * self.capacity)
+        for column, values in self._data.items():
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[:self._size] = values[:self._size]
+            self._data[column] = grown
+
+    def _empty(self, column):
+        # value of a column left out of a row
+        dtype = self.dtypes[column]
+        if dtype == object:
+            return None
+        if dtype.kind in 'fc':
+            return np.nan
+        if dtype.kind in 'mM':
+            return dtype.type('NaT')
+
+        raise ValueError("No value for the '{}' column, {} columns can't be "
+                         "left empty".format(column, dtype))
+
+    def append(self, row: dict):
+        """
+        Add a single row (missing columns are left empty, see above)
+        """
+
+        self._reserve(self._size + 1)
+
+        for column in self.columns:
+            value = row.get(column)
+            if value is None:
+                value = self._empty(column)
+            self._data[column][self._size] = value
+
+        self._size += 1
+
+    def extend(self, rows: dict):
+        """
+        Add several rows at once from column -> values (scalars are broadcast,
+        missing columns are left empty)
+        """
+
+        lengths = {column: len(values) for column, values in rows.items()
+                   if not np.isscalar(values) and values is not None}
+        n = max(lengths.values()) if lengths else 0
+
+        for column, length in lengths.items():
+            assert length == n, \
+                "The '{}' column has {} values, expected {} (or a scalar)".format(
+                    column, length, n)
+
+        if n == 0:
+            return
+
+        self._reserve(self._size + n)
+
+        for column in self.columns:
+            values = rows.get(column)
+            if values is None:
+                values = self._empty(column)
+            target = self._data[column][self._size:self._size + n]
+
+            if target.dtype == object and not np.isscalar(values) and values is not None:
+                # assign one by one so list cells aren't broadcast
+                for i, value in enumerate(values):
+                    target[i] = value
+            else:
+                target[:] = values
+
+        self._size += n
+
+    def to_frame(self):
+        """
+        Build the DataFrame (the data is copied so the builder can be reused)
+        """
+
+        return pd.DataFrame({column: values[:self._size].copy()
+                             for column, values in self._data.items()},
+                            columns = self.columns)
@@ -0,0 +1,266 @@
+"""
+Small helpers around the ffmpeg binary (the one shipped with moviepy's
+imageio-ffmpeg dependency unless FFMPEG_BINARY is set).
+"""
+
+import os
+import re
+import datetime
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def get_ffmpeg():
+    """
+    Path to the ffmpeg executable
+    """
+
+    if os.environ.get('FFMPEG_BINARY'):
+        return os.environ['FFMPEG_BINARY']
+
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def _ffmpeg_cmd(args):
+    return [get_ffmpeg(), '-y', '-hide_banner', '-loglevel', 'error'] + list(args)
+
+
+def run_ffmpeg(args):
+    """
+    Run ffmpeg with the given arguments, raises a RuntimeError with ffmpeg's
+    output if it fails.
+    """
+
+    cmd = _ffmpeg_cmd(args)
+
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    if result.returncode != 0:
+        raise RuntimeError('ffmpeg failed ({}):\n{}'.format(
+            ' '.join(cmd), result.stderr.decode(errors='replace')))
+
+
+def concat_videos(files: list, output_file: str):
+    """
+    Join videos with the same codec/size end to end without re-encoding
+    """
+
+    # ffmpeg's concat demuxer reads the file list from a text file
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        for file in files:
+            path = os.path.abspath(file).replace("'", "'\\''")
+            f.write("file '{}'\n".format(path))
+        list_file = f.name
+
+    try:
+        run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', list_file,
+                    '-c', 'copy', str(output_file)])
+    finally:
+        os.remove(list_file)
+
+
+def creation_time(video: str):
+    """
+    Container creation time of a video (unix time), None if it has none.
+    Times without a timezone are taken as UTC.
+    """
+
+    # without an output file ffmpeg prints the file's info and exits
+    result = subprocess.run([get_ffmpeg(), '-hide_banner', '-i', str(video)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    match = re.search(r'creation_time\s*:\s*(\S+)',
+                      result.stderr.decode(errors='replace'))
+    if match is None:
+        return None
+
+    try:
+        date = datetime.datetime.fromisoformat(match.group(1))
+    except ValueError:
+        return None
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+
+    return date.timestamp()
+
+
+# encoder for each output file extension
+FFMPEG_CODECS = {
+    '.mp4': 'libx264',
+    '.m4v': 'libx264',
+    '.mov': 'libx264',
+    '.mkv': 'libx264',
+    '.webm': 'libvpx-vp9',
+    '.avi': 'mjpeg',
+    }
+
+
+def _quality_args(codec, quality):
+    """
+    ffmpeg arguments for a 0-100 quality (higher is better)
+    """
+
+    if quality is None:
+        return []
+
+    assert 0 <= quality <= 100, "quality must be between 0 and 100"
+
+    if codec in ('libx264', 'libx265'):
+        return ['-crf', str(round(40 - quality / 4))]       # 40 (worst) to 15
+    if codec == 'libvpx-vp9':
+        return ['-crf', str(round(50 - quality * 0.3)), '-b:v', '0']
+    return ['-q:v', str(round(31 - quality * 0.29))]        # 31 (worst) to 2
+
+
+def _encoder_args(codec, quality = None, preset = 'veryfast'):
+    """
+    ffmpeg output arguments to encode with codec
+    """
+
+    args = ['-c:v', codec] + _quality_args(codec, quality)
+
+    if codec in ('libx264', 'libx265'):
+        args += ['-preset', preset]
+    elif codec == 'libvpx-vp9':
+        # vp9's default settings are far too slow to keep up
+        args += ['-deadline', 'realtime', '-cpu-used', '8', '-row-mt', '1']
+    if codec != 'mjpeg':
+        # most players only handle 4:2:0
+        args += ['-pix_fmt', 'yuv420p']
+
+    return args
+
+
+class FFmpegWriter:
+    """
+    Drop-in for cv2.VideoWriter (write/release) that pipes the raw frames to
+    an ffmpeg process, so the encoding runs on other cores and any codec
+    ffmpeg has can be used (by default picked from the file extension).
+    """
+
+    def __init__(self,
+                 output_file: str,
+                 fps: float,
+                 size: tuple,           # (width, height)
+                 codec: str = None,     # ffmpeg encoder (defaults to FFMPEG_CODECS)
+                 quality: float = None,  # 0-100, defaults to the encoder's default
+                 preset: str = 'veryfast',  # x264 speed/size trade-off
+                 ):
+
+        extension = os.path.splitext(str(output_file))[1].lower()
+        if codec is None:
+            codec = FFMPEG_CODECS.get(extension, 'libx264')
+
+        self.output_file = str(output_file)
+        self.size = tuple(size)
+
+        args = ['-f', 'rawvideo', '-pix_fmt', 'bgr24',
+                '-s', '{}x{}'.format(*self.size), '-r', str(fps),
+                '-i', '-', '-an']
+        args += _encoder_args(codec, quality, preset)
+        args.append(self.output_file)
+
+        self.process = subprocess.Popen(_ffmpeg_cmd(args),
+                                        stdin=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+
+    def write(self, frame):
+        assert (frame.shape[1], frame.shape[0]) == self.size, \
+            "Frame size {} doesn't match the video size {}".format(
+                (frame.shape[1], frame.shape[0]), self.size)
+
+        try:
+            self.process.stdin.write(frame.tobytes())
+        except BrokenPipeError:
+            self.release()
+
+    def release(self):
+        """
+        Finish the file (raises a RuntimeError if ffmpeg failed)
+        """
+
+        if self.process is None:
+            return
+
+        process = self.process
+        self.process = None
+
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+        error = process.stderr.read()
+        process.wait()
+
+        if process.returncode != 0:
+            raise RuntimeError('ffmpeg failed writing {}:\n{}'.format(
+                self.output_file, error.decode(errors='replace')))
+
+
+def _cut_clip(video, start, end, output_file, exact, codec, quality,
+              threads):
+    t0 = time.perf_counter()
+
+    # seeking before the input is fast (and exact when re-encoding)
+    args = ['-ss', '{:.6f}'.format(start), '-i', str(video),
+            '-t', '{:.6f}'.format(end - start),
+            '-map', '0:v:0', '-map', '0:a?']
+
+    if exact:
+        if codec is None:
+            extension = os.path.splitext(str(output_file))[1].lower()
+            codec = FFMPEG_CODECS.get(extension, 'libx264')
+
+        args += _encoder_args(codec, quality) + ['-c:a', 'copy']
+        args += ['-threads', str(threads)]
+    else:
+        args += ['-c', 'copy', '-avoid_negative_ts', 'make_zero']
+
+    args.append(str(output_file))
+
+    run_ffmpeg(args)
+
+    return time.perf_counter() - t0
+
+
+def cut_clips(video: str,
+              segments: list,         # (start, end) times in seconds
+              output_files: list,
+              exact: bool = False,    # re-encode for frame exact cuts
+              codec: str = None,      # ffmpeg encoder if exact (defaults to FFMPEG_CODECS)
+              quality: float = None,  # 0-100 if exact
+              workers: int = 1,       # clips cut at the same time
+              ):
+    """
+    Cut segments of a video into separate files.
+
+    By default the clips are stream copied (no decoding or encoding, so it
+    takes about as long as copying the data) and each one starts on the
+    keyframe at or before its start time. With exact they're re-encoded
+    so they start on the exact frame.
+
+    Each clip is cut by its own ffmpeg process, up to workers at a time
+    (keep it low for stream copies, they're limited by the disk).
+
+    Returns the time each clip took in seconds.
+    """
+
+    assert len(segments) == len(output_files), \
+        "There must be one output file per segment"
+    assert workers >= 1, "workers must be at least 1"
+
+    # share the cores between the encoders
+    threads = max((os.cpu_count() or 1) // workers, 1)
+
+    # the threads only wait on the ffmpeg processes
+    with ThreadPoolExecutor(workers) as pool:
+        futures = [pool.submit(_cut_clip, video, start, end, output_file,
+                               exact, codec, quality, threads)
+                   for (start, end), output_file in zip(segments, output_files)]
+
+        return [future.result() for future in futures]
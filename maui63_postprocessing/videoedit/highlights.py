@@ -6,6 +6,54 @@ from moviepy.editor import VideoFileClip
 import numpy as np
 
 import warnings
+from collections import deque
+
+
+def group_points_of_interest(times,
+                             max_spacing: float,  # spacing between events before a new group
+                             clip_length: float,  # max group length (from its first event)
+                             ):
+    """
+    Group ids of sorted times (0, 1, ...). A new group starts after a gap of
+    max_spacing or once a time is clip_length after the group's first one.
+    """
+    
+    times = np.asarray(times, dtype=np.float64)
+    n = len(times)
+    
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    
+    # new groups after the gaps
+    new = np.ones(n, dtype=bool)
+    new[1:] = times[1:] >= times[:-1] + max_spacing
+    
+    # split the runs longer than clip_length, a group at a time starting
+    # from the first one of each run (same as going through the times)
+    starts = np.flatnonzero(new)
+    ends = np.append(starts[1:], n)
+    long = times[ends - 1] - times[starts] >= clip_length
+    current, ends = starts[long], ends[long]
+    
+    while len(current) > 0:
+        first = times[current]
+        split = times.searchsorted(first + clip_length)
+        
+        # first + clip_length is rounded, step over a value if that's wrong
+        down = times[split - 1] - first >= clip_length
+        if down.any():
+            split[down] = times.searchsorted(times[split[down] - 1], 'left')
+        up = times[np.minimum(split, n - 1)] - first < clip_length
+        up &= split < n
+        if up.any():
+            split[up] = times.searchsorted(times[split[up]], 'right')
+        
+        inside = split < ends
+        current, ends = split[inside], ends[inside]
+        new[current] = True
+    
+    return np.cumsum(new) - 1
+
 
 class Highlighter:
     
@@ -38,52 +86,57 @@ class Highlighter:
             "Padding is too large for clip length (padding < clip_length/2)"
         self.clip_length = clip_length
         
+    def find_highlights(self, max_spacing = None):
+        """
+        Group the points of interest into highlights.
+        
+        Returns a record array of (start, end, group_id) with one row per 
+        highlight, and the group id of each of self.times.
+        """
+        
+        if max_spacing == None:
+            max_spacing = self.max_spacing_before_merge
+        
+        times = self.times
+        group_ids = group_points_of_interest(times, max_spacing, self.clip_length)
+        
+        # times are sorted, so the groups are contiguous
+        first = np.flatnonzero(np.diff(group_ids, prepend=-1))
+        last = np.append(first[1:], len(times))[:len(first)] - 1
+        
+        start = np.maximum(times[first] - self.padding, 0)
+        end = np.minimum(times[last] + self.padding, self.video.duration)
+        
+        valid = start < end
+        if not valid.all():
+            warnings.warn('Time groups are invalid (past the end of the video): '
+                          + str(times[first[~valid]].tolist()))
+        
+        highlights = np.rec.fromarrays(
+            [start[valid], end[valid], np.flatnonzero(valid)],
+            dtype = [('start', np.float64), ('end', np.float64),
+                     ('group_id', np.int64)])
+        
+        return highlights, group_ids
+        
     def merge_points_of_interest(self, max_spacing = None):
         """
         A simple class to merge point of interest clips
+        
+        Returns the (start, end) of the highlights and the list of times in 
+        each group (see find_highlights for arrays, and the group of each 
+        highlight when some are invalid).
         """
         
-        # TODO: Add max bin length
+        highlights, group_ids = self.find_highlights(max_spacing)
         
-        if max_spacing == None:
-            max_spacing = self.max_spacing_before_merge
+        splits = np.flatnonzero(np.diff(group_ids)) + 1
+        time_groups = [group.tolist() for group in np.split(self.times, splits)] \
+            if len(self.times) > 0 else []
+        
+        highlight_times = list(zip(highlights.start.tolist(),
+                                   highlights.end.tolist()))
         
-        highlight_times = []
-        
-        time_groups = []
-        for i, time in enumerate(self.times):
-            # If it's outside the padding distance then new group
-            # Also check if the clip has gotten too long
-            if i == 0 or time >= self.times[i-1] + max_spacing \
-                or (len(time_groups) > 0 and
-                    time - time_groups[-1][0] >= 
-                    self.clip_length):
-                    
-                time_groups.append([time])
-                
-            # If within padding distance same group
-            else:
-                time_groups[-1].append(time)
-            
-        # Find the clip start_ends
-        # TODO: Fix first clip being short?
-        for group in time_groups:
-            
-            start = np.min(group) - self.padding
-            end = np.max(group) + self.padding
-            
-            if start <= 0:
-                start = 0
-            if end >= self.video.duration:
-                end = self.video.duration
-                
-            if start >= end:
-                warnings.warn('Time group is invalid: ' + str(group))
-                continue  # Skip this entry
-            
-            highlight_times.append((start, end))
-                
-            
         return highlight_times, time_groups
         
     def create_subclip(self, start, end):
@@ -110,6 +163,209 @@ class Highlighter:
         return clips, groups
 
 
+class HighlightGrouper:
+    """
+    Groups points of interest into highlights as they come in, for videos
+    that are still being processed (e.g. streams). Uses the same rules as
+    Highlighter.merge_points_of_interest.
+
+    The end of the video isn't known, so the highlights aren't clipped to it.
+    """
+
+    def __init__(self,
+                 padding: float = 10,  # padding before and after points of interest
+                 max_spacing_before_merge: float = None,  # spacing between events before clips are merged
+                 clip_length: float = 30,  # Clip length excluding padding
+                 ):
+
+        assert clip_length > padding * 2, \
+            "Padding is too large for clip length (padding < clip_length/2)"
+
+        self.padding = padding
+        self.clip_length = clip_length
+
+        if max_spacing_before_merge == None:
+            self.max_spacing_before_merge = padding
+        else:
+            self.max_spacing_before_merge = max_spacing_before_merge
+
+        self.group = []  # times in the current group
+
+    def _closes(self, time):
+        # no point of interest at or after time can join the current group
+        return len(self.group) > 0 and (
+            time >= self.group[-1] + self.max_spacing_before_merge or
+            time - self.group[0] >= self.clip_length)
+
+    def _highlight(self):
+        group = self.group
+        self.group = []
+
+        start = max(group[0] - self.padding, 0)
+        end = group[-1] + self.padding
+
+        return start, end, group
+
+    def update(self, time: float, detected: bool = True):
+        """
+        Add the video time reached (and if it's a point of interest).
+
+        Returns the list of (start, end, group) highlights that are complete.
+        """
+
+        highlights = []
+        if self._closes(time):
+            highlights.append(self._highlight())
+
+        if detected:
+            self.group.append(time)
+
+        return highlights
+
+    def finish(self):
+        """
+        End of the video, returns the last highlights
+        """
+
+        return [self._highlight()] if len(self.group) > 0 else []
+
+
+class _Clip:
+    # a highlight clip being recorded
+
+    def __init__(self, start, filename, writer):
+        self.start = start
+        self.end = None       # known once the group is complete
+        self.filename = filename
+        self.writer = writer
+        self.pending = []     # frames past the current end (if the group grows)
+
+
+class HighlightRecorder:
+    """
+    Writes the highlight clips while the video is being processed, instead
+    of cutting them out of a tagged copy of the whole video afterwards.
+
+    The frames are passed in order with whether they have detections. They
+    are grouped the same way as HighlightGrouper, the last padding seconds
+    of frames are kept in a ring buffer for the start of the clips.
+
+    The clips hold the same frames as cut_clips(exact = True) cutting the
+    highlights out of process_video's tagged video.
+    """
+
+    def __init__(self,
+                 filename,             # filename(time) for a clip starting with a detection at time
+                 fps: float,
+                 padding: float = 10,  # padding before and after points of interest
+                 max_spacing_before_merge: float = None,  # spacing between events before clips are merged
+                 clip_length: float = 30,  # Clip length excluding padding
+                 encoder: str = 'opencv',  # 'opencv' or 'ffmpeg' (see cv.pipeline.FrameWriter)
+                 quality: float = None,    # 0-100
+                 ):
+
+        self.grouper = HighlightGrouper(padding = padding,
+                                        max_spacing_before_merge = max_spacing_before_merge,
+                                        clip_length = clip_length)
+
+        self.filename = filename
+        self.fps = fps
+        self.padding = padding
+        self.encoder = encoder
+        self.quality = quality
+
+        self.buffer = deque(maxlen = int(np.ceil(padding * fps)) + 1)
+        self.clips = []       # clips being recorded
+        self.highlights = []  # (start, end, group, filename) of the finished clips
+        self._group_clip = None  # clip of the grouper's current group
+        self._time = None        # time of the last frame
+
+    def _reached(self, time, t):
+        # whether the frame at time is at or past t in the tagged video,
+        # which starts with the frame at 1/fps (the first one is skipped)
+        return round(time * self.fps) - 1 >= t * self.fps - 1e-6
+
+    def _start_clip(self, time):
+        # import here, cv imports this module
+        from maui63_postprocessing.cv.pipeline import FrameWriter
+
+        start = max(time - self.padding, 0)
+
+        writer = FrameWriter(self.filename(time), self.fps,
+                             encoder = self.encoder, quality = self.quality)
+        writer.start()
+
+        clip = _Clip(start, writer.output_file, writer)
+        for buffered_time, frame in self.buffer:
+            if self._reached(buffered_time, start):
+                clip.writer.write(frame)
+
+        self.clips.append(clip)
+        self._group_clip = clip
+
+    def _end_clip(self, start, end, group):
+        clip = self._group_clip
+        self._group_clip = None
+
+        clip.end = end
+        self.highlights.append((clip.start, end, group, clip.filename))
+
+    def _close(self, clip):
+        self.clips.remove(clip)
+        clip.writer.close()
+
+    def write(self, time: float, frame, detected: bool = False):
+        """
+        Add the next frame of the video
+        """
+
+        for highlight in self.grouper.update(time, detected):
+            self._end_clip(*highlight)
+
+        if detected:
+            if self._group_clip is None:
+                self._start_clip(time)
+            else:
+                # the group got longer, so did its clip
+                for pending in self._group_clip.pending:
+                    self._group_clip.writer.write(pending)
+                self._group_clip.pending = []
+
+        for clip in list(self.clips):
+            if clip.end is not None:
+                if self._reached(time, clip.end):
+                    self._close(clip)
+                else:
+                    clip.writer.write(frame)
+            elif self._reached(time, self.grouper.group[-1] + self.padding):
+                # past the end of the clip unless there's another detection
+                clip.pending.append(frame)
+            else:
+                clip.writer.write(frame)
+
+        self.buffer.append((time, frame))
+        self._time = time
+
+    def finish(self):
+        """
+        End of the video, writes out the last clips.
+
+        Returns the (start, end, group, filename) of all the clips.
+        """
+
+        for highlight in self.grouper.finish():
+            self._end_clip(*highlight)
+
+        for clip in list(self.clips):
+            self._close(clip)
+
+        # the last clip can't go past the end of the video
+        if len(self.highlights) > 0 and self._time is not None:
+            start, end, group, filename = self.highlights[-1]
+            self.highlights[-1] = (start, min(end, self._time), group, filename)
+
+        return self.highlights
+
 if __name__ == '__main__':
     
     from maui63_postprocessing.cv import process_video 
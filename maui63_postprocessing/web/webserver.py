@@ -9,6 +9,8 @@ import threading
 from multiprocessing import Process, get_context
 from multiprocessing.queues import Queue
 from maui63_postprocessing import Maui63DataProcessor
+from maui63_postprocessing.cv import get_detector
+from maui63_postprocessing.data.cache import ResultCache
 
 from flask_socketio import emit, SocketIO
 
@@ -41,6 +43,9 @@ class UploadPage(Flask):
     highlighter_kwargs = {'clip_length': 10, 'padding': 3}
     export_kwargs = {}
     processor_kwargs = {}
+    
+    cache_path = None   # inference cache (defaults to ~/.cache/maui63_postprocessing)
+    cache_size = 10e9   # bytes
 
     def __init__(self, *args, **kwargs):
         template_path = _filedirpath / 'templates/'
@@ -76,6 +81,12 @@ class UploadPage(Flask):
     def start_web(self, *args, **kwargs):
         # Just an easy alias for whatever we want the user to start
         self.run_socketio(self, *args, **kwargs)
+        
+    @property
+    def detector(self):
+        # Load the network once and share it with every job
+        # (the job processes are forked so they inherit it)
+        return get_detector(self.config_file, self.weights_file, self.names_file)
     
     def process_upload(self, uav_logs, media_file, r_url):
         
@@ -84,6 +95,9 @@ class UploadPage(Flask):
         # TODO: add support for multiple uploads (this will break if two people upload at the same time)
         output_path = self.config['UPLOAD_FOLDER'] + '/output.mp4'
         
+        detector = self.detector
+        cache = ResultCache(self.cache_path, max_size = self.cache_size)
+        
         def process(stdout_queue, stderr_queue):
             
             # redirect stdout
@@ -102,6 +116,8 @@ class UploadPage(Flask):
                             self.names_file,     # darknet .names file
                             output_path,         # ouput file/directory
                             highlighter_kwargs = self.highlighter_kwargs,
+                            detector = detector,
+                            cache = cache,
                             **self.processor_kwargs
                             )
                             
@@ -69,6 +69,7 @@ setup(
         'moviepy >= 1',
         'scipy >= 1',
         'rq >= 1',
+        'pyarrow >= 1',
         
         # Opencv is a bit tricky
         ('opencv-python >= 4' 
@@ -0,0 +1,79 @@
+import pytest
+import numpy as np
+import cv2
+
+
+# A one layer darknet model (no training needed): the frame is max pooled
+# and the objectness goes up with the brightness, so a frame's detections
+# are set by its grey level (confidence ~0.49 at 0.5, ~0.81 at 0.55, ~1 at
+# 0.7 and above, nothing under 0.45).
+TINY_CFG = """[net]
+width=64
+height=64
+channels=3
+
+[maxpool]
+size=16
+stride=16
+
+[convolutional]
+filters=6
+size=1
+stride=1
+pad=0
+activation=linear
+
+[yolo]
+mask=0
+anchors=64,64
+classes=1
+num=1
+"""
+
+TINY_NET_SIZE = (64, 64)
+
+
+@pytest.fixture(scope='session')
+def tiny_net(tmp_path_factory):
+    """
+    (data_file, config_file, weights, names_file) of the tiny model
+    """
+
+    path = tmp_path_factory.mktemp('tiny_net')
+
+    (path / 'tiny.cfg').write_text(TINY_CFG)
+    (path / 'tiny.names').write_text('pod\n')
+    (path / 'tiny.data').write_text('classes = 1\nnames = tiny.names\n')
+
+    # output channels: x, y, w, h, objectness, class
+    biases = np.array([0, 0, 0, 0, -15, 20], dtype=np.float32)
+    weights = np.zeros((6, 3), dtype=np.float32)
+    weights[4] = 10  # objectness from the sum of the (0-1) colour channels
+
+    with open(path / 'tiny.weights', 'wb') as f:
+        np.array([0, 2, 5], dtype=np.int32).tofile(f)  # version
+        np.array([0], dtype=np.int64).tofile(f)        # images seen
+        biases.tofile(f)
+        weights.tofile(f)
+
+    return tuple(str(path / name) for name in
+                 ['tiny.data', 'tiny.cfg', 'tiny.weights', 'tiny.names'])
+
+
+def write_video(file, levels, fps = 10, size = (64, 48)):
+    """
+    MJPG video with one frame per grey level (0-1)
+    """
+
+    writer = cv2.VideoWriter(str(file), cv2.VideoWriter_fourcc(*'MJPG'), fps, size)
+    for level in levels:
+        writer.write(np.full((size[1], size[0], 3), int(round(level * 255)),
+                             dtype=np.uint8))
+    writer.release()
+
+    return str(file)
+
+
+@pytest.fixture
+def make_video():
+    return write_video
@@ -0,0 +1,107 @@
+import pytest
+import datetime
+import numpy as np
+
+from pathlib import Path
+
+from maui63_postprocessing.data.uav_import import Maui63UAVImporter, read_cv_log, \
+    read_uav_log, UAV_LOG_COLUMNS
+
+
+LOG = (
+    "2021.01.27 10.31.05 ,num=2,prob=0.91,lat=-36.85,lon=174.76,prob=0.55,lat=-36.86,lon=174.77,\n"
+    "2021.01.27 10.31.06 ,num=0,\n"
+    "2021.01.27 10.31.07 , num = 1 ,prob = 0.5 , lat=-36.9 ,lon=174.8\n"
+    "2021.01.28 00.00.00 ,num=1,prob=0.7,lat=-36.9,lon=174.8,\n"
+    )
+
+logs = Path(__file__).parent / 'Drone_Flight_Path_Dummy_Data.csv'
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=datetime.timezone.utc).timestamp()
+
+
+def test_read_cv_log(tmp_path):
+    logfile = tmp_path / 'cv_log.txt'
+    logfile.write_text(LOG)
+
+    lines, detections = read_cv_log(logfile)
+
+    assert lines['num'].tolist() == [2, 0, 1, 1]
+    assert np.allclose(lines['datetime_utc'],
+                       [utc(2021, 1, 27, 10, 31, 5), utc(2021, 1, 27, 10, 31, 6),
+                        utc(2021, 1, 27, 10, 31, 7), utc(2021, 1, 28)])
+
+    # one row per object, in log order
+    assert detections['line'].tolist() == [0, 0, 2, 3]
+    assert np.allclose(detections['prob'], [0.91, 0.55, 0.5, 0.7])
+    assert np.allclose(detections['lat'], [-36.85, -36.86, -36.9, -36.9])
+    assert np.allclose(detections['lon'], [174.76, 174.77, 174.8, 174.8])
+    assert np.allclose(detections['datetime_utc'],
+                       lines['datetime_utc'].to_numpy()[[0, 0, 2, 3]])
+
+def test_cv_df(tmp_path):
+    logfile = tmp_path / 'cv_log.txt'
+    logfile.write_text(LOG)
+
+    importer = Maui63UAVImporter(cv_logfile = logfile)
+
+    # the per line shape with lists
+    assert importer.cv_df['prob'].tolist() == [[0.91, 0.55], [], [0.5], [0.7]]
+    assert importer.cv_df['lon'].tolist() == [[174.76, 174.77], [], [174.8], [174.8]]
+
+def test_read_cv_log_unpadded_dates(tmp_path):
+    # not fixed width, parsed by pandas instead
+    logfile = tmp_path / 'cv_log.txt'
+    logfile.write_text("2021.1.27 9.31.05 ,num=1,prob=0.9,lat=-36.85,lon=174.76\n")
+
+    lines, detections = read_cv_log(logfile)
+
+    assert np.allclose(lines['datetime_utc'], [utc(2021, 1, 27, 9, 31, 5)])
+
+def test_read_cv_log_empty(tmp_path):
+    logfile = tmp_path / 'cv_log.txt'
+    logfile.write_text("")
+
+    lines, detections = read_cv_log(logfile)
+
+    assert len(lines) == 0 and len(detections) == 0
+    assert list(detections.columns) == ['line', 'datetime_utc', 'prob', 'lat', 'lon']
+
+def test_read_cv_log_bad_key(tmp_path):
+    logfile = tmp_path / 'cv_log.txt'
+    logfile.write_text("2021.01.27 10.31.05 ,num=1,prob=0.9,lon=174.76,lat=-36.85\n")
+
+    with pytest.raises(AssertionError):
+        read_cv_log(logfile)
+
+def test_read_uav_log():
+    df = read_uav_log(logs)
+
+    # no spaces around the headers
+    assert list(df.columns) == ['unix_time', 'GPS Date', 'GPS time', 'height of UAV',
+                                'UAV lat', 'UAV long', 'Wind speed']
+    assert df['unix_time'].dtype == np.float64
+    assert df['UAV lat'].dtype == np.int8
+
+    full = read_uav_log(logs, downcast = False)
+    assert full['UAV lat'].dtype == np.int64
+    assert np.array_equal(df.to_numpy(np.float64), full.to_numpy(np.float64))
+
+def test_read_uav_log_chunked():
+    full = read_uav_log(logs, columns = UAV_LOG_COLUMNS)
+    chunked = read_uav_log(logs, columns = UAV_LOG_COLUMNS, chunksize = 2)
+
+    assert list(chunked.columns) == UAV_LOG_COLUMNS
+    assert chunked.equals(full)
+
+    with pytest.raises(AssertionError):
+        read_uav_log(logs, columns = ['unix_time', 'altitude'])
+
+    importer = Maui63UAVImporter(logs, columns = UAV_LOG_COLUMNS, chunksize = 2)
+    assert importer.df.equals(full)
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,53 @@
+import pytest
+import numpy as np
+import pandas as pd
+import scipy.interpolate
+
+from maui63_postprocessing.data.align import TelemetryAligner
+
+
+def make_telemetry(n = 200, seed = 0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'timestamp': np.cumsum(rng.uniform(0.05, 0.2, n)),
+        'lat': -36.8 + rng.random(n),
+        'height': rng.integers(50, 200, n),
+        'mode': rng.choice(['auto', 'loiter', 'rtl'], n),
+        }).sample(frac = 1, random_state = 0)  # not in order
+
+
+def test_align_numeric():
+    df = make_telemetry()
+    t = np.random.default_rng(1).uniform(df.timestamp.min(), df.timestamp.max(), 1000)
+    t = np.append(t, [df.timestamp.min(), df.timestamp.max()])
+
+    aligned = TelemetryAligner(df).align(t)
+
+    assert list(aligned.columns) == ['lat', 'height', 'mode']
+    for column in ['lat', 'height']:
+        expected = scipy.interpolate.interp1d(df.timestamp, df[column])(t)
+        assert np.allclose(aligned[column], expected)
+
+def test_align_nearest():
+    df = make_telemetry()
+    t = np.random.default_rng(2).uniform(df.timestamp.min(), df.timestamp.max(), 1000)
+
+    aligned = TelemetryAligner(df).align(t)
+
+    f = scipy.interpolate.interp1d(df.timestamp, np.arange(len(df)), kind = 'nearest')
+    expected = df['mode'].to_numpy()[f(t).astype(int)]
+    assert (aligned['mode'].to_numpy() == expected).all()
+
+def test_align_outside():
+    df = make_telemetry()
+
+    with pytest.warns(UserWarning):
+        aligned = TelemetryAligner(df).align([-1, df.timestamp.max() + 1])
+
+    assert aligned['lat'].isna().all()
+    assert aligned['mode'].tolist() == [df.sort_values('timestamp')['mode'].iloc[0],
+                                        df.sort_values('timestamp')['mode'].iloc[-1]]
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,140 @@
+import time
+import pytest
+import pandas as pd
+
+from maui63_postprocessing.data.cache import ResultCache
+from maui63_postprocessing.data.detections import detection_records
+from maui63_postprocessing.data.post_process import Maui63DataProcessor
+
+
+def _detections(n):
+    records = detection_records()
+    records.extend({'frame': list(range(n)), 'timestamp': 0.1, 'class_id': 0,
+                    'confidence': 0.9, 'x': 1, 'y': 2, 'w': 3, 'h': 4,
+                    'inferred': True})
+    return records.to_frame()
+
+def test_cache_key(tmp_path):
+    media = tmp_path / 'media.mp4'
+    weights = tmp_path / 'model.weights'
+    media.write_bytes(b'video')
+    weights.write_bytes(b'weights')
+    
+    key = ResultCache.key([media], [weights], {'thresh': 0.3})
+    
+    assert key == ResultCache.key([media], [weights], {'thresh': 0.3})
+    assert key != ResultCache.key([media], [weights], {'thresh': 0.4})
+    
+    # same content, different file
+    copy = tmp_path / 'copy.mp4'
+    copy.write_bytes(b'video')
+    assert key == ResultCache.key([copy], [weights], {'thresh': 0.3})
+    
+    weights.write_bytes(b'new weights')
+    assert key != ResultCache.key([media], [weights], {'thresh': 0.3})
+
+def test_cache_roundtrip(tmp_path):
+    cache = ResultCache(tmp_path / 'cache')
+    detections = _detections(3)
+    
+    assert cache.get('a') is None
+    
+    cache.put('a', detections)
+    loaded, media_file = cache.get('a')
+    pd.testing.assert_frame_equal(loaded, detections)
+    assert media_file is None
+    
+    # no tagged media stored
+    assert cache.get('a', with_media = True) is None
+    
+    video = tmp_path / 'tagged.mp4'
+    video.write_bytes(b'tagged video')
+    cache.put('b', detections, media_file = video)
+    _, media_file = cache.get('b', with_media = True)
+    assert media_file.read_bytes() == b'tagged video'
+    
+def test_cache_eviction(tmp_path):
+    cache = ResultCache(tmp_path / 'cache')
+    
+    cache.put('a', _detections(10))
+    cache.put('b', _detections(10))
+    time.sleep(0.01)
+    cache.get('a')  # b is now the least recently used
+    
+    cache.max_size = cache.size() * 1.25  # room for two entries, not three
+    cache.put('c', _detections(10))
+    
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+    assert cache.get('c') is not None
+
+def test_cache_key_defaults(tmp_path, tiny_net, make_video, monkeypatch):
+    from maui63_postprocessing.data import cache
+    
+    video = make_video(tmp_path / 'flight.avi', [0.8] * 5)
+    def key(**cv_kwargs):
+        processor = Maui63DataProcessor('uav.csv', video, *tiny_net,
+                                        output_path = tmp_path / 'highlights',
+                                        cv_kwargs = cv_kwargs,
+                                        cache = ResultCache(tmp_path / 'cache'))
+        return processor._cache_key()
+    
+    # the defaults are in the key, passed or not
+    default = key()
+    assert default == key(net_size = (1920, 1056), thresh = 0.3, batch_size = 4)
+    assert default != key(net_size = (64, 64))
+    
+    # and the package version
+    monkeypatch.setattr(cache, '__version__', '0.0.0')
+    assert default != key()
+
+def test_cache_put_race(tmp_path, monkeypatch):
+    import os
+    cache = ResultCache(tmp_path / 'cache')
+    
+    # another process puts the same key between the removal and the rename
+    rename = os.rename
+    def race(src, dst):
+        other = ResultCache(tmp_path / 'cache')
+        monkeypatch.setattr(os, 'rename', rename)
+        other.put('a', _detections(3))
+        rename(src, dst)
+    monkeypatch.setattr(os, 'rename', race)
+    
+    cache.put('a', _detections(3))
+    
+    loaded, _ = cache.get('a')
+    pd.testing.assert_frame_equal(loaded, _detections(3))
+    assert [entry.name for entry in cache.path.iterdir()] == ['a']
+
+def test_cache_output_extension(tmp_path, tiny_net, make_video):
+    video = make_video(tmp_path / 'flight.avi', [0.8] * 5)
+    processor = Maui63DataProcessor('uav.csv', video, *tiny_net,
+                                    output_path = tmp_path / 'highlights',
+                                    cache = ResultCache(tmp_path / 'cache'))
+    
+    runs = []
+    def run(file):
+        def run():
+            runs.append(file)
+            file.write_bytes(file.suffix.encode())  # tagged media
+            return _detections(5)
+        return run
+    
+    avi, mp4 = tmp_path / 'tagged.avi', tmp_path / 'tagged.mp4'
+    processor._run_cached(run(avi), avi)
+    
+    # the cached .avi isn't copied to a .mp4
+    processor._run_cached(run(mp4), mp4)
+    assert runs == [avi, mp4]
+    assert mp4.read_bytes() == b'.mp4'
+    
+    # same extension (any case), copied from the cache
+    copy = tmp_path / 'copy.AVI'
+    processor._run_cached(run(copy), copy)
+    assert runs == [avi, mp4]
+    assert copy.read_bytes() == b'.avi'
+    
+
+if __name__ == '__main__':
+    pytest.main()
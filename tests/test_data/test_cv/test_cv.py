@@ -0,0 +1,349 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from maui63_postprocessing.cv import decode_outputs
+from maui63_postprocessing.cv.propagation import DetectionPropagator
+from maui63_postprocessing.cv.checkpoint import VideoCheckpoint
+from maui63_postprocessing.cv.pipeline import FrameWriter
+from maui63_postprocessing.cv.chunked import chunk_frames
+from maui63_postprocessing.data.detections import detection_records
+
+
+def test_decode_outputs():
+    # [centerX, centerY, width, height, objectness, class 0, class 1]
+    layerOutputs = [
+        np.array([[0.50, 0.50, 0.10, 0.20, 0.9, 0.1, 0.8],
+                  [0.20, 0.20, 0.10, 0.10, 0.9, 0.2, 0.1]], dtype=np.float32),
+        np.array([[0.25, 0.75, 0.05, 0.05, 0.9, 0.7, 0.6]], dtype=np.float32),
+        ]
+    
+    boxes, confidences, classIDs = decode_outputs(layerOutputs, 1000, 500, 0.5)
+    
+    assert boxes.tolist() == [[450, 200, 100, 100], [225, 362, 50, 25]]
+    assert classIDs.tolist() == [1, 0]
+    assert np.allclose(confidences, [0.8, 0.7])
+    
+def test_decode_outputs_empty():
+    layerOutputs = [np.zeros((10, 7), dtype=np.float32)]
+    
+    boxes, confidences, classIDs = decode_outputs(layerOutputs, 1000, 500, 0.5)
+    
+    assert boxes.shape == (0, 4)
+    assert len(confidences) == 0 and len(classIDs) == 0
+    
+def test_propagation_carry():
+    propagator = DetectionPropagator(4, mode = 'carry')
+    
+    # the second box was suppressed by NMS
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 10, 10]])
+    propagator.update(np.array([0]), boxes, np.array([0.9, 0.8]), np.array([0, 0]))
+    
+    idxs, boxes, confidences, classIDs = propagator.propagate()
+    
+    assert boxes.tolist() == [[0, 0, 10, 10]]
+    assert idxs.tolist() == [0]
+    
+def test_propagation_track():
+    propagator = DetectionPropagator(4, mode = 'track')
+    
+    confidences = np.array([0.9, 0.8])
+    classIDs = np.array([0, 0])
+    propagator.update(np.array([0, 1]), np.array([[0, 0, 10, 10], [100, 100, 10, 10]]),
+                      confidences, classIDs)
+    propagator.update(np.array([0, 1]), np.array([[8, 0, 10, 10], [100, 120, 10, 10]]),
+                      confidences, classIDs)
+    
+    # moves a quarter of the way to the next inferred frame each step
+    assert propagator.propagate()[1].tolist() == [[10, 0, 10, 10], [100, 125, 10, 10]]
+    assert propagator.propagate()[1].tolist() == [[12, 0, 10, 10], [100, 130, 10, 10]]
+    
+def test_checkpoint(tmp_path):
+    params = {'video': 'video.mp4', 'net_size': (64, 64)}
+    
+    checkpoint = VideoCheckpoint(tmp_path / 'ckpt', params)
+    assert checkpoint.resume_frame is None
+    
+    records = detection_records()
+    records.extend({'frame': [1, 5, 12], 'timestamp': 0., 'class_id': 0,
+                    'confidence': 0.9, 'x': 0, 'y': 0, 'w': 1, 'h': 1,
+                    'inferred': True})
+    
+    # detections can be ahead of the last frame if a save was interrupted
+    checkpoint.save(records.to_frame(), 10, new_segment = True)
+    
+    checkpoint = VideoCheckpoint(tmp_path / 'ckpt', params)
+    assert checkpoint.resume_frame == 11
+    assert checkpoint.detections().frame.tolist() == [1, 5]
+    assert checkpoint.segment_file('.avi').endswith('segment_00001.avi')
+    assert len(checkpoint.segments('.avi')) == 1
+    
+    # different arguments, start over
+    with pytest.warns(UserWarning):
+        checkpoint = VideoCheckpoint(tmp_path / 'ckpt', dict(params, net_size = (32, 32)))
+    assert checkpoint.resume_frame is None
+    
+
+@pytest.mark.parametrize('encoder, file', [('opencv', 'out.avi'),
+                                           ('ffmpeg', 'out.avi'),
+                                           ('ffmpeg', 'out.mp4')])
+def test_frame_writer(tmp_path, encoder, file):
+    import cv2
+    
+    output_file = str(tmp_path / file)
+    
+    writer = FrameWriter(output_file, 10, encoder = encoder, quality = 50)
+    writer.start()
+    for i in range(20):
+        writer.write(np.full((64, 96, 3), i * 10, dtype=np.uint8))
+    writer.close()
+    
+    vidcap = cv2.VideoCapture(output_file)
+    frames = []
+    while True:
+        success, frame = vidcap.read()
+        if not success:
+            break
+        frames.append(frame)
+    
+    assert len(frames) == 20
+    assert frames[0].shape == (64, 96, 3)
+    assert abs(int(frames[10].mean()) - 100) < 5
+
+    
+@pytest.mark.parametrize('encoder', ['opencv', 'ffmpeg'])
+def test_iter_video_early_close(tmp_path, tiny_net, make_video, encoder):
+    import cv2
+    import threading
+    from maui63_postprocessing.cv import iter_video
+    
+    video = make_video(tmp_path / 'video.avi', [0, 1, 1, 0, 0.7] * 10)
+    output_file = str(tmp_path / 'out.mp4')
+    
+    results = iter_video(video, *tiny_net, net_size = (64, 64),
+                         output_file = output_file, encoder = encoder)
+    for _ in range(5):
+        next(results)
+    results.close()
+    
+    # the writer is done and the file finished (an mp4 can't be read before)
+    assert not any(isinstance(thread, FrameWriter) for thread in threading.enumerate())
+    vidcap = cv2.VideoCapture(output_file)
+    assert vidcap.read()[0]
+
+    
+def test_chunk_frames_edges():
+    # empty, one frame (skipped) or no frame count
+    assert chunk_frames(0, 4) == []
+    assert chunk_frames(1, 4) == []
+    assert chunk_frames(2, 4) == [(1, 2)]
+    assert chunk_frames(2, 4, stride = 5) == [(1, 2)]
+    
+    # more chunks than frames
+    assert chunk_frames(4, 8) == [(1, 2), (2, 3), (3, 4)]
+    
+@pytest.mark.parametrize('framecount', [2, 3, 10, 31, 100])
+@pytest.mark.parametrize('chunks', [1, 3, 7])
+@pytest.mark.parametrize('stride', [1, 2, 5])
+def test_chunk_frames_stride(framecount, chunks, stride):
+    ranges = chunk_frames(framecount, chunks, stride)
+    
+    # frames 1 to framecount, in order with no gaps
+    assert ranges[0][0] == 1 and ranges[-1][1] == framecount
+    assert all(end == start for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]))
+    assert len(ranges) <= chunks
+    
+    # every chunk starts on an inferred frame ((framenum - 1) % stride == 0)
+    assert all((start - 1) % stride == 0 for start, _ in ranges)
+    
+def test_process_video_chunked(tmp_path, tiny_net, make_video):
+    from maui63_postprocessing.cv import process_video, process_video_chunked
+    
+    levels = [0, 1, 1, 0.3, 0, 0.7, 0.7, 0, 1, 0, 0, 1] * 3
+    video = make_video(tmp_path / 'video.avi', levels)
+    
+    kwargs = dict(net_size = (64, 64), stride = 2, table = 'detections')
+    single = process_video(video, *tiny_net, **kwargs)
+    chunked = process_video_chunked(video, *tiny_net, workers = 2, chunks = 3, **kwargs)
+    
+    assert len(single) > 0
+    pd.testing.assert_frame_equal(chunked, single)
+    
+    # nothing to split
+    empty = process_video_chunked(make_video(tmp_path / 'one.avi', [1]), *tiny_net,
+                                  workers = 2, **kwargs)
+    assert len(empty) == 0
+
+    
+def test_process_video_chunked_resume(tmp_path, tiny_net, make_video, monkeypatch):
+    import cv2
+    from maui63_postprocessing.cv import cv, chunked
+    
+    levels = [0, 1, 1, 0.3, 0, 0.7, 0.7, 0, 1, 0] * 3
+    video = make_video(tmp_path / 'video.avi', levels)
+    kwargs = dict(net_size = (64, 64), table = 'detections', workers = 1,
+                  chunks = 3, checkpoint = str(tmp_path / 'ckpt'))
+    expected = cv.process_video(video, *tiny_net, net_size = (64, 64),
+                                table = 'detections')
+    
+    # the chunks are run in forked workers, they log the frames they 
+    # process (chunks 1-11, 11-21 and 21-30, a finished chunk has none left)
+    log = tmp_path / 'chunks.log'
+    iter_results = cv._iter_results
+    def logged(reader, start_frame, framecount, *args, **kwargs):
+        if framecount > 0:
+            with open(log, 'a') as f:
+                f.write('{}:{}\n'.format(start_frame, start_frame + framecount))
+        if start_frame == 21 and not (tmp_path / 'fixed').exists():
+            raise RuntimeError('preempted')
+        return iter_results(reader, start_frame, framecount, *args, **kwargs)
+    monkeypatch.setattr(cv, '_iter_results', logged)
+    
+    with pytest.raises(RuntimeError):
+        chunked.process_video_chunked(video, *tiny_net,
+                                      output_file = str(tmp_path / 'out.avi'), **kwargs)
+    assert log.read_text().split() == ['1:11', '11:21', '21:30']
+    
+    # only the failed chunk is run again
+    log.unlink()
+    (tmp_path / 'fixed').touch()
+    df = chunked.process_video_chunked(video, *tiny_net,
+                                       output_file = str(tmp_path / 'out.avi'), **kwargs)
+    assert log.read_text().split() == ['21:30']
+    
+    pd.testing.assert_frame_equal(df, expected)
+    vidcap = cv2.VideoCapture(str(tmp_path / 'out.avi'))
+    assert int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT)) == 29
+    assert not (tmp_path / 'ckpt').exists()
+
+    
+def test_checkpoint_model_changed(tmp_path, tiny_net, make_video, monkeypatch):
+    import os
+    from maui63_postprocessing.cv import cv
+    
+    video = make_video(tmp_path / 'video.avi', [0, 1, 1, 0, 0.7, 0, 1, 1, 0, 0])
+    kwargs = dict(net_size = (64, 64), table = 'detections',
+                  checkpoint = str(tmp_path / 'ckpt'), checkpoint_every = 2)
+    expected = cv.process_video(video, *tiny_net, **kwargs)
+    
+    # interrupted after a few frames, the checkpoint is kept
+    calls = []
+    add = cv.add_frame_detections
+    def interrupted(*args):
+        calls.append(1)
+        if len(calls) > 5:
+            raise KeyboardInterrupt
+        add(*args)
+    monkeypatch.setattr(cv, 'add_frame_detections', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        cv.process_video(video, *tiny_net, **kwargs)
+    monkeypatch.undo()
+    
+    assert os.path.exists(os.path.join(kwargs['checkpoint'], 'state.json'))
+    
+    # the weights changed since, the checkpoint isn't used
+    weights = tiny_net[2]
+    os.utime(weights, ns = (os.stat(weights).st_atime_ns, os.stat(weights).st_mtime_ns + 10**9))
+    
+    with pytest.warns(UserWarning, match = 'different'):
+        df = cv.process_video(video, *tiny_net, **kwargs)
+    
+    pd.testing.assert_frame_equal(df, expected)
+
+    
+def test_process_video_resume(tmp_path, tiny_net, make_video, monkeypatch):
+    import cv2
+    from maui63_postprocessing.cv import cv
+    
+    video = make_video(tmp_path / 'video.avi', [0, 1, 1, 0, 0.7, 0, 1, 1, 0, 0] * 3)
+    kwargs = dict(net_size = (64, 64), table = 'detections', stride = 2,
+                  checkpoint = str(tmp_path / 'ckpt'), checkpoint_every = 4)
+    expected = cv.process_video(video, *tiny_net, **kwargs)
+    
+    # interrupted, then resumed from the last checkpoint
+    calls = []
+    add = cv.add_frame_detections
+    def interrupted(*args):
+        calls.append(1)
+        if len(calls) == 17:
+            raise KeyboardInterrupt
+        add(*args)
+    monkeypatch.setattr(cv, 'add_frame_detections', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        cv.process_video(video, *tiny_net, output_file = str(tmp_path / 'out.avi'), **kwargs)
+    monkeypatch.undo()
+    
+    df = cv.process_video(video, *tiny_net, output_file = str(tmp_path / 'out.avi'), **kwargs)
+    
+    pd.testing.assert_frame_equal(df, expected)
+    
+    # the segments are joined into the whole tagged video
+    vidcap = cv2.VideoCapture(str(tmp_path / 'out.avi'))
+    assert int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT)) == 29
+    assert not (tmp_path / 'ckpt').exists()
+
+    
+def test_stream_video(tmp_path, tiny_net, make_video):
+    from maui63_postprocessing.cv import iter_video, stream_video
+    
+    video = make_video(tmp_path / 'video.avi', [0, 1, 1, 0, 0.7, 0, 1, 1, 0, 0])
+    kwargs = dict(net_size = (64, 64), stride = 2)
+    
+    expected = list(iter_video(video, *tiny_net, **kwargs))
+    streamed = list(stream_video(video, *tiny_net, idle_timeout = 1,
+                                 poll_interval = 0.1, **kwargs))
+    
+    assert [f for f, _, _ in streamed] == [f for f, _, _ in expected]
+    for (_, _, a), (_, _, b) in zip(streamed, expected):
+        pd.testing.assert_frame_equal(a, b)
+
+    
+def cascade_frames():
+    # 64x48 frames: dark, bright (found by both passes), a one pixel spot
+    # (lost at the triage size, found at full size) and grey (passes the
+    # triage threshold only)
+    dark = np.zeros((48, 64, 3), dtype=np.uint8)
+    bright = np.full((48, 64, 3), 179, dtype=np.uint8)
+    spot = dark.copy()
+    spot[21, 33] = 255
+    grey = np.full((48, 64, 3), 127, dtype=np.uint8)
+    
+    return [dark, bright, spot, dark, grey, spot, dark]
+    
+@pytest.mark.parametrize('window, confirmed', [(0, [1, 4]), (1, [1, 2, 4, 5])])
+def test_cascade(tiny_net, window, confirmed):
+    from maui63_postprocessing.cv.cv import Detector, CascadeScanner, run_net_on_batch
+    
+    detector = Detector(*tiny_net[1:])
+    frames = cascade_frames()
+    
+    cascade = CascadeScanner(detector.net, detector.output_layers, (64, 64), (32, 32),
+                             confidence_thresh = 0.5, thresh = 0.3,
+                             cascade_thresh = 0.25, window = window)
+    results = cascade.run(frames, 64, 48)
+    
+    # only the triggered frames (and the window after them) are confirmed
+    assert cascade.num_scanned == len(frames)
+    assert cascade.num_confirmed == len(confirmed)
+    
+    full = run_net_on_batch(frames, detector.net, (64, 64), detector.output_layers,
+                            0.5, 0.3, 64, 48)
+    
+    for i, (result, expected) in enumerate(zip(results, full)):
+        idxs, boxes, confidences, classIDs = result
+        if i in confirmed:
+            # same as the full resolution net
+            assert np.array_equal(np.array(idxs).flatten(), np.array(expected[0]).flatten())
+            assert np.array_equal(boxes, expected[1])
+            assert np.allclose(confidences, expected[2])
+        else:
+            # rejected at the triage size, skipped
+            assert len(idxs) == 0
+    
+    # with the window the spots next to triggers are found, without it they're missed
+    detected = [i for i, result in enumerate(results) if len(result[0]) > 0]
+    assert detected == ([1] if window == 0 else [1, 2, 5])
+
+
+if __name__ == '__main__':
+    pytest.main()
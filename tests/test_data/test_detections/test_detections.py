@@ -0,0 +1,97 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from maui63_postprocessing.data.detections import (detection_records,
+                                                   add_frame_detections,
+                                                   frame_detections,
+                                                   frame_view,
+                                                   detections_from_frames,
+                                                   split_list_columns,
+                                                   join_list_columns)
+
+
+def make_detections():
+    records = detection_records()
+    
+    # NMS kept boxes 0 and 2 of the first frame
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 10, 10], [50, 50, 5, 5]])
+    add_frame_detections(records, 1, 1/30, np.array([0, 2]), boxes,
+                         np.array([0.9, 0.8, 0.7]), np.array([0, 0, 1]))
+    add_frame_detections(records, 2, 2/30, (), boxes,
+                         np.array([0.9, 0.8, 0.7]), np.array([0, 0, 1]))
+    add_frame_detections(records, 3, 3/30, np.array([0]), boxes[:1],
+                         np.array([0.6]), np.array([1]), inferred = False)
+    
+    return records.to_frame()
+    
+def test_detections_table():
+    detections = make_detections()
+    
+    assert detections.frame.tolist() == [1, 1, 3]
+    assert detections.class_id.tolist() == [0, 1, 1]
+    assert detections[['x', 'y', 'w', 'h']].to_numpy().tolist() == \
+        [[0, 0, 10, 10], [50, 50, 5, 5], [0, 0, 10, 10]]
+    assert detections.inferred.tolist() == [True, True, False]
+    
+def test_frame_view():
+    df = frame_view(make_detections())
+    
+    assert df.num_objects.tolist() == [2, 1]
+    assert df.box[0] == [[0, 0, 10, 10], [50, 50, 5, 5]]
+    assert df.object_class[1] == [1]
+    assert np.allclose(df.timestamp, [1/30, 3/30])
+    
+def test_detections_from_frames():
+    detections = make_detections()
+    
+    roundtrip = detections_from_frames(frame_view(detections))
+    
+    assert roundtrip[['x', 'y', 'w', 'h', 'class_id', 'inferred']].equals(
+        detections[['x', 'y', 'w', 'h', 'class_id', 'inferred']])
+    
+def test_split_list_columns():
+    # and a frame without detections
+    df = pd.concat([frame_view(make_detections()),
+                    pd.DataFrame({'timestamp': [4/30], 'num_objects': [0],
+                                  'confidence': [[]], 'object_class': [[]],
+                                  'box': [[]], 'inferred': [True]})],
+                   ignore_index = True)
+    df['lat'] = [-37.0, -37.1, -37.2]
+    
+    scalars, cells = split_list_columns(df)
+    
+    assert scalars.columns.tolist() == df.columns.tolist()
+    assert scalars.box.tolist() == [2, 1, 0]
+    assert cells.row.tolist() == [0, 0, 1]
+    assert cells[['x', 'y', 'w', 'h']].to_numpy().tolist() == \
+        [[0, 0, 10, 10], [50, 50, 5, 5], [0, 0, 10, 10]]
+    
+    joined = join_list_columns(scalars, cells)
+    pd.testing.assert_frame_equal(joined, df)
+    assert joined.to_dict('list') == df.to_dict('list')
+    
+    df['box'] = [[[0, 0, 10, 10]]] + df.box.tolist()[1:]
+    with pytest.raises(AssertionError):
+        split_list_columns(df)
+    
+def test_frame_detections():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 10, 10], [50, 50, 5, 5]])
+    confidences = np.array([0.9, 0.8, 0.7])
+    classIDs = np.array([0, 0, 1])
+    
+    records = detection_records()
+    add_frame_detections(records, 1, 1/30, np.array([0, 2]), boxes,
+                         confidences, classIDs)
+    
+    pd.testing.assert_frame_equal(
+        frame_detections(1, 1/30, np.array([0, 2]), boxes, confidences, classIDs),
+        records.to_frame())
+    
+    empty = frame_detections(2, 2/30, (), boxes, confidences, classIDs)
+    assert len(empty) == 0
+    assert empty.dtypes.equals(records.to_frame().dtypes)
+    
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,206 @@
+import pytest
+import numpy as np
+from moviepy.editor import ColorClip
+
+from maui63_postprocessing.videoedit.highlights import Highlighter, HighlightGrouper, \
+    HighlightRecorder, group_points_of_interest
+from maui63_postprocessing.videoedit.ffmpeg import FFmpegWriter, cut_clips
+
+
+def test_grouper_matches_highlighter():
+    rng = np.random.RandomState(0)
+    times = np.sort(rng.uniform(0, 100, 60))
+    
+    video = ColorClip((8, 8), color=(0, 0, 0), duration=200)
+    highlighter = Highlighter(video, times, padding = 2, clip_length = 10)
+    highlights, groups = highlighter.merge_points_of_interest()
+    
+    grouper = HighlightGrouper(padding = 2, clip_length = 10)
+    streamed = []
+    # every frame of a 10 fps stream, detections at the given times
+    for t in np.arange(0, 110, 0.1):
+        detected = times[(times >= t) & (times < t + 0.1)]
+        for time in detected:
+            streamed += grouper.update(time)
+        streamed += grouper.update(t + 0.1, detected = False)
+    streamed += grouper.finish()
+    
+    assert [group for _, _, group in streamed] == [list(g) for g in groups]
+    assert np.allclose([(start, end) for start, end, _ in streamed], highlights)
+    
+@pytest.mark.parametrize('max_spacing, clip_length', [(0.5, 3), (2, 1), (1 / 3, 4 / 3)])
+def test_group_points_of_interest(max_spacing, clip_length):
+    # same as going through the times one by one
+    def group_loop(times):
+        groups = []
+        for i, t in enumerate(times):
+            if i == 0 or t >= times[i-1] + max_spacing or t - groups[-1][0] >= clip_length:
+                groups.append([t])
+            else:
+                groups[-1].append(t)
+        return groups
+    
+    # frame times at 30 fps, with repeats
+    rng = np.random.RandomState(1)
+    times = np.sort(np.round(rng.uniform(0, 60, 500) * 30) / 30)
+    
+    group_ids = group_points_of_interest(times, max_spacing, clip_length)
+    groups = np.split(times, np.flatnonzero(np.diff(group_ids)) + 1)
+    
+    assert [g.tolist() for g in groups] == group_loop(times.tolist())
+    assert len(group_points_of_interest([], max_spacing, clip_length)) == 0
+    
+def test_find_highlights():
+    video = ColorClip((8, 8), color=(0, 0, 0), duration=20)
+    
+    # the last group starts after the end of the video
+    times = [1., 1.5, 2., 9., 9.5, 10., 10.5, 11., 11.5, 30.]
+    highlighter = Highlighter(video, times, padding = 1, clip_length = 2.5)
+    
+    with pytest.warns(UserWarning):
+        highlights, group_ids = highlighter.find_highlights()
+    
+    assert group_ids.tolist() == [0, 0, 0, 1, 1, 1, 1, 1, 2, 3]
+    assert highlights.group_id.tolist() == [0, 1, 2]
+    assert np.allclose(highlights.start, [0., 8., 10.5])
+    assert np.allclose(highlights.end, [3., 12., 12.5])
+    
+def test_grouper_closes_groups():
+    grouper = HighlightGrouper(padding = 1, clip_length = 10)
+    
+    assert grouper.update(5.) == []
+    assert grouper.update(5.5) == []
+    assert grouper.update(6., detected = False) == []
+    
+    # no detection can join the group anymore
+    assert grouper.update(6.5, detected = False) == [(4., 6.5, [5., 5.5])]
+    assert grouper.finish() == []
+    
+@pytest.mark.parametrize('extension, exact', [('.avi', False), ('.mp4', True)])
+def test_cut_clips(tmp_path, extension, exact):
+    import cv2
+    
+    # 5s at 10 fps, frame i has a white bar in column i
+    video = str(tmp_path / ('video' + extension))
+    writer = FFmpegWriter(video, 10, (64, 48))
+    for i in range(50):
+        frame = np.zeros((48, 64, 3), dtype=np.uint8)
+        frame[:, i] = 255
+        writer.write(frame)
+    writer.release()
+    
+    # mjpeg only has keyframes so the stream copy is frame exact too
+    files = [str(tmp_path / ('clip{}{}'.format(i, extension))) for i in range(2)]
+    times = cut_clips(video, [(1., 2.), (2.5, 4.)], files, exact = exact,
+                      workers = 2)
+    assert len(times) == 2
+    
+    for file, first, count in zip(files, [10, 25], [10, 15]):
+        vidcap = cv2.VideoCapture(file)
+        frames = []
+        while True:
+            success, frame = vidcap.read()
+            if not success:
+                break
+            frames.append(frame)
+        
+        assert len(frames) == count
+        assert frames[0].mean(axis=(0, 2)).argmax() == first
+    
+def test_recorder(tmp_path):
+    import cv2
+    
+    fps = 10
+    times = [1.0, 1.2, 1.9, 4.0, 6.5]
+    
+    recorder = HighlightRecorder(lambda t: str(tmp_path / 'clip-{}.avi'.format(t)),
+                                 fps, padding = 0.5, max_spacing_before_merge = 1.,
+                                 clip_length = 3)
+    
+    # frame i has a white bar in column i
+    for i in range(1, 70):
+        frame = np.zeros((48, 80, 3), dtype=np.uint8)
+        frame[:, i] = 255
+        recorder.write(i / fps, frame, detected = round(i / fps, 3) in times)
+    highlights = recorder.finish()
+    
+    assert [group for _, _, group, _ in highlights] == [[1.0, 1.2, 1.9], [4.0], [6.5]]
+    assert np.allclose([(start, end) for start, end, _, _ in highlights],
+                       [(0.5, 2.4), (3.5, 4.5), (6.0, 6.9)])
+    
+    for start, end, _, filename in highlights:
+        vidcap = cv2.VideoCapture(filename)
+        columns = []
+        while True:
+            success, frame = vidcap.read()
+            if not success:
+                break
+            columns.append(frame.mean(axis=(0, 2)).argmax())
+        
+        # every frame from start to end in the tagged video, which starts at
+        # frame 1 (the video ends at frame 69)
+        assert columns == list(range(round(start * fps) + 1, round(end * fps) + 1))
+    
+def _clip_levels(file):
+    import cv2
+    
+    vidcap = cv2.VideoCapture(file)
+    levels = []
+    while True:
+        success, frame = vidcap.read()
+        if not success:
+            break
+        levels.append(np.median(frame))  # not the boxes
+    
+    return levels
+    
+def test_single_pass_matches_exact_cuts(tmp_path, tiny_net):
+    import cv2
+    from maui63_postprocessing.data.post_process import Maui63DataProcessor
+    
+    # frame k is grey level 5k, with a bright spot (a detection) in 1, 8 and 19
+    video = str(tmp_path / 'flight.mp4')
+    writer = cv2.VideoWriter(video, cv2.VideoWriter_fourcc(*'mp4v'), 10, (64, 48))
+    for k in range(22):
+        frame = np.full((48, 64, 3), 5 * k, dtype=np.uint8)
+        if k in [1, 8, 19]:
+            frame[21, 33] = 255
+        writer.write(frame)
+    writer.release()
+    
+    clips = {}
+    for single_pass in [False, True]:
+        output_path = tmp_path / ('single' if single_pass else 'exact')
+        processor = Maui63DataProcessor('uav.csv', video, *tiny_net,
+                                        output_path = output_path,
+                                        exact_highlights = True,
+                                        single_pass_highlights = single_pass,
+                                        highlighter_kwargs = {'padding': 0.5, 'clip_length': 2},
+                                        cv_kwargs = {'net_size': (64, 64)})
+        processor._generate_video_highlights(df_in = processor._run_cv())
+        clips[single_pass] = {file.name: _clip_levels(str(file))
+                              for file in output_path.iterdir()}
+    
+    # the same clips, frame for frame (first and last included)
+    assert sorted(clips[True]) == sorted(clips[False]) == \
+        ['flight-0.1.mp4', 'flight-0.8.mp4', 'flight-1.9.mp4']
+    for name, levels in clips[False].items():
+        assert len(clips[True][name]) == len(levels)
+        assert np.allclose(clips[True][name], levels, atol = 2)
+    
+def test_single_pass_workers(tmp_path, tiny_net, make_video):
+    from maui63_postprocessing.data.post_process import Maui63DataProcessor
+    
+    video = make_video(tmp_path / 'flight.avi', [0.8] * 5)
+    
+    with pytest.warns(UserWarning, match = 'workers = 2 ignored'):
+        Maui63DataProcessor('uav.csv', video, *tiny_net, output_path = tmp_path,
+                            single_pass_highlights = True, workers = 2)
+    
+    with pytest.warns(UserWarning, match = 'highlight_workers = 4 ignored'):
+        Maui63DataProcessor('uav.csv', video, *tiny_net, output_path = tmp_path,
+                            single_pass_highlights = True, highlight_workers = 4)
+    
+
+if __name__ == '__main__':
+    pytest.main()
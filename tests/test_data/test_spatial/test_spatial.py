@@ -0,0 +1,78 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from maui63_postprocessing.data.spatial import SpatialIndex, haversine
+
+
+def make_data(n = 5000, seed = 0):
+    rng = np.random.default_rng(seed)
+    lat = -37.2 + rng.random(n) * 0.5
+    lon = 174.4 + rng.random(n) * 0.5
+    lat[::50] = np.nan  # outside of the telemetry
+    return pd.DataFrame({'uav_UAV lat': lat, 'uav_UAV long': lon,
+                         'uav_unix_time': np.arange(n, dtype = float)})
+
+
+def test_radius():
+    df = make_data()
+    index = SpatialIndex(df)
+
+    for lat, lon, radius in [(-37.0, 174.6, 2000), (-37.19, 174.41, 5000), (-36.9, 174.8, 10)]:
+        distances = haversine(lat, lon, df['uav_UAV lat'], df['uav_UAV long'])
+        expected = np.flatnonzero(distances <= radius)
+
+        assert np.array_equal(index.radius_rows(lat, lon, radius), expected)
+        assert index.radius(lat, lon, radius).index.tolist() == df.index[expected].tolist()
+
+def test_radius_far_apart():
+    # two flights 6.5 degrees of latitude apart in one index
+    rng = np.random.default_rng(1)
+    north, south = make_data(seed = 1), make_data(seed = 2)
+    north['uav_UAV lat'] += 2.7   # around -34.5
+    south['uav_UAV lat'] -= 3.8   # around -41
+    df = pd.concat([north, south], ignore_index = True)
+    index = SpatialIndex(df)
+    
+    for lat, lon in np.column_stack([-41 + rng.random(50) * 0.5,
+                                     174.4 + rng.random(50) * 0.5]):
+        distances = haversine(lat, lon, df['uav_UAV lat'], df['uav_UAV long'])
+        expected = np.flatnonzero(distances <= 5000)
+        
+        assert np.array_equal(index.radius_rows(lat, lon, 5000), expected)
+    
+    # sightings far apart aren't chained together
+    ids = index.cluster(1000)
+    assert not set(ids[:len(north)]) & set(ids[len(north):]) - {-1}
+
+def test_bbox():
+    df = make_data()
+    index = SpatialIndex(df)
+
+    found = index.bbox(-37.1, 174.5, -37.0, 174.55)
+    lat, lon = df['uav_UAV lat'], df['uav_UAV long']
+    expected = df[(lat >= -37.1) & (lat <= -37.0) & (lon >= 174.5) & (lon <= 174.55)]
+
+    assert found.index.tolist() == expected.index.tolist()
+
+def test_cluster():
+    # two pods 5 km apart, each seen on two passes, and a row without a position
+    df = pd.DataFrame({
+        'uav_UAV lat': [-37.0, -37.0001, -37.0, -37.045, -37.0451, np.nan],
+        'uav_UAV long': [174.6, 174.6001, 174.6002, 174.6, 174.6, 174.6],
+        'uav_unix_time': [0, 10, 1000, 20, 2000, 30],
+        })
+    index = SpatialIndex(df)
+
+    ids = index.cluster(100)
+    assert ids[0] == ids[1] == ids[2]
+    assert ids[3] == ids[4] != ids[0]
+    assert ids[5] == -1
+
+    sightings = index.sightings(100, pass_gap = 300)
+    assert sightings['count'].tolist() == [3, 2]
+    assert sightings['passes'].tolist() == [2, 2]
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,77 @@
+import pytest
+import pandas as pd
+
+from maui63_postprocessing.cv.cv import process_video
+from maui63_postprocessing.data import store
+from maui63_postprocessing.data.detections import detection_records, frame_view
+from maui63_postprocessing.data.post_process import Maui63DataProcessor
+
+
+def test_store_roundtrip(tmp_path):
+    records = detection_records()
+    records.extend({'frame': [1, 1, 2], 'timestamp': [0.1, 0.1, 0.2],
+                    'class_id': 0, 'confidence': [0.9, 0.8, 0.7],
+                    'x': 1, 'y': 2, 'w': 3, 'h': 4, 'inferred': True})
+    detections = records.to_frame()
+    
+    store.save_table(detections, tmp_path / 'detections.parquet', 'detections')
+    loaded = store.load_table(tmp_path / 'detections.parquet', 'detections')
+    
+    pd.testing.assert_frame_equal(loaded, detections)
+    
+def test_store_list_columns(tmp_path):
+    df = pd.DataFrame({'timestamp': [0.1], 'box': [[[1, 2, 3, 4], [5, 6, 7, 8]]]})
+    
+    store.save_table(df, tmp_path / 'data.parquet', 'data')
+    loaded = store.load_table(tmp_path / 'data.parquet', 'data')
+    
+    assert [list(b) for b in loaded.box[0]] == [[1, 2, 3, 4], [5, 6, 7, 8]]
+    
+def test_results_roundtrip(tmp_path, tiny_net, make_video):
+    video = make_video(tmp_path / 'flight.avi', [0.3, 0.8, 0.6, 0.8])
+    detections = process_video(video, *tiny_net, net_size = (64, 64),
+                               table = 'detections')
+    
+    processor = Maui63DataProcessor('uav.csv', video, *tiny_net,
+                                    output_path = tmp_path / 'highlights')
+    processor.detections = detections
+    processor.data = frame_view(detections)  # list columns, like the merged data
+    processor.save_results(tmp_path / 'results')
+    
+    loaded = Maui63DataProcessor('uav.csv', video, *tiny_net,
+                                 output_path = tmp_path / 'highlights')
+    loaded.load_results(tmp_path / 'results')
+    
+    # the per-frame views are built when they're used
+    assert 'data' not in loaded.__dict__ and 'dnn_df' not in loaded.__dict__
+    
+    pd.testing.assert_frame_equal(loaded.detections, detections)
+    for df in [loaded.data, loaded.dnn_df]:
+        pd.testing.assert_frame_equal(df, processor.data)
+        assert df.to_dict('list') == processor.data.to_dict('list')
+        assert type(df.box[0][0]) is list
+    
+    # saved again before and after it's used
+    for saved in [loaded, processor]:
+        saved.save_results(tmp_path / 'again')
+        again = Maui63DataProcessor('uav.csv', video, *tiny_net,
+                                    output_path = tmp_path / 'highlights')
+        again.load_results(tmp_path / 'again')
+        pd.testing.assert_frame_equal(again.data, processor.data)
+    
+def test_store_checks(tmp_path):
+    df = pd.DataFrame({'timestamp': [0.1]})
+    store.save_table(df, tmp_path / 'data.parquet', 'data')
+    
+    assert store.read_info(tmp_path / 'data.parquet')['schema_version'] == store.SCHEMA_VERSION
+    
+    with pytest.raises(ValueError):
+        store.load_table(tmp_path / 'data.parquet', 'detections')
+        
+    df.to_parquet(tmp_path / 'other.parquet')
+    with pytest.raises(ValueError):
+        store.load_table(tmp_path / 'other.parquet')
+    
+
+if __name__ == '__main__':
+    pytest.main()
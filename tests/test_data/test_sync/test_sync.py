@@ -0,0 +1,71 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from maui63_postprocessing.data.sync import cv_log_start, estimate_media_start
+from maui63_postprocessing.data.cache import ResultCache
+from maui63_postprocessing.videoedit.ffmpeg import run_ffmpeg
+
+
+LOG_START = 1611743465.0
+
+
+def make_cv_lines(seconds = 600, seed = 0):
+    # one line a second, detections now and then
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'datetime_utc': LOG_START + np.arange(seconds, dtype = float),
+                         'num': (rng.random(seconds) < 0.2) * rng.integers(1, 3, seconds)})
+
+def make_video(file, creation_time = None):
+    metadata = ['-metadata', 'creation_time=' + creation_time] \
+        if creation_time is not None else []
+    run_ffmpeg(['-f', 'lavfi', '-i', 'testsrc=size=64x48:rate=10', '-t', '1']
+               + metadata + [str(file)])
+
+
+def test_cv_log_start():
+    lines = make_cv_lines()
+
+    # the media starts 123 s into the log, detections at 10 fps
+    seconds = np.flatnonzero(lines['num'].to_numpy() > 0) - 123
+    seconds = seconds[(seconds >= 0) & (seconds < 300)]
+    detections = pd.DataFrame({'timestamp': (seconds[:, None] + np.arange(0, 1, 0.1)).ravel()})
+
+    assert cv_log_start(lines, detections) == LOG_START + 123
+
+    # nothing to line up with
+    assert cv_log_start(lines) == LOG_START
+
+def test_estimate_media_start(tmp_path):
+    uav_times = LOG_START - 60 + np.arange(3600)
+    lines = make_cv_lines()
+
+    make_video(tmp_path / 'a.mp4', '2021-01-27T10:32:00Z')  # 55 s after the log start
+    make_video(tmp_path / 'b.mp4', '2022-01-01T00:00:00Z')
+
+    assert estimate_media_start(uav_times, tmp_path / 'a.mp4', lines) == (LOG_START, 'cv_log')
+    assert estimate_media_start(uav_times, tmp_path / 'a.mp4') == (LOG_START + 55, 'creation_time')
+    assert estimate_media_start(uav_times, tmp_path / 'a.mp4', lines, method = 'telemetry') \
+        == (LOG_START - 60, 'telemetry')
+
+    # outside of the telemetry
+    with pytest.warns(UserWarning):
+        assert estimate_media_start(uav_times, tmp_path / 'b.mp4') == (LOG_START - 60, 'telemetry')
+
+    with pytest.raises(AssertionError):
+        estimate_media_start(uav_times, method = 'cv_log')
+
+def test_sync_cache(tmp_path):
+    cache = ResultCache(tmp_path)
+
+    assert cache.get_sync('flight') is None
+
+    cache.put_sync('flight', {'media_start_time': LOG_START, 'method': 'cv_log'})
+    assert cache.get_sync('flight') == {'media_start_time': LOG_START, 'method': 'cv_log'}
+
+    # not an inference entry
+    assert cache.entries() == []
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,52 @@
+import pytest
+import numpy as np
+
+from maui63_postprocessing.utils.records import RecordBuilder
+
+
+def test_record_builder():
+    records = RecordBuilder(['timestamp', 'num_objects', 'box'],
+                            dtypes = {'timestamp': float, 'num_objects': int},
+                            capacity = 1)
+    
+    records.append({'timestamp': 0.5, 'num_objects': 2,
+                    'box': [[0, 0, 1, 1], [2, 2, 1, 1]]})
+    records.extend({'timestamp': [1., 1.5], 'num_objects': 1,
+                    'box': [[[0, 0, 1, 1]], [[3, 3, 1, 1]]]})
+    
+    df = records.to_frame()
+    
+    assert len(records) == 3
+    assert list(df.columns) == ['timestamp', 'num_objects', 'box']
+    assert df.timestamp.dtype == np.float64
+    assert df.num_objects.tolist() == [2, 1, 1]
+    assert df.box[0] == [[0, 0, 1, 1], [2, 2, 1, 1]]
+    assert df.box[2] == [[3, 3, 1, 1]]
+    
+def test_record_builder_missing():
+    records = RecordBuilder(['timestamp', 'num_objects', 'filename'],
+                            dtypes = {'timestamp': float, 'num_objects': int})
+    
+    # float and object columns can be left empty
+    records.append({'num_objects': 1})
+    records.extend({'num_objects': [2, 3], 'filename': ['a', 'b']})
+    
+    df = records.to_frame()
+    assert np.isnan(df.timestamp).all()
+    assert df.filename.isna().tolist() == [True, False, False]
+    assert df.filename[1:].tolist() == ['a', 'b']
+    
+    # int columns can't
+    with pytest.raises(ValueError, match = 'num_objects'):
+        records.append({'timestamp': 0.5})
+    with pytest.raises(ValueError, match = 'num_objects'):
+        records.extend({'timestamp': [0.5, 1.]})
+    
+    # every column has the same number of values
+    with pytest.raises(AssertionError):
+        records.extend({'timestamp': [1., 2., 3.], 'num_objects': [5]})
+    assert len(records) == 3
+    
+
+if __name__ == '__main__':
+    pytest.main()